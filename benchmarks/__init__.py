@@ -0,0 +1 @@
+'''Benchmarks of iLEAPP on generated iOS extractions, see run.py'''
@@ -0,0 +1,353 @@
+'''Generates a synthetic iOS full file system extraction for benchmarks.
+
+   The databases have the tables and columns of the real ones that iLEAPP plugins query (not every
+   column Apple has), filled with random but plausible rows, so the plugins run on them the same
+   way they do on real evidence. Everything is made from a seeded random generator, the same
+   scale always gives the same extraction.
+'''
+
+import io
+import os
+import plistlib
+import random
+import sqlite3
+import struct
+import uuid
+import zlib
+
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+from PIL import Image
+
+# Number of items of each kind at scale 1
+DEFAULT_SIZES = {
+    'messages': 10000,  # sms.db messages
+    'events': 20000,  # knowledgeC.db ZOBJECT rows
+    'segb_records': 10000,  # Biome Backlight records
+    'log_lines': 20000,  # mobile_installation.log lines
+    'assets': 200,  # Photos.sqlite assets, with a DCIM file each
+    'files': 20000,  # filler files in app containers
+}
+
+IOS_VERSION = '16.0'
+IOS_BUILD = '20A362'
+
+MAC_EPOCH = datetime(2001, 1, 1)
+START_TIME = 690000000  # seconds since MAC_EPOCH (November 2022)
+TIME_SPAN = 90 * 24 * 3600  # seconds between the first and last generated events
+
+SEGB_RECORDS_PER_FILE = 5000
+
+BUNDLE_IDS = ('com.apple.mobilesafari', 'com.apple.MobileSMS', 'com.apple.Maps', 'com.apple.camera',
+              'com.burbn.instagram', 'net.whatsapp.WhatsApp', 'com.spotify.client', 'com.google.Gmail',
+              'com.facebook.Facebook', 'ph.telegra.Telegraph', 'com.toyopagroup.picaboo', 'com.zhiliaoapp.musically')
+WORDS = ('hey', 'are', 'you', 'coming', 'tonight', 'meet', 'at', 'the', 'station', 'ok', 'see', 'later',
+         'call', 'me', 'when', 'free', 'running', 'late', 'sorry', 'thanks', 'where', 'lunch', 'tomorrow')
+
+
+@lru_cache(maxsize=None)
+def _jpeg():
+    '''Small JPEG written for each photo and picture attachment'''
+    data = io.BytesIO()
+    Image.new('RGB', (16, 16), (40, 120, 200)).save(data, 'JPEG')
+    return data.getvalue()
+
+
+def _mac_time(rng):
+    '''Random time in the generated period, in seconds since MAC_EPOCH'''
+    return START_TIME + rng.random() * TIME_SPAN
+
+
+def _sentence(rng, min_words=2, max_words=12):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words)))
+
+
+def _write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def make_sms_db(root, messages, rng):
+    '''private/var/mobile/Library/SMS/sms.db, with an attachment file for one message in ten'''
+    path = os.path.join(root, 'private/var/mobile/Library/SMS/sms.db')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    db = sqlite3.connect(path)
+    db.executescript('''
+        CREATE TABLE handle (ROWID INTEGER PRIMARY KEY AUTOINCREMENT UNIQUE, id TEXT NOT NULL, country TEXT,
+            service TEXT NOT NULL, uncanonicalized_id TEXT, person_centric_id TEXT, UNIQUE (id, service));
+        CREATE TABLE chat (ROWID INTEGER PRIMARY KEY AUTOINCREMENT, guid TEXT UNIQUE NOT NULL, style INTEGER,
+            state INTEGER, account_id TEXT, properties BLOB, chat_identifier TEXT, service_name TEXT,
+            room_name TEXT, account_login TEXT, is_archived INTEGER DEFAULT 0, last_addressed_handle TEXT,
+            display_name TEXT, group_id TEXT, is_filtered INTEGER DEFAULT 0);
+        CREATE TABLE message (ROWID INTEGER PRIMARY KEY AUTOINCREMENT, guid TEXT UNIQUE NOT NULL, text TEXT,
+            replace INTEGER DEFAULT 0, service_center TEXT, handle_id INTEGER DEFAULT 0, subject TEXT,
+            country TEXT, attributedBody BLOB, version INTEGER DEFAULT 0, type INTEGER DEFAULT 0,
+            service TEXT, account TEXT, account_guid TEXT, error INTEGER DEFAULT 0, date INTEGER,
+            date_read INTEGER, date_delivered INTEGER, is_delivered INTEGER DEFAULT 0,
+            is_finished INTEGER DEFAULT 0, is_emote INTEGER DEFAULT 0, is_from_me INTEGER DEFAULT 0,
+            is_empty INTEGER DEFAULT 0, is_delayed INTEGER DEFAULT 0, is_auto_reply INTEGER DEFAULT 0,
+            is_prepared INTEGER DEFAULT 0, is_read INTEGER DEFAULT 0, is_system_message INTEGER DEFAULT 0,
+            is_sent INTEGER DEFAULT 0, has_dd_results INTEGER DEFAULT 0, cache_has_attachments INTEGER DEFAULT 0,
+            cache_roomnames TEXT, was_data_detected INTEGER DEFAULT 0, was_deduplicated INTEGER DEFAULT 0);
+        CREATE TABLE attachment (ROWID INTEGER PRIMARY KEY AUTOINCREMENT, guid TEXT UNIQUE NOT NULL,
+            created_date INTEGER DEFAULT 0, start_date INTEGER DEFAULT 0, filename TEXT, uti TEXT,
+            mime_type TEXT, transfer_state INTEGER DEFAULT 0, is_outgoing INTEGER DEFAULT 0,
+            user_info BLOB, transfer_name TEXT, total_bytes INTEGER DEFAULT 0, is_sticker INTEGER DEFAULT 0,
+            sticker_user_info BLOB, attribution_info BLOB, hide_attachment INTEGER DEFAULT 0);
+        CREATE TABLE chat_handle_join (chat_id INTEGER REFERENCES chat (ROWID) ON DELETE CASCADE,
+            handle_id INTEGER REFERENCES handle (ROWID) ON DELETE CASCADE, UNIQUE(chat_id, handle_id));
+        CREATE TABLE chat_message_join (chat_id INTEGER REFERENCES chat (ROWID) ON DELETE CASCADE,
+            message_id INTEGER REFERENCES message (ROWID) ON DELETE CASCADE, message_date INTEGER DEFAULT 0,
+            PRIMARY KEY (chat_id, message_id));
+        CREATE TABLE message_attachment_join (message_id INTEGER REFERENCES message (ROWID) ON DELETE CASCADE,
+            attachment_id INTEGER REFERENCES attachment (ROWID) ON DELETE CASCADE,
+            UNIQUE(message_id, attachment_id));
+    ''')
+
+    contacts = max(1, messages // 200)
+    for handle_id in range(1, contacts + 1):
+        number = f'+1555{rng.randint(1000000, 9999999)}'
+        service = rng.choice(('iMessage', 'SMS'))
+        db.execute("INSERT INTO handle(ROWID, id, country, service, uncanonicalized_id) VALUES(?,?,?,?,?)",
+                   (handle_id, number, 'us', service, number))
+        db.execute("INSERT INTO chat(ROWID, guid, style, state, chat_identifier, service_name, account_login) "
+                   "VALUES(?,?,?,?,?,?,?)",
+                   (handle_id, f'{service};-;{number}', 45, 3, number, service, 'E:owner@icloud.com'))
+        db.execute("INSERT INTO chat_handle_join VALUES(?,?)", (handle_id, handle_id))
+
+    attachment_id = 0
+    for message_id in range(1, messages + 1):
+        handle_id = rng.randint(1, contacts)
+        date = int(_mac_time(rng) * 1000000000)
+        is_from_me = rng.randint(0, 1)
+        has_attachment = message_id % 10 == 0
+        db.execute(
+            "INSERT INTO message(ROWID, guid, text, handle_id, service, account, date, date_read, date_delivered, "
+            "is_delivered, is_finished, is_from_me, is_read, is_sent, cache_has_attachments) "
+            "VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)",
+            (message_id, str(uuid.UUID(int=rng.getrandbits(128))).upper(),
+             '￼' if has_attachment else _sentence(rng), handle_id, 'iMessage', 'E:owner@icloud.com', date,
+             date + 60000000000, date + 1000000000, 1, 1, is_from_me, 1 - is_from_me, is_from_me,
+             int(has_attachment)))
+        db.execute("INSERT INTO chat_message_join VALUES(?,?,?)", (handle_id, message_id, date))
+        if has_attachment:
+            attachment_id += 1
+            guid = str(uuid.UUID(int=rng.getrandbits(128))).upper()
+            name = f'IMG_{attachment_id:04}.jpeg'
+            relative_path = f'Library/SMS/Attachments/{guid[:2].lower()}/{attachment_id % 16:02}/{guid}/{name}'
+            db.execute("INSERT INTO attachment(ROWID, guid, created_date, filename, uti, mime_type, transfer_state, "
+                       "is_outgoing, transfer_name, total_bytes) VALUES(?,?,?,?,?,?,?,?,?,?)",
+                       (attachment_id, guid, date, f'~/{relative_path}', 'public.jpeg', 'image/jpeg',
+                        5, is_from_me, name, len(_jpeg())))
+            db.execute("INSERT INTO message_attachment_join VALUES(?,?)", (message_id, attachment_id))
+            _write_file(os.path.join(root, 'private/var/mobile', relative_path), _jpeg())
+    db.commit()
+    db.close()
+
+
+def make_knowledgec_db(root, events, rng):
+    '''private/var/mobile/Library/CoreDuet/Knowledge/knowledgeC.db, with battery, plugged in, now playing,
+       app in focus and app usage streams'''
+    path = os.path.join(root, 'private/var/mobile/Library/CoreDuet/Knowledge/knowledgeC.db')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    db = sqlite3.connect(path)
+    db.executescript('''
+        CREATE TABLE ZOBJECT (Z_PK INTEGER PRIMARY KEY, Z_ENT INTEGER, Z_OPT INTEGER, ZUUIDHASH INTEGER,
+            ZEVENT INTEGER, ZSOURCE INTEGER, ZCATEGORYTYPE INTEGER, ZINTEGERVALUE INTEGER,
+            ZENDDAYOFWEEK INTEGER, ZENDSECONDOFDAY INTEGER, ZHASCUSTOMMETADATA INTEGER,
+            ZHASSTRUCTUREDMETADATA INTEGER, ZSECONDSFROMGMT INTEGER, ZSHOULDSYNC INTEGER,
+            ZSTARTDAYOFWEEK INTEGER, ZSTARTSECONDOFDAY INTEGER, ZVALUECLASS INTEGER, ZVALUEINTEGER INTEGER,
+            ZVALUETYPECODE INTEGER, ZSTRUCTUREDMETADATA INTEGER, ZVALUE INTEGER, ZCREATIONDATE TIMESTAMP,
+            ZLOCALCREATIONDATE TIMESTAMP, ZENDDATE TIMESTAMP, ZSTARTDATE TIMESTAMP, ZCONFIDENCE FLOAT,
+            ZDOUBLEVALUE FLOAT, ZVALUEDOUBLE FLOAT, ZSTREAMNAME VARCHAR, ZUUID BLOB, ZVALUESTRING VARCHAR,
+            ZMETADATA BLOB);
+        CREATE INDEX ZOBJECT_ZSTREAMNAME_INDEX ON ZOBJECT (ZSTREAMNAME);
+        CREATE TABLE ZSTRUCTUREDMETADATA (Z_PK INTEGER PRIMARY KEY, Z_ENT INTEGER, Z_OPT INTEGER,
+            Z_DKDEVICEISPLUGGEDINMETADATAKEY__ADAPTERISWIRELESS INTEGER,
+            Z_DKNOWPLAYINGMETADATAKEY__PLAYING INTEGER, Z_DKNOWPLAYINGMETADATAKEY__ISAIRPLAYVIDEO INTEGER,
+            Z_DKNOWPLAYINGMETADATAKEY__DURATION FLOAT, Z_DKNOWPLAYINGMETADATAKEY__ELAPSED FLOAT,
+            Z_DKNOWPLAYINGMETADATAKEY__ALBUM VARCHAR, Z_DKNOWPLAYINGMETADATAKEY__ARTIST VARCHAR,
+            Z_DKNOWPLAYINGMETADATAKEY__GENRE VARCHAR, Z_DKNOWPLAYINGMETADATAKEY__TITLE VARCHAR,
+            Z_DKNOWPLAYINGMETADATAKEY__OUTPUTDEVICEIDS BLOB);
+        CREATE TABLE ZSOURCE (Z_PK INTEGER PRIMARY KEY, Z_ENT INTEGER, Z_OPT INTEGER, ZUSERID INTEGER,
+            ZBUNDLEID VARCHAR, ZDEVICEID VARCHAR, ZGROUPID VARCHAR, ZITEMID VARCHAR, ZSOURCEID VARCHAR);
+    ''')
+    db.executemany("INSERT INTO ZSOURCE(Z_PK, Z_ENT, Z_OPT, ZBUNDLEID) VALUES(?,?,?,?)",
+                   ((index, 6, 1, bundle_id) for index, bundle_id in enumerate(BUNDLE_IDS, 1)))
+
+    streams = ('/device/batteryPercentage', '/device/isPluggedIn', '/media/nowPlaying', '/app/inFocus',
+               '/app/usage')
+    metadata_id = 0
+    for object_id in range(1, events + 1):
+        stream = streams[object_id % len(streams)]
+        start = _mac_time(rng)
+        end = start + rng.randint(1, 3600)
+        value_integer = value_string = None
+        has_metadata = 0
+        if stream == '/device/batteryPercentage':
+            value_integer = rng.randint(1, 100)
+        elif stream == '/device/isPluggedIn':
+            value_integer = rng.randint(0, 1)
+        else:
+            value_string = rng.choice(BUNDLE_IDS)
+        if stream in ('/device/isPluggedIn', '/media/nowPlaying'):
+            metadata_id += 1
+            has_metadata = 1
+            if stream == '/device/isPluggedIn':
+                db.execute("INSERT INTO ZSTRUCTUREDMETADATA(Z_PK, Z_ENT, Z_OPT, "
+                           "Z_DKDEVICEISPLUGGEDINMETADATAKEY__ADAPTERISWIRELESS) VALUES(?,?,?,?)",
+                           (metadata_id, 9, 1, rng.randint(0, 1)))
+            else:
+                db.execute("INSERT INTO ZSTRUCTUREDMETADATA(Z_PK, Z_ENT, Z_OPT, Z_DKNOWPLAYINGMETADATAKEY__PLAYING, "
+                           "Z_DKNOWPLAYINGMETADATAKEY__ISAIRPLAYVIDEO, Z_DKNOWPLAYINGMETADATAKEY__DURATION, "
+                           "Z_DKNOWPLAYINGMETADATAKEY__ALBUM, Z_DKNOWPLAYINGMETADATAKEY__ARTIST, "
+                           "Z_DKNOWPLAYINGMETADATAKEY__GENRE, Z_DKNOWPLAYINGMETADATAKEY__TITLE) "
+                           "VALUES(?,?,?,?,?,?,?,?,?,?)",
+                           (metadata_id, 9, 1, rng.randint(0, 4), 0, rng.randint(60, 600),
+                            _sentence(rng, 1, 3).title(), _sentence(rng, 1, 2).title(), 'Pop',
+                            _sentence(rng, 1, 4).title()))
+        db.execute("INSERT INTO ZOBJECT(Z_PK, Z_ENT, Z_OPT, ZSOURCE, ZHASSTRUCTUREDMETADATA, ZSTRUCTUREDMETADATA, "
+                   "ZSECONDSFROMGMT, ZVALUEINTEGER, ZCREATIONDATE, ZENDDATE, ZSTARTDATE, ZSTREAMNAME, ZUUID, "
+                   "ZVALUESTRING) VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?)",
+                   (object_id, 11, 1, rng.randint(1, len(BUNDLE_IDS)), has_metadata,
+                    metadata_id if has_metadata else None, 0, value_integer, end + 1, end, start, stream,
+                    uuid.UUID(int=rng.getrandbits(128)).bytes, value_string))
+    db.commit()
+    db.close()
+
+
+def _segb_record(timestamp, state):
+    '''Protobuf message with a double (field 1) and a varint (field 2), as Backlight records are'''
+    return b'\x09' + struct.pack('<d', timestamp) + b'\x10' + bytes((state,))
+
+
+def make_biome_segb(root, records, rng):
+    '''Biome Backlight stream files (SEGB version 1) under private/var/mobile/Library/Biome/streams'''
+    folder = os.path.join(root, 'private/var/mobile/Library/Biome/streams/public/Backlight/local')
+    os.makedirs(folder, exist_ok=True)
+    timestamps = sorted(_mac_time(rng) for _ in range(records))
+    for first in range(0, records, SEGB_RECORDS_PER_FILE):
+        data = io.BytesIO()
+        data.write(b'\0' * 52 + b'SEGB')  # header, the format signature is at its end
+        for timestamp in timestamps[first:first + SEGB_RECORDS_PER_FILE]:
+            payload = _segb_record(timestamp, rng.randint(0, 1))
+            # length, state, creation and modification times, crc and an unknown field
+            data.write(struct.pack('<iiddII', len(payload), 1, timestamp, timestamp, zlib.crc32(payload), 0))
+            data.write(payload)
+            data.write(b'\0' * (-len(payload) % 8))  # records are 8 bytes aligned
+        # the Biome stream files are named after the time of their first record, in microseconds
+        _write_file(os.path.join(folder, str(int(timestamps[first] * 1000000))), data.getvalue())
+
+
+def _log_time(rng):
+    moment = MAC_EPOCH + timedelta(seconds=_mac_time(rng))
+    return f'{moment:%a %b} {moment.day:2} {moment:%H:%M:%S %Y}'
+
+
+def make_mobile_installation_logs(root, lines, rng):
+    '''Two mobile_installation.log files in private/var/installd/Library/Logs/MobileInstallation'''
+    folder = os.path.join(root, 'private/var/installd/Library/Logs/MobileInstallation')
+    for log_index in range(2):
+        text = []
+        for _ in range(lines // 2):
+            time = _log_time(rng)
+            pid = rng.randint(100, 999)
+            bundle_id = rng.choice(BUNDLE_IDS)
+            kind = rng.randint(0, 9)
+            if kind == 0:
+                text.append(f'{time} [{pid}] <notice> (0x16b0f3000) -[MIInstaller performInstallationWithError:]: '
+                            f'Install Successful for (Placeholder:{bundle_id})')
+            elif kind == 1:
+                container = str(uuid.UUID(int=rng.getrandbits(128))).upper()
+                text.append(f'{time} [{pid}] <notice> (0x16b0f3000) -[MIContainer _destroyContainer]: Destroying '
+                            f'container with identifier {bundle_id} at '
+                            f'/private/var/mobile/Containers/Data/Application/{container}')
+            elif kind == 2:
+                text.append(f'{time} [{pid}] <notice> (0x1f3c2e000) main: Reboot detected')
+            else:
+                text.append(f'{time} [{pid}] <notice> (0x16b0f3000) -[MILaunchServicesDatabaseGatherer '
+                            f'enumerateAppsWithBlock:]: Found {bundle_id} {_sentence(rng, 1, 4)}')
+        _write_file(os.path.join(folder, f'mobile_installation.log.{log_index}'),
+                    ('\n'.join(text) + '\n').encode('utf8'))
+
+
+def make_photos_db(root, assets, rng):
+    '''private/var/mobile/Media/PhotoData/Photos.sqlite, with a JPEG in Media/DCIM for each asset'''
+    path = os.path.join(root, 'private/var/mobile/Media/PhotoData/Photos.sqlite')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    db = sqlite3.connect(path)
+    db.executescript('''
+        CREATE TABLE ZASSET (Z_PK INTEGER PRIMARY KEY, Z_ENT INTEGER, Z_OPT INTEGER, ZKIND INTEGER,
+            ZKINDSUBTYPE INTEGER, ZHIDDEN INTEGER, ZFAVORITE INTEGER, ZTRASHEDSTATE INTEGER, ZHEIGHT INTEGER,
+            ZWIDTH INTEGER, ZORIENTATION INTEGER, ZADDITIONALATTRIBUTES INTEGER, ZADDEDDATE TIMESTAMP,
+            ZDATECREATED TIMESTAMP, ZMODIFICATIONDATE TIMESTAMP, ZTRASHEDDATE TIMESTAMP, ZLATITUDE FLOAT,
+            ZLONGITUDE FLOAT, ZDIRECTORY VARCHAR, ZFILENAME VARCHAR, ZUNIFORMTYPEIDENTIFIER VARCHAR,
+            ZUUID VARCHAR);
+        CREATE TABLE ZADDITIONALASSETATTRIBUTES (Z_PK INTEGER PRIMARY KEY, Z_ENT INTEGER, Z_OPT INTEGER,
+            ZASSET INTEGER, ZORIGINALFILESIZE INTEGER, ZORIGINALHEIGHT INTEGER, ZORIGINALWIDTH INTEGER,
+            ZTIMEZONEOFFSET INTEGER, ZEXIFTIMESTAMPSTRING VARCHAR, ZORIGINALFILENAME VARCHAR,
+            ZTIMEZONENAME VARCHAR);
+        CREATE TABLE ZMIGRATIONHISTORY (Z_PK INTEGER PRIMARY KEY, Z_ENT INTEGER, Z_OPT INTEGER,
+            ZFORCEREBUILDREASON INTEGER, ZINDEX INTEGER, ZMIGRATIONTYPE INTEGER, ZMODELVERSION INTEGER,
+            ZSOURCEMODELVERSION INTEGER, ZMIGRATIONDATE TIMESTAMP, ZORIGIN INTEGER, ZOSVERSION VARCHAR,
+            ZSTOREUUID VARCHAR, ZGLOBALKEYVALUES BLOB);
+    ''')
+    store_uuid = str(uuid.UUID(int=rng.getrandbits(128))).upper()
+    db.execute("INSERT INTO ZMIGRATIONHISTORY(Z_PK, Z_ENT, Z_OPT, ZFORCEREBUILDREASON, ZINDEX, ZMIGRATIONTYPE, "
+               "ZMODELVERSION, ZSOURCEMODELVERSION, ZMIGRATIONDATE, ZORIGIN, ZOSVERSION, ZSTOREUUID) "
+               "VALUES(?,?,?,?,?,?,?,?,?,?,?,?)",
+               (1, 44, 1, 0, 0, 3, 15331, 0, START_TIME, 0, IOS_BUILD, store_uuid))
+
+    for asset_id in range(1, assets + 1):
+        folder = f'DCIM/{100 + (asset_id - 1) // 1000}APPLE'
+        file_name = f'IMG_{asset_id:04}.JPG'
+        created = _mac_time(rng)
+        db.execute("INSERT INTO ZASSET(Z_PK, Z_ENT, Z_OPT, ZKIND, ZKINDSUBTYPE, ZHIDDEN, ZFAVORITE, ZTRASHEDSTATE, "
+                   "ZHEIGHT, ZWIDTH, ZORIENTATION, ZADDITIONALATTRIBUTES, ZADDEDDATE, ZDATECREATED, "
+                   "ZMODIFICATIONDATE, ZLATITUDE, ZLONGITUDE, ZDIRECTORY, ZFILENAME, ZUNIFORMTYPEIDENTIFIER, ZUUID) "
+                   "VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)",
+                   (asset_id, 3, 1, 0, 0, 0, 0, 0, 1, 1, 1, asset_id, created + 5, created, created + 10,
+                    rng.uniform(25, 48), rng.uniform(-124, -70), folder, file_name, 'public.jpeg',
+                    str(uuid.UUID(int=rng.getrandbits(128))).upper()))
+        db.execute("INSERT INTO ZADDITIONALASSETATTRIBUTES(Z_PK, Z_ENT, Z_OPT, ZASSET, ZORIGINALFILESIZE, "
+                   "ZORIGINALHEIGHT, ZORIGINALWIDTH, ZTIMEZONEOFFSET, ZORIGINALFILENAME, ZTIMEZONENAME) "
+                   "VALUES(?,?,?,?,?,?,?,?,?,?)",
+                   (asset_id, 1, 1, asset_id, len(_jpeg()), 1, 1, 0, file_name, 'GMT'))
+        _write_file(os.path.join(root, 'private/var/mobile/Media', folder, file_name), _jpeg())
+    db.commit()
+    db.close()
+
+
+def make_last_build_info(root):
+    '''LastBuildInfo.plist, which gives the iOS version to the plugins that need it'''
+    _write_file(os.path.join(root, 'private/var/installd/Library/MobileSoftwareUpdate/LastBuildInfo.plist'),
+                plistlib.dumps({'ProductName': 'iPhone OS', 'ProductVersion': IOS_VERSION,
+                                'ProductBuildVersion': IOS_BUILD}))
+
+
+def make_file_tree(root, files, rng):
+    '''Small files spread over app container folders, as most of an extraction is files no plugin wants'''
+    applications = max(1, files // 500)
+    containers = [str(uuid.UUID(int=rng.getrandbits(128))).upper() for _ in range(applications)]
+    subfolders = ('Documents', 'Library/Caches', 'Library/Preferences', 'tmp', 'Library/Application Support/data')
+    for index in range(files):
+        folder = os.path.join(root, 'private/var/mobile/Containers/Data/Application', rng.choice(containers),
+                              rng.choice(subfolders))
+        _write_file(os.path.join(folder, f'file_{index:06}.dat'), rng.randbytes(rng.randint(0, 256)))
+
+
+def generate_extraction(root, sizes=None, seed=0):
+    '''Writes a synthetic extraction in folder root, sizes having the number of items of each kind
+       (see DEFAULT_SIZES). Returns the sizes used.'''
+    sizes = dict(DEFAULT_SIZES, **(sizes or {}))
+    rng = random.Random(seed)
+    make_last_build_info(root)
+    make_sms_db(root, sizes['messages'], rng)
+    make_knowledgec_db(root, sizes['events'], rng)
+    make_biome_segb(root, sizes['segb_records'], rng)
+    make_mobile_installation_logs(root, sizes['log_lines'], rng)
+    make_photos_db(root, sizes['assets'], rng)
+    make_file_tree(root, sizes['files'], rng)
+    return sizes
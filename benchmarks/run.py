@@ -0,0 +1,252 @@
+'''Times parts of iLEAPP on a synthetic extraction (see fixtures.py) and writes the results as JSON.
+
+   From the repository root:
+       python -m benchmarks.run -o results.json
+       python -m benchmarks.run -o new.json --baseline results.json
+
+   Each benchmark runs --repeat times, the JSON has all the times along with their minimum and
+   median, and the commit they were measured on, so results of different commits can be compared.
+'''
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import plugin_loader
+import scripts.report as report
+
+from benchmarks.fixtures import DEFAULT_SIZES, generate_extraction
+from ileapp import crunch_artifacts
+from scripts.artifact_report import ArtifactHtmlReport
+from scripts.ilapfuncs import OutputParameters, TimelineWriter, timeline, tsv
+from scripts.search_files import FileSeekerDir
+
+RESULTS_VERSION = 1
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# plugins run end to end, lastbuild gives them the iOS version. sms is left out, it fails on the messages
+# without attachments with pandas 3, whose missing strings are NaN rather than None
+DEFAULT_PLUGINS = ('lastbuild', 'knowledgeC', 'biomeBacklight', 'mobileInstall', 'photosMigration',
+                   'photosDbexif')
+
+TABLE_HEADERS = ('Timestamp', 'Event', 'Bundle ID', 'Value', 'Count', 'Duration', 'Source', 'Notes')
+
+
+def _table_rows(count):
+    return [(f'2023-01-{day % 28 + 1:02} 10:{day % 60:02}:00', f'Event {index}', f'com.example.app{index % 50}',
+             index * 3, index % 7, f'00:0{index % 10}:00', 'knowledgeC.db', 'a note with <html> & "quotes"')
+            for index, day in ((index, index // 1000) for index in range(count))]
+
+
+def _new_output(work_folder, name):
+    '''Report folder as ileapp makes it, in a folder of its own since their names only change every second'''
+    output_folder = os.path.join(work_folder, name)
+    os.makedirs(output_folder)
+    return OutputParameters(output_folder)
+
+
+def bench_seeker(extraction, patterns, times):
+    start = time.perf_counter()
+    seeker = FileSeekerDir(extraction)
+    times['seeker.build'].append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    seeker.build_search_cache(patterns)
+    times['seeker.build_search_cache'].append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for pattern in patterns:
+        seeker.search(pattern)
+    times['seeker.search'].append(time.perf_counter() - start)
+
+
+def bench_writers(work_folder, run, rows, reports, times):
+    out_params = _new_output(work_folder, f'writers_{run}')
+    category_folder = os.path.join(out_params.report_folder_base, 'Benchmark')
+    os.mkdir(category_folder)
+    data_list = _table_rows(rows)
+
+    start = time.perf_counter()
+    artifact_report = ArtifactHtmlReport('Benchmark table')
+    artifact_report.start_artifact_report(category_folder, 'Benchmark table')
+    artifact_report.add_script()
+    artifact_report.write_artifact_data_table(TABLE_HEADERS, data_list, 'benchmark')
+    artifact_report.end_artifact_report()
+    times['artifact_report.write_artifact_data_table'].append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    tsv(category_folder, TABLE_HEADERS, data_list, 'Benchmark table')
+    times['ilapfuncs.tsv'].append(time.perf_counter() - start)
+
+    # the rows are written to tl.db by the writer thread, finish() waits for them and indexes the db
+    start = time.perf_counter()
+    timeline(category_folder, 'Benchmark table', data_list, TABLE_HEADERS)
+    TimelineWriter.finish(out_params.report_folder_base)
+    times['ilapfuncs.timeline'].append(time.perf_counter() - start)
+
+    # more, smaller, reports for generate_report to put together
+    small_list = data_list[:max(1, rows // reports)]
+    for index in range(reports):
+        artifact_report = ArtifactHtmlReport(f'Benchmark {index}')
+        artifact_report.start_artifact_report(category_folder, f'Benchmark {index}')
+        artifact_report.add_script()
+        artifact_report.write_artifact_data_table(TABLE_HEADERS, small_list, 'benchmark')
+        artifact_report.end_artifact_report()
+
+    # the logs crunch_artifacts would have written, which go in index.html
+    for log_name in ('Screen Output.html', 'DeviceInfo.html', 'ProcessedFilesLog.html', report.PROCESSED_FILES_NAME):
+        open(os.path.join(out_params.report_folder_base, 'Script Logs', log_name), 'a', encoding='utf8').close()
+    start = time.perf_counter()
+    report.generate_report(out_params.report_folder_base, 0, '00:00:00', 'fs', 'benchmark', {})
+    times['report.generate_report'].append(time.perf_counter() - start)
+
+
+def bench_plugins(work_folder, run, extraction, plugins, loader, times):
+    out_params = _new_output(work_folder, f'plugins_{run}')
+    start = time.perf_counter()
+    crunch_artifacts(plugins, 'fs', extraction, out_params, 1, True, loader, {}, 'UTC')
+    times['crunch_artifacts'].append(time.perf_counter() - start)
+
+    metrics_path = os.path.join(out_params.report_folder_base, 'Script Logs', 'run_metrics.json')
+    with open(metrics_path, 'r', encoding='utf8') as f:
+        for metrics in json.load(f)['plugins']:
+            times[f'plugin.{metrics["name"]}'].append(metrics['wall_time'])
+            if metrics['status'] != 'ok':
+                print(f'{metrics["name"]} did not complete: {metrics["status"]} {metrics["error"] or ""}',
+                      file=sys.stderr)
+
+
+def get_commit():
+    '''Returns (commit hash, whether the tree has changes), or (None, None) outside of a git checkout'''
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_ROOT,
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+
+def summarize(times):
+    return {name: {'times': values, 'min': min(values), 'median': statistics.median(values)}
+            for name, values in times.items() if values}
+
+
+def print_results(results, baseline=None):
+    baseline_results = baseline['results'] if baseline else {}
+    print(f'{"benchmark":48} {"median (s)":>12} {"min (s)":>10}' + (f' {"baseline (s)":>13} {"change":>8}'
+                                                                     if baseline else ''))
+    for name, result in results.items():
+        line = f'{name:48} {result["median"]:12.4f} {result["min"]:10.4f}'
+        if name in baseline_results:
+            old = baseline_results[name]['median']
+            change = f'{(result["median"] - old) / old * 100:+.1f}%' if old else ''
+            line += f' {old:13.4f} {change:>8}'
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='iLEAPP benchmarks on a synthetic iOS extraction.')
+    parser.add_argument('-o', '--output', required=False, action="store",
+                        help='JSON file to write the results to')
+    parser.add_argument('--scale', required=False, action="store", default=1.0, type=float,
+                        help='Multiplies the number of messages, events, files etc of the extraction (default 1)')
+    parser.add_argument('--repeat', required=False, action="store", default=3, type=int,
+                        help='Number of times each benchmark runs (default 3)')
+    parser.add_argument('--rows', required=False, action="store", default=50000, type=int,
+                        help='Number of rows written by the report, TSV and timeline benchmarks (default 50000)')
+    parser.add_argument('--reports', required=False, action="store", default=50, type=int,
+                        help='Number of artifact reports put together by the generate_report benchmark (default 50)')
+    parser.add_argument('--plugins', required=False, action="store", nargs='+', default=list(DEFAULT_PLUGINS),
+                        help='Names of the plugins run end to end (default: %(default)s)')
+    parser.add_argument('--extraction', required=False, action="store",
+                        help=('Folder of the synthetic extraction. Generated if it doesn\'t exist, kept and reused '
+                              'otherwise (default: a temporary folder)'))
+    parser.add_argument('--baseline', required=False, action="store",
+                        help='JSON file of earlier results to compare with')
+    args = parser.parse_args()
+
+    loader = plugin_loader.PluginLoader()
+    unknown = [name for name in args.plugins if name not in loader]
+    if unknown:
+        parser.error('Unknown plugins: ' + ', '.join(unknown))
+    plugins = [loader[name] for name in args.plugins]
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf8') as f:
+            baseline = json.load(f)
+
+    work_folder = tempfile.mkdtemp(prefix='ileapp_bench_')
+    try:
+        extraction = args.extraction or os.path.join(work_folder, 'extraction')
+        sizes = {kind: max(1, int(count * args.scale)) for kind, count in DEFAULT_SIZES.items()}
+        sizes_path = os.path.join(extraction, 'benchmark_sizes.json')
+        generation_time = None
+        if not os.path.exists(sizes_path):
+            print(f'Generating the extraction in {extraction}')
+            start = time.perf_counter()
+            generate_extraction(extraction, sizes)
+            generation_time = time.perf_counter() - start
+            with open(sizes_path, 'w', encoding='utf8') as f:
+                json.dump(sizes, f)
+        else:
+            with open(sizes_path, 'r', encoding='utf8') as f:
+                sizes = json.load(f)
+
+        patterns = [pattern for plugin in loader.plugins for pattern in plugin.search_patterns]
+        times = {name: [] for name in (
+            'seeker.build', 'seeker.build_search_cache', 'seeker.search',
+            'artifact_report.write_artifact_data_table', 'ilapfuncs.tsv', 'ilapfuncs.timeline',
+            'report.generate_report', 'crunch_artifacts')}
+        times.update((f'plugin.{plugin.name}', []) for plugin in plugins)
+
+        for run in range(args.repeat):
+            print(f'Run {run + 1} of {args.repeat}')
+            # ileapp prints its log, which would drown the results
+            with contextlib.redirect_stdout(io.StringIO()):
+                # the seeker logs to the report folder of the current OutputParameters
+                _new_output(work_folder, f'seeker_{run}')
+                bench_seeker(extraction, patterns, times)
+                bench_writers(work_folder, run, args.rows, args.reports, times)
+                bench_plugins(work_folder, run, extraction, plugins, loader, times)
+    finally:
+        shutil.rmtree(work_folder, ignore_errors=True)
+
+    commit, dirty = get_commit()
+    results = {
+        'version': RESULTS_VERSION,
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'dirty': dirty,
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'scale': args.scale,
+        'sizes': sizes,
+        'rows': args.rows,
+        'reports': args.reports,
+        'repeat': args.repeat,
+        'generation_time': generation_time,
+        'results': summarize(times),
+    }
+    print_results(results['results'], baseline)
+    if args.output:
+        with open(args.output, 'w', encoding='utf8') as f:
+            json.dump(results, f, indent=1)
+        print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
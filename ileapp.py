@@ -1,17 +1,26 @@
 import argparse
+import contextlib
+import html
 import io
+import json
+import multiprocessing
 import pytz
 import os.path
 import typing
 import plugin_loader
 import scripts.report as report
 import traceback
+from scripts.extraction_store import ExtractionStore
+from scripts.listing_cache import ListingCache, LISTING_CACHE_FILE_NAME
+from scripts.plugin_runner import PluginPool, longest_first, order_by_dependencies, plugin_metrics, run_plugin, \
+    select_within_budget
+from scripts.runtime_history import RuntimeHistory, default_history_path
 from scripts.search_files import *
 from scripts.ilapfuncs import *
 from scripts.version_info import aleapp_version
 from time import process_time, gmtime, strftime, perf_counter
 
-def validate_args(args):
+def validate_args(args, loader=None):
     if args.artifact_paths:
         return  # Skip further validation if --artifact_paths is used
 
@@ -33,6 +42,35 @@ def validate_args(args):
         timezone = pytz.timezone(args.timezone)
     except pytz.UnknownTimeZoneError:
       raise argparse.ArgumentError(None, 'Unknown timezone! Run the program again.')
+
+    if args.workers < 1:
+        raise argparse.ArgumentError(None, 'WORKERS must be 1 or more. Run the program again.')
+
+    if args.walk_threads < 1:
+        raise argparse.ArgumentError(None, 'WALK_THREADS must be 1 or more. Run the program again.')
+
+    if args.extraction_cache_size <= 0:
+        raise argparse.ArgumentError(None, 'EXTRACTION_CACHE_SIZE must be more than 0. Run the program again.')
+
+    if args.plugin_timeout is not None and args.plugin_timeout <= 0:
+        raise argparse.ArgumentError(None, 'PLUGIN_TIMEOUT must be more than 0. Run the program again.')
+
+    if args.plugin_memory_limit is not None and args.plugin_memory_limit <= 0:
+        raise argparse.ArgumentError(None, 'PLUGIN_MEMORY_LIMIT must be more than 0. Run the program again.')
+
+    if args.time_budget is not None and args.time_budget <= 0:
+        raise argparse.ArgumentError(None, 'TIME_BUDGET must be more than 0. Run the program again.')
+
+    if loader and args.plugins:
+        unknown = [name for name in args.plugins if name not in loader]
+        if unknown:
+            raise argparse.ArgumentError(None, f'Unknown PLUGINS {", ".join(unknown)}. Run the program again.')
+
+    if loader and args.categories:
+        categories = {plugin.category.lower() for plugin in loader.plugins}
+        unknown = [category for category in args.categories if category.lower() not in categories]
+        if unknown:
+            raise argparse.ArgumentError(None, f'Unknown CATEGORIES {", ".join(unknown)}. Run the program again.')
         
 
 def main():
@@ -51,6 +89,55 @@ def main():
     parser.add_argument('-p', '--artifact_paths', required=False, action="store_true",
                         help=("Generate a text file list of artifact paths. "
                               "This argument is meant to be used alone, without any other arguments."))
+    parser.add_argument('--workers', required=False, action="store", default=1, type=int,
+                        help="Number of worker processes to run plugins in parallel (default is 1, no parallelism)")
+    parser.add_argument('--plugin_timeout', required=False, action="store", type=float,
+                        help=("Seconds a plugin may run for. Plugins then run in worker processes (even with "
+                              "--workers 1), and one that runs longer is killed and reported as failed"))
+    parser.add_argument('--plugin_memory_limit', required=False, action="store", type=float,
+                        help=("Memory in MB a plugin's worker process may use. Plugins then run in worker "
+                              "processes (even with --workers 1), and one that uses more is killed and reported "
+                              "as failed"))
+    parser.add_argument('--plugins', required=False, action="store", nargs='+',
+                        help=("Names of the plugins to run, instead of all of them. Only the files these plugins "
+                              "look for are listed and extracted, which makes for a quicker triage. Plugins that "
+                              "search for files they don't declare may find fewer"))
+    parser.add_argument('--categories', required=False, action="store", nargs='+',
+                        help=("Categories of the plugins to run (eg: \"SMS & iMessage\"), instead of all of them. "
+                              "Can be combined with --plugins"))
+    parser.add_argument('--time_budget', required=False, action="store", type=float,
+                        help=("Seconds plugins may take in all. Only the plugins expected to report the most per "
+                              "second of run time that fit are run, the others are listed as skipped"))
+    parser.add_argument('--runtime_history', required=False, action="store", default=default_history_path(),
+                        help=("SQLite file the run times of plugins are kept in, to estimate them on later runs "
+                              "(default is %(default)s)"))
+    parser.add_argument('--no_runtime_history', required=False, action="store_true",
+                        help="Do not read or save plugin run times, estimates then come from the size of their files")
+    parser.add_argument('--listing_cache', required=False, action="store_true",
+                        help=("Save the files listing of an 'fs' extraction, or the members and gzip index of "
+                              "a 'tar' or 'gz' input, in the output folder and reuse it on later runs over the "
+                              "same extraction"))
+    parser.add_argument('--rebuild_listing', required=False, action="store_true",
+                        help="Walk the extraction again even if a saved files listing exists (with --listing_cache)")
+    parser.add_argument('--walk_threads', required=False, action="store", default=1, type=int,
+                        help=("Number of folders of an 'fs' extraction to read at the same time while building "
+                              "the files listing, useful on network file systems (default is 1)"))
+    parser.add_argument('--itunes_link_mode', required=False, action="store", default='copy',
+                        choices=FileSeekerItunes.LINK_MODES,
+                        help=("How files of an 'itunes' backup are made available to plugins: 'copy' (default), "
+                              "or a 'reflink', 'hardlink' or 'symlink' to the backup file to save disk space and "
+                              "I/O, or 'auto' for the first of these links the file system allows. Plugins that "
+                              "write to their files always get copies"))
+    parser.add_argument('--extraction_cache', required=False, action="store",
+                        help=("Folder to keep files extracted from 'tar', 'gz' and 'zip' inputs (and copied from "
+                              "'itunes' backups) in, so later runs over the same input hardlink them from there "
+                              "instead of extracting them again. Best on the same file system as the output folder"))
+    parser.add_argument('--extraction_cache_size', required=False, action="store", default=50, type=float,
+                        help=("Size in GB the extraction cache is kept under, least recently used files are "
+                              "removed first (default is 50)"))
+    parser.add_argument('--single_pass', required=False, action="store_true",
+                        help=("Read a 'tar' or 'gz' input once from start to end, extracting all the files plugins "
+                              "need up front, instead of looking up each search pattern in the archive"))
 
     loader = plugin_loader.PluginLoader()
 
@@ -59,7 +146,7 @@ def main():
     args = parser.parse_args()
 
     try:
-        validate_args(args)
+        validate_args(args, loader)
     except argparse.ArgumentError as e:
         parser.error(str(e))
 
@@ -92,18 +179,47 @@ def main():
         if output_path[1] == ':': output_path = '\\\\?\\' + output_path.replace('/', '\\')
 
     out_params = OutputParameters(output_path)
+    listing_cache = ListingCache(os.path.join(output_path, LISTING_CACHE_FILE_NAME)) if args.listing_cache else None
+    extraction_store = None
+    if args.extraction_cache:
+        extraction_store = ExtractionStore(os.path.abspath(args.extraction_cache),
+                                           int(args.extraction_cache_size * 1024 ** 3))
 
     try:
         casedata
     except NameError:
         casedata = {}
 
-    crunch_artifacts(list(loader.plugins), extracttype, input_path, out_params, 1, wrap_text, loader, casedata, time_offset)
+    plugins = list(loader.plugins)
+    targeted = bool(args.plugins or args.categories)
+    if targeted:
+        plugins = select_plugins(loader, args.plugins or (), args.categories or ())
+        logfunc(f'Selected {len(plugins)} plugins: ' + ', '.join(plugin.name for plugin in plugins))
+
+    crunch_artifacts(plugins, extracttype, input_path, out_params, 1, wrap_text, loader, casedata, time_offset,
+                     args.workers, listing_cache, args.rebuild_listing, args.walk_threads, args.single_pass,
+                     args.itunes_link_mode, extraction_store, args.plugin_timeout,
+                     int(args.plugin_memory_limit * 1024 ** 2) if args.plugin_memory_limit else None,
+                     None if args.no_runtime_history else RuntimeHistory(os.path.abspath(args.runtime_history)),
+                     args.time_budget, targeted)
+
 
+def select_plugins(loader, names=(), categories=()):
+    '''Returns the plugins named or in one of categories (case insensitive), with lastbuild, as the GUI
+       always runs it, and the plugins providing facts the others require, in the order of loader'''
+    categories = {category.lower() for category in categories}
+    selected = {'lastbuild'} | set(names)
+    selected.update(plugin.name for plugin in loader.plugins if plugin.category.lower() in categories)
+    required = {fact for plugin in loader.plugins if plugin.name in selected for fact in plugin.requires}
+    selected.update(plugin.name for plugin in loader.plugins if required & set(plugin.provides))
+    return [plugin for plugin in loader.plugins if plugin.name in selected]
 
 def crunch_artifacts(
         plugins: typing.Sequence[plugin_loader.PluginSpec], extracttype, input_path, out_params, ratio, wrap_text,
-        loader: plugin_loader.PluginLoader, casedata, time_offset):
+        loader: plugin_loader.PluginLoader, casedata, time_offset, workers=1, listing_cache=None,
+        rebuild_listing=False, walk_threads=1, single_pass=False, itunes_link_mode='copy',
+        extraction_store=None, plugin_timeout=None, plugin_memory_limit=None, runtime_history=None,
+        time_budget=None, targeted=False, io_limit=None):
     start = process_time()
     start_wall = perf_counter()
  
@@ -116,22 +232,31 @@ def crunch_artifacts(
     logfunc('By: Yogesh Khatri   | @SwiftForensics | swiftforensics.com')
     logdevinfo()
     
+    # targeted triage: only the files the plugins look for are listed
+    only_patterns = [pattern for plugin in plugins for pattern in plugin.search_patterns + plugin.extra_paths] \
+        if targeted else ()
+    # listing and extracting the input is I/O bound, batch runs limit how many jobs do it at once
+    io_slot = contextlib.ExitStack()
+    if io_limit is not None:
+        io_slot.enter_context(io_limit)
     seeker = None
     try:
         if extracttype == 'fs':
-            seeker = FileSeekerDir(input_path)
+            seeker = FileSeekerDir(input_path, listing_cache, rebuild_listing, walk_threads, only_patterns)
 
         elif extracttype in ('tar', 'gz'):
-            seeker = FileSeekerTar(input_path, out_params.temp_folder)
+            seeker = FileSeekerTar(input_path, out_params.temp_folder, single_pass, listing_cache, rebuild_listing,
+                                   extraction_store, only_patterns)
 
         elif extracttype == 'zip':
-            seeker = FileSeekerZip(input_path, out_params.temp_folder)
+            seeker = FileSeekerZip(input_path, out_params.temp_folder, extraction_store)
 
         elif extracttype == 'itunes':
-            seeker = FileSeekerItunes(input_path, out_params.temp_folder)
+            seeker = FileSeekerItunes(input_path, out_params.temp_folder, itunes_link_mode, extraction_store)
 
         else:
             logfunc('Error on argument -o (input type)')
+            io_slot.close()
             return False
     except Exception as ex:
         logfunc('Had an exception in Seeker - see details below. Terminating Program!')
@@ -139,8 +264,16 @@ def crunch_artifacts(
         traceback.print_exc(file=temp_file)
         logfunc(temp_file.getvalue())
         temp_file.close()
+        io_slot.close()
         return False
 
+    # Match the patterns of all plugins against the files listing in one pass instead of once per pattern
+    # patterns that no plugin needs extracted files for
+    virtual_patterns = ({pattern for plugin in plugins if plugin.virtual_files for pattern in plugin.search_patterns}
+                        - {pattern for plugin in plugins if not plugin.virtual_files for pattern in plugin.search_patterns})
+    seeker.build_search_cache([pattern for plugin in plugins for pattern in plugin.search_patterns],
+                              [pattern for plugin in plugins for pattern in plugin.extra_paths], virtual_patterns)
+
     # Now ready to run
     logfunc(f'Artifact categories to parse: {str(len(plugins))}')
     logfunc(f'File/Directory selected: {input_path}')
@@ -148,9 +281,20 @@ def crunch_artifacts(
 
     log = open(os.path.join(out_params.report_folder_base, 'Script Logs', 'ProcessedFilesLog.html'), 'w+', encoding='utf8')
     nl = '\n' #literal in order to have new lines in fstrings that create text files
-    log.write(f'Extraction/Path selected: {input_path}<br><br>')
+    log.write(f'Extraction/Path selected: {html.escape(input_path)}<br><br>')
     log.write(f'Timezone selected: {time_offset}<br><br>')
+    # the files found, one {"plugin", "pattern", "path", "size"} line each, shown a page at a time in the report
+    processed_files = open(os.path.join(out_params.report_folder_base, 'Script Logs', report.PROCESSED_FILES_NAME), 'w',
+                           encoding='utf8')
     
+    # plugins that compute facts (eg: iOS version) needed by other plugins run first
+    plugins = order_by_dependencies(plugins)
+    # with limits, even a single worker keeps runaway plugins out of this process
+    pool = PluginPool(workers, seeker, plugin_timeout, plugin_memory_limit) \
+        if workers > 1 or plugin_timeout or plugin_memory_limit else None
+
+    metrics = {}  # plugin name -> metrics, see plugin_runner.run_plugin
+    to_run = {}  # plugin name -> (files found, category folder) of the plugins that found files
     categories_searched = 0
     # Special processing for iTunesBackup Info.plist as it is a seperate entity, not part of the Manifest.db. Seeker won't find it
     if extracttype == 'itunes':
@@ -171,26 +315,29 @@ def crunch_artifacts(
     for plugin in plugins:
         if plugin.name == 'iTunesBackupInfo':
             continue
-        if isinstance(plugin.search, list) or isinstance(plugin.search, tuple):
-            search_regexes = plugin.search
-        else:
-            search_regexes = [plugin.search]
         files_found = []
+        search_start = perf_counter()
         log.write(f'<b>For {plugin.name} parser</b>')
-        for artifact_search_regex in search_regexes:
-            found = seeker.search(artifact_search_regex)
+        for artifact_search_regex in plugin.search_patterns:
+            found = seeker.search(artifact_search_regex, writable=plugin.writable_copies, virtual=plugin.virtual_files)
             if not found:
-                log.write(f'<ul><li>No file found for regex <i>{artifact_search_regex}</i></li></ul>')
+                log.write(f'<ul><li>No file found for regex <i>{html.escape(artifact_search_regex)}</i></li></ul>')
             else:
-                log.write(f'<ul><li>{len(found)} {"files" if len(found) > 1 else "file"} for regex <i>{artifact_search_regex}</i> located at:')
+                log.write(f'<ul><li>{len(found)} {"files" if len(found) > 1 else "file"} for regex <i>{html.escape(artifact_search_regex)}</i></li></ul>')
                 for pathh in found:
+                    try:
+                        size = os.path.getsize(pathh)
+                    except OSError:
+                        size = None  # file read by the plugin without being extracted
                     if pathh.startswith('\\\\?\\'):
                         pathh = pathh[4:]
-                    log.write(f'<ul><li>{pathh}</li></ul>')
-                log.write(f'</li></ul>')
+                    processed_files.write(json.dumps(
+                        {'plugin': plugin.name, 'pattern': artifact_search_regex, 'path': pathh, 'size': size}) + nl)
                 files_found.extend(found)
+        search_time = perf_counter() - search_start
+        metrics[plugin.name] = plugin_metrics(plugin, files_found)
+        metrics[plugin.name]['search_time'] = search_time
         if files_found:
-            logfunc('{} [{}] artifact started'.format(plugin.name, plugin.module_name))
             category_folder = os.path.join(out_params.report_folder_base, plugin.category)
             if not os.path.exists(category_folder):
                 try:
@@ -199,20 +346,71 @@ def crunch_artifacts(
                     logfunc('Error creating {} report directory at path {}'.format(plugin.name, category_folder))
                     logfunc('Error was {}'.format(str(ex)))
                     continue  # cannot do work
-            try:
-                plugin.method(files_found, category_folder, seeker, wrap_text, time_offset)
-            except Exception as ex:
-                logfunc('Reading {} artifact had errors!'.format(plugin.name))
-                logfunc('Error was {}'.format(str(ex)))
-                logfunc('Exception Traceback: {}'.format(traceback.format_exc()))
-                continue  # nope
+            to_run[plugin.name] = (files_found, category_folder)
+            continue  # progress is updated once it has run
 
-            logfunc('{} [{}] artifact completed'.format(plugin.name, plugin.module_name))
-            logfunc('')
+        categories_searched += 1
+        GuiWindow.SetProgressBar(categories_searched * ratio)
+    io_slot.close()
+
+    history = runtime_history or RuntimeHistory()
+    plugins = all_plugins = [plugin for plugin in plugins if plugin.name in to_run]
+    for plugin in plugins:
+        metrics[plugin.name]['expected_time'] = history.estimate(plugin.name, metrics[plugin.name]['bytes_matched'])
+    expected_times = {plugin.name: metrics[plugin.name]['expected_time'] for plugin in plugins}
+
+    skipped = []
+    if time_budget:
+        plugins, skipped = select_within_budget(plugins, expected_times,
+                                                {plugin.name: history.value(plugin.name) for plugin in plugins},
+                                                time_budget, workers)
+    # the logs of a pool are replayed in the order of a serial run, whatever order the plugins ran in
+    picked = {plugin.name for plugin in plugins}
+    replay_order = [plugin for plugin in all_plugins if plugin.name in picked]
+    if pool:
+        plugins = longest_first(plugins, expected_times)
+
+    run_start = perf_counter()
+    for plugin in plugins:
+        files_found, category_folder = to_run[plugin.name]
+        if pool:
+            pool.submit(plugin, files_found, category_folder, wrap_text, time_offset)
+            continue  # progress is updated when its results are collected below
+        if time_budget and perf_counter() - run_start + expected_times[plugin.name] > time_budget:
+            skipped.append(plugin)  # running late, what is left would not fit
+            continue
+        search_time = metrics[plugin.name]['search_time']
+        metrics[plugin.name] = run_plugin(plugin, files_found, category_folder, seeker, wrap_text, time_offset)
+        metrics[plugin.name]['search_time'] = search_time
+        metrics[plugin.name]['expected_time'] = expected_times[plugin.name]
+        if metrics[plugin.name]['status'] != 'ok':
+            continue  # nope
 
         categories_searched += 1
         GuiWindow.SetProgressBar(categories_searched * ratio)
+
+    if pool:
+        for plugin, records, plugin_run_metrics in pool.results(replay_order):
+            replay_log(records)
+            plugin_run_metrics['search_time'] = metrics[plugin.name]['search_time']
+            plugin_run_metrics['expected_time'] = expected_times[plugin.name]
+            metrics[plugin.name] = plugin_run_metrics
+            categories_searched += 1
+            GuiWindow.SetProgressBar(categories_searched * ratio)
+        pool.shutdown()
+
+    if skipped:
+        logfunc('')
+        logfunc(f'Skipped {len(skipped)} plugins to stay within the time budget of {time_budget:g} seconds:')
+        for plugin in skipped:
+            metrics[plugin.name]['status'] = 'skipped'
+            logfunc(f'    {plugin.name} [{plugin.module_name}] expected to take {expected_times[plugin.name]:.1f} seconds')
+    history.record(list(metrics.values()))
     log.close()
+    processed_files.close()
+    TimelineWriter.finish(out_params.report_folder_base)
+    if extraction_store:
+        extraction_store.close()
 
     logfunc('')
     logfunc('Processes completed.')
@@ -225,6 +423,9 @@ def crunch_artifacts(
     run_time_HMS = strftime('%H:%M:%S', gmtime(run_time_secs))
     logfunc("Processing time (wall)= {}".format(run_time_HMS))
 
+    write_run_metrics(out_params.report_folder_base, list(metrics.values()), extracttype, input_path, workers,
+                      end_wall - start_wall, end - start)
+
     logfunc('')
     logfunc('Report generation started.')
     # remove the \\?\ prefix we added to input and output paths, so it does not reflect in report
@@ -239,8 +440,29 @@ def crunch_artifacts(
     logfunc('Report generation Completed.')
     logfunc('')
     logfunc(f'Report location: {out_params.report_folder_base}')
+    LogWriter.flush(close=True)
     return True
 
+def write_run_metrics(report_folder_base, plugin_metrics_list, extracttype, input_path, workers, wall_time, cpu_time):
+    '''Writes the run metrics, with the metrics of each plugin, to Script Logs/run_metrics.json.
+       cpu_time is that of the main process only, workers count theirs in the metrics of their plugins.'''
+    run_metrics = {
+        'version': 1,
+        'ileapp_version': aleapp_version,
+        'extraction_type': extracttype,
+        'input_path': input_path,
+        'workers': workers,
+        'wall_time': wall_time,
+        'cpu_time': cpu_time,
+        'plugins': plugin_metrics_list,
+    }
+    try:
+        with open(os.path.join(report_folder_base, 'Script Logs', 'run_metrics.json'), 'w', encoding='utf8') as f:
+            json.dump(run_metrics, f, indent=1)
+    except (OSError, TypeError, ValueError) as ex:
+        logfunc('Could not write run metrics ' + str(ex))
+
 if __name__ == '__main__':
+    multiprocessing.freeze_support()  # plugin workers are spawned, also from the pyinstaller executable
     main()
     
@@ -7,11 +7,14 @@ import PySimpleGUI as sg
 import webbrowser
 import plugin_loader
 from scripts.ilapfuncs import *
+from scripts.runtime_history import RuntimeHistory, default_history_path
 from scripts.version_info import aleapp_version
 from time import process_time, gmtime, strftime
 from scripts.search_files import *
 
 MODULE_START_INDEX = 1000
+SLOW_MODULES = ('photosMetadata', 'journalStrings', 'walStrings')  # deselected by default if they never ran
+SLOW_MODULE_TIME = 60  # seconds, modules that usually take longer are deselected by default
 
 def ValidateInput(values, window):
     '''Returns tuple (success, extraction_type)'''
@@ -56,18 +59,22 @@ def ValidateInput(values, window):
 
 # initialize CheckBox control with module name   
 def CheckList(mtxt, lkey, mdstring, disable=False):
-    if mdstring == 'photosMetadata' or mdstring == 'journalStrings' or mdstring == 'walStrings': #items in the if are modules that take a long time to run. Deselects them by default.
-        dstate = False
+    # modules that take a long time to run are deselected by default, known from their past runs if they ran before
+    median_time = runtime_history.median_time(mdstring)
+    if median_time is None:
+        dstate = mdstring not in SLOW_MODULES
     else:
-        dstate = True
+        dstate = median_time <= SLOW_MODULE_TIME
     return [sg.CBox(mtxt, default=dstate, key=lkey, metadata=mdstring, disabled=disable)]
 
 def pickModules():
     global module_end_index
     global mlist
     global loader
+    global runtime_history
 
     loader = plugin_loader.PluginLoader()
+    runtime_history = RuntimeHistory(default_history_path())
 
     module_end_index = MODULE_START_INDEX     # arbitrary number to not interfere with other controls
     for plugin in sorted(loader.plugins, key=lambda p: p.category.upper()):
@@ -261,7 +268,8 @@ while True:
                 casedata = {}
             
             crunch_successful = ileapp.crunch_artifacts(
-                search_list, extracttype, input_path, out_params, len(loader)/s_items, wrap_text, loader, casedata, time_offset)
+                search_list, extracttype, input_path, out_params, len(loader)/s_items, wrap_text, loader, casedata, time_offset,
+                runtime_history=runtime_history)
             if crunch_successful:
                 report_path = os.path.join(out_params.report_folder_base, 'index.html')
                 
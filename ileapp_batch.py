@@ -0,0 +1,215 @@
+import argparse
+import concurrent.futures
+import csv
+import json
+import os
+import sys
+import traceback
+import pytz
+
+from contextlib import redirect_stdout
+from datetime import datetime
+from time import perf_counter, sleep
+
+import plugin_loader
+import scripts.artifacts.artGlobals
+
+from ileapp import crunch_artifacts, select_plugins
+from scripts.ilapfuncs import LogWriter, OutputParameters, is_platform_windows
+from scripts.plugin_runner import get_art_globals, worker_context
+from scripts.runtime_history import RuntimeHistory, default_history_path
+
+INPUT_TYPES = ('fs', 'tar', 'zip', 'gz', 'itunes')
+JOB_COLUMNS = ('input', 'type', 'output', 'timezone')
+
+# per-process state of a batch worker, set up once by _init_batch_worker and kept across jobs
+_worker_state = {}
+
+
+class IOSlot:
+    '''One of the slots of the batch I/O semaphore, held by a job while it lists and extracts its input.
+       release() gives it back if the job ended before crunch_artifacts did.'''
+    def __init__(self, semaphore):
+        self._semaphore = semaphore
+        self._held = False
+
+    def __enter__(self):
+        self._semaphore.acquire()
+        self._held = True
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def release(self):
+        if self._held:
+            self._held = False
+            self._semaphore.release()
+
+
+def read_jobs(jobs_path):
+    '''Returns the jobs of a CSV file with a header row naming the input, type, output and (optional)
+       timezone columns, each job a dict of those columns plus 'error' if it can't be run'''
+    with open(jobs_path, 'r', encoding='utf8', newline='') as f:
+        rows = list(csv.DictReader(f))
+    jobs = []
+    for row in rows:
+        job = {column: (row.get(column) or '').strip() for column in JOB_COLUMNS}
+        job['timezone'] = job['timezone'] or 'UTC'
+        job['error'] = None
+        if job['type'] not in INPUT_TYPES:
+            job['error'] = f"Unknown type '{job['type']}', must be one of {', '.join(INPUT_TYPES)}"
+        elif not os.path.exists(job['input']):
+            job['error'] = 'INPUT file/folder does not exist'
+        elif not os.path.isdir(job['output']):
+            job['error'] = 'OUTPUT folder does not exist'
+        elif job['timezone'] not in pytz.all_timezones_set:
+            job['error'] = f"Unknown timezone '{job['timezone']}'"
+        jobs.append(job)
+    return jobs
+
+
+def _init_batch_worker(io_semaphore, plugin_names, categories, use_runtime_history):
+    loader = plugin_loader.PluginLoader()
+    _worker_state['loader'] = loader
+    _worker_state['plugins'] = select_plugins(loader, plugin_names, categories) \
+        if plugin_names or categories else list(loader.plugins)
+    _worker_state['io_semaphore'] = io_semaphore
+    _worker_state['runtime_history'] = RuntimeHistory(default_history_path()) if use_runtime_history else None
+    # what plugins compute (iOS version...) must not carry over from one job to the next
+    _worker_state['art_globals'] = get_art_globals()
+
+
+def _make_output(output_path):
+    '''Returns the OutputParameters of a job, waiting for the next second if another job just took
+       the report folder name, as they are named after the time'''
+    while True:
+        try:
+            return OutputParameters(output_path)
+        except FileExistsError:
+            sleep(0.1)
+
+
+def _run_job(job):
+    '''Runs a job in a batch worker, returns its status (see write_status)'''
+    start = perf_counter()
+    status = {'input': job['input'], 'type': job['type'], 'output': job['output'], 'timezone': job['timezone'],
+              'status': 'failed', 'report_folder': None, 'wall_time': 0.0, 'plugins_ok': 0, 'plugins_failed': 0,
+              'error': None}
+    vars(scripts.artifacts.artGlobals).update(_worker_state['art_globals'])
+    input_path = job['input']
+    output_path = os.path.abspath(job['output'])
+    if is_platform_windows():
+        if input_path[1] == ':' and job['type'] == 'fs': input_path = '\\\\?\\' + input_path.replace('/', '\\')
+        if output_path[1] == ':': output_path = '\\\\?\\' + output_path.replace('/', '\\')
+
+    io_slot = IOSlot(_worker_state['io_semaphore'])
+    try:
+        # the log of each job is in its report, jobs running at once would mix theirs on the console
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            out_params = _make_output(output_path)
+            status['report_folder'] = out_params.report_folder_base
+            if crunch_artifacts(_worker_state['plugins'], job['type'], input_path, out_params, 1, True,
+                                _worker_state['loader'], {}, job['timezone'],
+                                runtime_history=_worker_state['runtime_history'], io_limit=io_slot):
+                status['status'] = 'ok'
+    except Exception as ex:
+        status['error'] = '{}: {}'.format(type(ex).__name__, str(ex))
+        traceback.print_exc()
+    finally:
+        io_slot.release()
+        LogWriter.flush(close=True)
+    status['wall_time'] = perf_counter() - start
+
+    if status['report_folder']:
+        try:
+            metrics_path = os.path.join(status['report_folder'], 'Script Logs', 'run_metrics.json')
+            with open(metrics_path, 'r', encoding='utf8') as f:
+                for metrics in json.load(f)['plugins']:
+                    if metrics['status'] == 'ok':
+                        status['plugins_ok'] += 1
+                    elif metrics['status'] != 'no files':
+                        status['plugins_failed'] += 1
+        except (OSError, ValueError, KeyError):
+            pass  # the job failed before running any plugin
+    return status
+
+
+def write_status(status_path, statuses):
+    '''Writes the status of each job, in the order of the job list, as JSON'''
+    temp_path = status_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf8') as f:
+        json.dump({'version': 1, 'updated': datetime.now().isoformat(timespec='seconds'), 'jobs': statuses},
+                  f, indent=1)
+    os.replace(temp_path, status_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='iLEAPP: runs many extractions with one pool of workers.')
+    parser.add_argument('jobs', action="store",
+                        help=("CSV file of the extractions to process, with a header row naming its input, type "
+                              "(fs, tar, zip, gz or itunes), output and, optionally, timezone columns"))
+    parser.add_argument('--workers', required=False, action="store", default=2, type=int,
+                        help="Number of extractions processed at the same time (default is 2)")
+    parser.add_argument('--io_jobs', required=False, action="store", default=1, type=int,
+                        help=("Number of extractions that may be listed or extracted at the same time, the rest "
+                              "wait for their turn before the I/O heavy part of their run (default is 1)"))
+    parser.add_argument('--status_file', required=False, action="store",
+                        help=("JSON file the status of each job is written to as they finish "
+                              "(default is the jobs file name ending in _status.json)"))
+    parser.add_argument('--plugins', required=False, action="store", nargs='+',
+                        help="Names of the plugins to run on each extraction, instead of all of them")
+    parser.add_argument('--categories', required=False, action="store", nargs='+',
+                        help="Categories of the plugins to run on each extraction, instead of all of them")
+    parser.add_argument('--no_runtime_history', required=False, action="store_true",
+                        help="Do not read or save plugin run times")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.jobs):
+        parser.error('JOBS file does not exist! Run the program again.')
+    if args.workers < 1:
+        parser.error('WORKERS must be 1 or more. Run the program again.')
+    if args.io_jobs < 1:
+        parser.error('IO_JOBS must be 1 or more. Run the program again.')
+    loader = plugin_loader.PluginLoader()
+    unknown = [name for name in args.plugins or () if name not in loader]
+    if unknown:
+        parser.error(f'Unknown PLUGINS {", ".join(unknown)}. Run the program again.')
+    categories = {plugin.category.lower() for plugin in loader.plugins}
+    unknown = [category for category in args.categories or () if category.lower() not in categories]
+    if unknown:
+        parser.error(f'Unknown CATEGORIES {", ".join(unknown)}. Run the program again.')
+
+    status_path = args.status_file or os.path.splitext(args.jobs)[0] + '_status.json'
+    jobs = read_jobs(args.jobs)
+    statuses = [{'input': job['input'], 'type': job['type'], 'output': job['output'], 'timezone': job['timezone'],
+                 'status': 'invalid' if job['error'] else 'queued', 'report_folder': None, 'wall_time': 0.0,
+                 'plugins_ok': 0, 'plugins_failed': 0, 'error': job['error']} for job in jobs]
+    write_status(status_path, statuses)
+    print(f'Info: {len(jobs)} jobs, {sum(1 for job in jobs if job["error"])} invalid. Status in {status_path}')
+
+    context = worker_context()
+    io_semaphore = context.Semaphore(args.io_jobs)
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=args.workers, mp_context=context, initializer=_init_batch_worker,
+            initargs=(io_semaphore, args.plugins, args.categories, not args.no_runtime_history)) as executor:
+        futures = {executor.submit(_run_job, job): index for index, job in enumerate(jobs) if not job['error']}
+        for future in concurrent.futures.as_completed(futures):
+            index = futures[future]
+            try:
+                statuses[index] = future.result()
+            except Exception as ex:  # worker died
+                statuses[index]['status'] = 'failed'
+                statuses[index]['error'] = '{}: {}'.format(type(ex).__name__, str(ex))
+            status = statuses[index]
+            print(f"{status['status']:7} {status['wall_time']:8.1f}s {status['input']} -> "
+                  f"{status['report_folder'] or status['output']}" + (f" ({status['error']})" if status['error'] else ''))
+            write_status(status_path, statuses)
+
+    failed = sum(1 for status in statuses if status['status'] != 'ok')
+    print(f'Info: {len(jobs) - failed} of {len(jobs)} jobs completed')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
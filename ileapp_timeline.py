@@ -0,0 +1,212 @@
+import argparse
+import csv
+import heapq
+import itertools
+import json
+import os
+import sqlite3
+import sys
+
+from datetime import datetime, timedelta, timezone
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from scripts.ilapfuncs import TimelineWriter, timeline_time_us
+
+FORMATS = ('tsv', 'csv', 'jsonl', 'parquet')
+COLUMNS = ('time', 'plugin', 'activity', 'key', 'data')
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MERGE_CACHE_PAGES = 8  # db pages cached per run while merging the runs, so that they don't evict each other's
+PARQUET_BATCH_ROWS = 100000  # events per Parquet record batch
+
+
+def open_timeline(path):
+    '''Returns a connection to the tl.db at path, or in the _Timeline folder of the report folder at path.
+       Builds the indexes if the run that wrote it didn't get to (they are needed by the queries)'''
+    if os.path.isdir(path):
+        path = os.path.join(path, '_Timeline', 'tl.db')
+    if not os.path.isfile(path):
+        raise ValueError(f'{path} does not exist')
+    db = sqlite3.connect(path)
+    if db.execute("PRAGMA user_version").fetchone()[0] < TimelineWriter.SCHEMA_VERSION:
+        db.close()
+        raise ValueError(f'{path} was written by an older version of iLEAPP, without typed timestamps')
+    try:
+        with db:
+            for index in TimelineWriter.INDEXES:
+                db.execute(index)
+    except sqlite3.Error as ex:
+        print(f'Warning: could not index {path}, queries will be slow ({ex})', file=sys.stderr)
+    return db
+
+
+def run_time_zone(db):
+    '''Returns the timezone the times without one were taken in when the events were written, UTC for
+       timelines written before it was recorded'''
+    try:
+        row = db.execute("SELECT value FROM settings WHERE name = 'time_zone'").fetchone()
+    except sqlite3.OperationalError:  # no settings table
+        return 'UTC'
+    return row[0] if row else 'UTC'
+
+
+def format_time(time_us):
+    return '' if time_us is None else (EPOCH + timedelta(microseconds=time_us)).isoformat(sep=' ')
+
+
+def _time_key(event):
+    return TimelineWriter.NO_TIME if event[0] is None else event[0]
+
+
+def query_events(db, start=None, end=None, activities=(), plugins=()):
+    '''Yields the (time_us, plugin, activity, key, payload) events from start to end (microseconds since
+       1970-01-01 UTC, both included), of the given activities and plugins, in time order, as read from
+       the db. Events without a time are only part of queries with neither start nor end.
+
+       Time windows and activities are read through the indexes. Otherwise, the events are a k-way merge
+       of the sorted runs they were written in, each read in table order, which keeps to one pass over
+       the db and to one event per run in memory however many events there are.'''
+    conditions = []
+    params = []
+    if plugins:
+        conditions.append(f'plugin IN ({",".join("?" * len(plugins))})')
+        params.extend(plugins)
+
+    if start is None and end is None and not activities:
+        runs = db.execute("SELECT first_rowid, last_rowid FROM runs ORDER BY first_rowid").fetchall()
+        db.execute(f"PRAGMA cache_size = {max(2000, MERGE_CACHE_PAGES * len(runs))}")
+        query = "SELECT time_us, plugin, activity, key, payload FROM events WHERE rowid BETWEEN ? AND ?" + \
+                ''.join(' AND ' + condition for condition in conditions)
+        yield from heapq.merge(*(db.execute(query, [first_rowid, last_rowid] + params)
+                                 for first_rowid, last_rowid in runs), key=_time_key)
+        return
+
+    if activities:
+        conditions.append(f'activity IN ({",".join("?" * len(activities))})')
+        params.extend(activity.upper() for activity in activities)
+    if start is not None:
+        conditions.append('time_us >= ?')
+        params.append(start)
+    if end is not None:
+        conditions.append('time_us <= ?')
+        params.append(end)
+    yield from db.execute("SELECT time_us, plugin, activity, key, payload FROM events WHERE " +
+                          ' AND '.join(conditions) + " ORDER BY time_us", params)
+
+
+def write_events(events, output, output_format):
+    '''Writes events to the output file in output_format (tsv, csv or jsonl), returns how many were written'''
+    count = 0
+    if output_format == 'jsonl':
+        for time_us, plugin, activity, key, payload in events:
+            output.write(json.dumps({'time': format_time(time_us), 'time_us': time_us, 'plugin': plugin,
+                                     'activity': activity, 'key': key, 'data': json.loads(payload)},
+                                    ensure_ascii=False) + '\n')
+            count += 1
+        return count
+
+    writer = csv.writer(output, delimiter='\t' if output_format == 'tsv' else ',')
+    writer.writerow(COLUMNS)
+    for time_us, plugin, activity, key, payload in events:
+        writer.writerow((format_time(time_us), plugin, activity, key, payload))
+        count += 1
+    return count
+
+
+def write_parquet(events, output_path):
+    '''Writes events to a Parquet file, PARQUET_BATCH_ROWS at a time, returns how many were written'''
+    schema = pyarrow.schema([('time', pyarrow.timestamp('us', tz='UTC')), ('plugin', pyarrow.string()),
+                             ('activity', pyarrow.string()), ('key', pyarrow.string()), ('data', pyarrow.string())])
+    count = 0
+    with pyarrow.parquet.ParquetWriter(output_path, schema) as writer:
+        while True:
+            batch = list(itertools.islice(events, PARQUET_BATCH_ROWS))
+            if not batch:
+                return count
+            writer.write_batch(pyarrow.record_batch(
+                [pyarrow.array(column, type=field.type) for column, field in zip(zip(*batch), schema)], schema=schema))
+            count += len(batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='iLEAPP: queries and exports the timeline of a report.')
+    parser.add_argument('timeline', action="store",
+                        help="Report folder, or the tl.db file in its _Timeline folder")
+    parser.add_argument('--start', required=False, action="store",
+                        help="Earliest time of the events, as YYYY-MM-DD[ HH:MM:SS[+HH:MM]], UTC unless an offset is given")
+    parser.add_argument('--end', required=False, action="store",
+                        help="Latest time of the events, as YYYY-MM-DD[ HH:MM:SS[+HH:MM]], UTC unless an offset is given")
+    parser.add_argument('--activities', required=False, action="store", nargs='+',
+                        help="Activities of the events, instead of all of them")
+    parser.add_argument('--plugins', required=False, action="store", nargs='+',
+                        help="Names of the plugins that reported the events, instead of all of them")
+    parser.add_argument('--format', required=False, action="store", choices=FORMATS, default='tsv',
+                        help="Format of the events written (default is tsv)")
+    parser.add_argument('-o', '--output', required=False, action="store",
+                        help="File the events are written to (default is the console)")
+    parser.add_argument('--limit', required=False, action="store", type=int,
+                        help="Number of events written, at most")
+    parser.add_argument('--list_activities', required=False, action="store_true",
+                        help="List the activities of the timeline with their number of events and time range instead")
+    args = parser.parse_args()
+
+    start = end = None
+    if args.start:
+        start = timeline_time_us(args.start)
+        if start is None:
+            parser.error('START must be a date or time in ISO 8601 format. Run the program again.')
+    if args.end:
+        end = timeline_time_us(args.end)
+        if end is None:
+            parser.error('END must be a date or time in ISO 8601 format. Run the program again.')
+        if len(args.end.strip()) == 10:
+            end += timedelta(days=1) // timedelta(microseconds=1) - 1  # the whole day
+    if args.limit is not None and args.limit < 0:
+        parser.error('LIMIT must be 0 or more. Run the program again.')
+    if args.format == 'parquet' and not args.list_activities:
+        if pyarrow is None:
+            parser.error('The parquet FORMAT needs the pyarrow package. Run the program again.')
+        if not args.output:
+            parser.error('OUTPUT is needed for the parquet FORMAT. Run the program again.')
+    try:
+        db = open_timeline(args.timeline)
+    except (ValueError, sqlite3.Error) as ex:
+        parser.error(f'{ex}. Run the program again.')
+    time_zone = run_time_zone(db)
+    if time_zone != 'UTC':
+        print(f'Info: times reported without a timezone were taken as {time_zone} times', file=sys.stderr)
+
+    if args.format == 'parquet' and not args.list_activities:
+        try:
+            events = query_events(db, start, end, args.activities or (), args.plugins or ())
+            count = write_parquet(itertools.islice(events, args.limit), args.output)
+            print(f'Info: {count} events', file=sys.stderr)
+        finally:
+            db.close()
+        return 0
+
+    output = open(args.output, 'w', encoding='utf8', newline='') if args.output else sys.stdout
+    try:
+        if args.list_activities:
+            writer = csv.writer(output, delimiter='\t')
+            writer.writerow(('activity', 'events', 'first', 'last'))
+            for activity, count, first, last in db.execute(
+                    "SELECT activity, count(*), min(time_us), max(time_us) FROM events GROUP BY activity"):
+                writer.writerow((activity, count, format_time(first), format_time(last)))
+        else:
+            events = query_events(db, start, end, args.activities or (), args.plugins or ())
+            count = write_events(itertools.islice(events, args.limit), output, args.format)
+            print(f'Info: {count} events', file=sys.stderr)
+    finally:
+        if args.output:
+            output.close()
+        db.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,3 +1,5 @@
+import ast
+import os
 import pathlib
 import dataclasses
 import typing
@@ -6,6 +8,35 @@ import importlib.util
 #PLUGINPATH = pathlib.Path("./scripts/artifacts")
 # a bit long-winded to make compatible with PyInstaller
 PLUGINPATH = pathlib.Path(__file__).resolve().parent / pathlib.Path("scripts/artifacts")
+MANIFEST_FILE_NAME = "plugin_manifest.cache"
+MANIFEST_VERSION = 1
+
+# plugin modules imported so far in this process, by path
+_modules = {}
+
+
+def load_module(path: pathlib.Path):
+    '''Imports the plugin module at path, once per process'''
+    mod = _modules.get(path)
+    if mod is None:
+        spec = importlib.util.spec_from_file_location(path.stem, path)
+        mod = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(mod)
+        _modules[path] = mod
+    return mod
+
+
+class LazyMethod:
+    '''Stands in for the function of a plugin, its module is only imported when it is first called'''
+    def __init__(self, path: pathlib.Path, func_name: str):
+        self.path = path
+        self.func_name = func_name
+
+    def __call__(self, *args, **kwargs):
+        return getattr(load_module(self.path), self.func_name)(*args, **kwargs)
+
+    def __repr__(self):
+        return f'<LazyMethod {self.path.stem}.{self.func_name}>'
 
 
 @dataclasses.dataclass(frozen=True)
@@ -15,39 +46,136 @@ class PluginSpec:
     category: str
     search: str
     method: typing.Callable  # todo define callable signature
+    requires: tuple[str, ...] = ()  # facts (eg: 'ios_version') that must be computed before this plugin runs
+    provides: tuple[str, ...] = ()  # facts this plugin computes for other plugins
+    extra_paths: tuple[str, ...] = ()  # patterns of files the plugin looks up itself with seeker.search
+    writable_copies: bool = False  # the plugin writes to the files it is given (eg: opens dbs read-write)
+    virtual_files: bool = False  # the plugin reads its files with seeker.open, so they needn't be extracted
+
+    @property
+    def search_patterns(self) -> tuple[str, ...]:
+        '''search as a tuple, plugins may define either a single pattern or a list/tuple of them'''
+        if isinstance(self.search, (list, tuple)):
+            return tuple(self.search)
+        return (self.search,)
 
 
 class PluginLoader:
+    '''Finds the plugins in plugin_path.
+
+       Plugin modules aren't imported here: their __artifacts_v2__ (or v1 __artifacts__) dict is read
+       from the source with the ast module, and the method of each PluginSpec imports the module when
+       it is first called. What was read is saved to a manifest file in plugin_path, so that plugin
+       files that haven't changed (same modification time and size) aren't even parsed next time.
+       A module whose artifacts can't be read that way is imported as it used to be.
+    '''
     def __init__(self, plugin_path: typing.Optional[pathlib.Path] = None):
         self._plugin_path = plugin_path or PLUGINPATH
         self._plugins: dict[str, PluginSpec] = {}
         self._load_plugins()
 
     @staticmethod
-    def load_module_lazy(path: pathlib.Path):
-        spec = importlib.util.spec_from_file_location(path.stem, path)
-        loader = importlib.util.LazyLoader(spec.loader)
-        spec.loader = loader
-        mod = importlib.util.module_from_spec(spec)
-        loader.exec_module(mod)
-        return mod
+    def read_artifacts(path: pathlib.Path):
+        '''Returns (version, artifacts) from the source of the plugin module at path, with the name of
+           the function of each artifact in place of the function, (None, None) if the module defines
+           no artifacts, or raises ValueError if they aren't plain literals'''
+        tree = ast.parse(path.read_bytes(), str(path))
+        found = {}
+        for node in tree.body:
+            if isinstance(node, ast.Assign):
+                for target in node.targets:
+                    if isinstance(target, ast.Name) and target.id in ('__artifacts_v2__', '__artifacts__'):
+                        found[target.id] = node.value
+        if '__artifacts_v2__' in found:
+            artifacts = ast.literal_eval(found['__artifacts_v2__'])
+            if not isinstance(artifacts, dict) or not all(
+                    isinstance(artifact, dict) and isinstance(artifact.get('function'), str)
+                    for artifact in artifacts.values()):
+                raise ValueError('__artifacts_v2__ is not a dict of artifact dicts')
+            return 2, artifacts
+        if '__artifacts__' in found:
+            node = found['__artifacts__']
+            if not isinstance(node, ast.Dict):
+                raise ValueError('__artifacts__ is not a dict')
+            artifacts = {}
+            for key, value in zip(node.keys, node.values):
+                # (category, search, function) where function is a name defined in the module
+                if not (isinstance(value, ast.Tuple) and len(value.elts) == 3 and isinstance(value.elts[2], ast.Name)):
+                    raise ValueError('__artifacts__ entries are not (category, search, function) tuples')
+                artifacts[ast.literal_eval(key)] = (
+                    ast.literal_eval(value.elts[0]), ast.literal_eval(value.elts[1]), value.elts[2].id)
+            return 1, artifacts
+        return None, None
+
+    def _read_manifest(self, manifest_path):
+        try:
+            manifest = ast.literal_eval(manifest_path.read_text(encoding='utf-8'))
+            if isinstance(manifest, dict) and manifest.get('version') == MANIFEST_VERSION:
+                return manifest['files']
+        except (OSError, ValueError, SyntaxError, KeyError, MemoryError, RecursionError):
+            pass  # missing or damaged, it is rebuilt
+        return {}
+
+    @staticmethod
+    def _write_manifest(manifest_path, files):
+        temp_path = manifest_path.with_name(f'{manifest_path.name}.{os.getpid()}.tmp')
+        try:
+            temp_path.write_text(repr({'version': MANIFEST_VERSION, 'files': files}), encoding='utf-8')
+            os.replace(temp_path, manifest_path)
+        except OSError:
+            pass  # plugin folder not writable (eg: PyInstaller bundle), the plugins are parsed each time
 
     def _load_plugins(self):
+        manifest_path = self._plugin_path / MANIFEST_FILE_NAME
+        cached = self._read_manifest(manifest_path)
+        files = {}  # file name -> (mtime_ns, size, version, artifacts) for the new manifest
+
         for py_file in self._plugin_path.glob("*.py"):
-            mod = PluginLoader.load_module_lazy(py_file)
-            mod_artifacts = getattr(mod, '__artifacts_v2__', None) or getattr(mod, '__artifacts__', None)
+            stat = py_file.stat()
+            entry = cached.get(py_file.name)
+            if entry is None or entry[:2] != (stat.st_mtime_ns, stat.st_size):
+                try:
+                    version, mod_artifacts = PluginLoader.read_artifacts(py_file)
+                    entry = (stat.st_mtime_ns, stat.st_size, version, mod_artifacts)
+                except (ValueError, SyntaxError, TypeError):
+                    entry = None
+            if entry is None:
+                # artifacts computed at import time, the module has to be imported to find them
+                mod = load_module(py_file)
+                mod_artifacts = getattr(mod, '__artifacts_v2__', None) or getattr(mod, '__artifacts__', None)
+                version = 2 if '__artifacts_v2__' in dir(mod) else 1  # determine the version
+            else:
+                files[py_file.name] = entry
+                version, mod_artifacts = entry[2], entry[3]
             if mod_artifacts is None:
                 continue  # no artifacts defined in this plugin
 
-            version = 2 if '__artifacts_v2__' in dir(mod) else 1  # determine the version
-
             for name, artifact in mod_artifacts.items():
                 category, search, func_name = (
                 artifact.get('category'), artifact.get('paths'), artifact.get('function')) if version == 2 else artifact
-                func = getattr(mod, func_name) if version == 2 and isinstance(func_name, str) else func_name
+                func = LazyMethod(py_file, func_name) if isinstance(func_name, str) else func_name
+                requires, provides = (
+                    PluginLoader._as_tuple(artifact.get('requires')), PluginLoader._as_tuple(artifact.get('provides'))
+                ) if version == 2 else ((), ())
+                extra_paths = PluginLoader._as_tuple(artifact.get('extra_paths')) if version == 2 else ()
+                writable_copies = bool(artifact.get('writable_copies')) if version == 2 else False
+                virtual_files = bool(artifact.get('virtual_files')) if version == 2 else False
                 if name in self._plugins:
                     raise KeyError("Duplicate plugin")
-                self._plugins[name] = PluginSpec(name, py_file.stem, category, search, func)
+                self._plugins[name] = PluginSpec(
+                    name, py_file.stem, category, search, func, requires, provides, extra_paths, writable_copies,
+                    virtual_files)
+
+        if files != cached:
+            PluginLoader._write_manifest(manifest_path, files)
+
+    @staticmethod
+    def _as_tuple(value) -> tuple[str, ...]:
+        if not value:
+            return ()
+        if isinstance(value, str):
+            return (value,)
+        return tuple(value)
 
 
     @property
@@ -62,4 +190,3 @@ class PluginLoader:
 
     def __len__(self):
         return len(self._plugins)
-
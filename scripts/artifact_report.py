@@ -1,7 +1,7 @@
 import html
 import os
 from scripts.html_parts import *
-from scripts.ilapfuncs import is_platform_windows
+from scripts.ilapfuncs import is_platform_windows, PluginStats
 from scripts.version_info import aleapp_version
 
 class ArtifactHtmlReport:
@@ -80,6 +80,7 @@ class ArtifactHtmlReport:
             raise ValueError('Output report file is closed/unavailable!')
 
         num_entries = len(data_list)
+        PluginStats.html_rows += num_entries
         if write_total:
             self.write_minor_header(f'Total number of entries: {num_entries}', 'h6')
         if write_location:
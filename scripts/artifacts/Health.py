@@ -1,3 +1,19 @@
+__artifacts_v2__ = {
+    "health": {
+        "name": "Health",
+        "description": "Parses Apple Health details",
+        "author": "@KevinPagano3",
+        "version": "0.0.3",
+        "date": "2022-08-15",
+        "requirements": "none",
+        "category": "Health",
+        "notes": "",
+        "paths": ('*Health/healthdb_secure.sqlite*', '*Health/healthdb.sqlite*'),
+        "requires": ("ios_version",),
+        "function": "get_Health"
+    }
+}
+
 # Module Description: Parses Apple Health details
 # Author: @KevinPagano3
 # Date: 2022-08-15
@@ -753,9 +769,3 @@ def get_Health(files_found, report_folder, seeker, wrap_text, timezone_offset):
         logfunc('No data available in Health - Steps')
     
         
-__artifacts__ = {
-    "health": (
-        "Health",
-        ('*Health/healthdb_secure.sqlite*','*Health/healthdb.sqlite*'),
-        get_Health)
-}
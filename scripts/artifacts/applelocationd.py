@@ -1,3 +1,19 @@
+__artifacts_v2__ = {
+    "applelocationd": {
+        "name": "Settings - com.apple.locationd.plist",
+        "description": "Parses location services settings from com.apple.locationd.plist",
+        "author": "",
+        "version": "",
+        "date": "",
+        "requirements": "none",
+        "category": "Identifiers",
+        "notes": "",
+        "paths": ('*/mobile/Library/Preferences/com.apple.locationd.plist',),
+        "virtual_files": True,
+        "function": "get_applelocationd"
+    }
+}
+
 import datetime
 import os
 import plistlib
@@ -8,7 +24,7 @@ from scripts.ilapfuncs import logfunc, logdevinfo, tsv, is_platform_windows
 def get_applelocationd(files_found, report_folder, seeker, wrap_text, timezone_offset):
     data_list = []
     file_found = str(files_found[0])
-    with open(file_found, "rb") as fp:
+    with seeker.open(file_found) as fp:
         pl = plistlib.load(fp)
         for key, val in pl.items():
             
@@ -35,13 +51,3 @@ def get_applelocationd(files_found, report_folder, seeker, wrap_text, timezone_o
         tsv(report_folder, data_headers, data_list, tsvname)
     else:
         logfunc('No Settings - com.apple.locationd.plist')
-            
-
-
-
-__artifacts__ = {
-    "applelocationd": (
-        "Identifiers",
-        ('*/mobile/Library/Preferences/com.apple.locationd.plist'),
-        get_applelocationd)
-}
@@ -1,3 +1,19 @@
+__artifacts_v2__ = {
+    "googleChat": {
+        "name": "Google Chat",
+        "description": "Parses Google Chat messages and their media from dynamite.db",
+        "author": "",
+        "version": "",
+        "date": "",
+        "requirements": "none",
+        "category": "Google Chat",
+        "notes": "",
+        "paths": ('*/Documents/user_accounts/*/dynamite.db*',),
+        "extra_paths": ('*/Containers/Data/Application/*/tmp/*',),
+        "function": "get_googleChat"
+    }
+}
+
 import sqlite3
 import blackboxprotobuf
 import re
@@ -105,11 +121,3 @@ def get_googleChat(files_found, report_folder, seeker, wrap_text, timezone_offse
         
     else:
         logfunc('No Google Chat data available')
-    
-    
-__artifacts__ = {
-    "googleChat": (
-        "Google Chat",
-        ('*/Documents/user_accounts/*/dynamite.db*'),
-        get_googleChat)
-}
\ No newline at end of file
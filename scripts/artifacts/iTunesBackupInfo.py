@@ -9,6 +9,7 @@ __artifacts_v2__ = {
         "category": "iTunes Backup Info",
         "notes": "",
         "paths": ('*Info.plist',),
+        "provides": ("ios_version",),
         "function": "get_iTunesBackupInfo"
     }
 }
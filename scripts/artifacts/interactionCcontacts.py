@@ -1,3 +1,19 @@
+__artifacts_v2__ = {
+    "interactionCcontacts": {
+        "name": "InteractionC",
+        "description": "Parses contacts and interactions from interactionC.db",
+        "author": "",
+        "version": "",
+        "date": "",
+        "requirements": "none",
+        "category": "InteractionC",
+        "notes": "",
+        "paths": ('**/interactionC.db*',),
+        "requires": ("ios_version",),
+        "function": "get_interactionCcontacts"
+    }
+}
+
 import glob
 import os
 import pathlib
@@ -130,9 +146,3 @@ def get_interactionCcontacts(files_found, report_folder, seeker, wrap_text, time
     db.close()
     return      
     
-__artifacts__ = {
-    "interactionCcontacts": (
-        "InteractionC",
-        ('**/interactionC.db*'),
-        get_interactionCcontacts)
-}
@@ -9,6 +9,8 @@ __artifacts_v2__ = {
         "category": "IOS Build",
         "notes": "",
         "paths": ('*LastBuildInfo.plist',),
+        "provides": ("ios_version",),
+        "virtual_files": True,
         "function": "get_lastBuild"
     }
 }
@@ -25,7 +27,7 @@ def get_lastBuild(files_found, report_folder, seeker, wrap_text, time_offset):
     versionnum = 0
     data_list = []
     file_found = str(files_found[0])
-    with open(file_found, "rb") as fp:
+    with seeker.open(file_found) as fp:
         pl = plistlib.load(fp)
         for key, val in pl.items():
             data_list.append((key, val))
@@ -1,3 +1,20 @@
+__artifacts_v2__ = {
+    "mailprotect": {
+        "name": "Apple Mail",
+        "description": "Parses emails from the Apple Mail Envelope Index and Protected Index databases",
+        "author": "",
+        "version": "",
+        "date": "",
+        "requirements": "none",
+        "category": "Apple Mail",
+        "notes": "",
+        "paths": ('*/mobile/Library/Mail/* Index*',),
+        "requires": ("ios_version",),
+        "writable_copies": True,
+        "function": "get_mailprotect"
+    }
+}
+
 import glob
 import os
 import pathlib
@@ -223,10 +240,3 @@ def get_mailprotect(files_found, report_folder, seeker, wrap_text, timezone_offs
 				
 		else:
 			logfunc("No Apple Mail emails available")
-
-__artifacts__ = {
-    "mailprotect": (
-        "Apple Mail",
-        ('*/mobile/Library/Mail/* Index*'),
-        get_mailprotect)
-}
\ No newline at end of file
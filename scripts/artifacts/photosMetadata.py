@@ -1,3 +1,20 @@
+__artifacts_v2__ = {
+    "photosMetadata": {
+        "name": "Photos Metadata",
+        "description": "Parses photo and video metadata from Photos.sqlite",
+        "author": "",
+        "version": "",
+        "date": "",
+        "requirements": "none",
+        "category": "Photos",
+        "notes": "",
+        "paths": ('*/mobile/Media/PhotoData/Photos.sqlite*',),
+        "requires": ("ios_version",),
+        "extra_paths": ('*/Media/PhotoData/Thumbnails/*', '*/Media/DCIM/*'),
+        "function": "get_photosMetadata"
+    }
+}
+
 import glob
 import os
 import sys
@@ -1041,10 +1058,3 @@ def get_photosMetadata(files_found, report_folder, seeker, wrap_text, timezone_o
 
         db.close()
         return
-
-__artifacts__ = {
-    "photosMetadata": (
-        "Photos",
-        ('*/mobile/Media/PhotoData/Photos.sqlite*'),
-        get_photosMetadata)
-}
\ No newline at end of file
@@ -1,3 +1,19 @@
+__artifacts_v2__ = {
+    "secretCalculatorPhotoAlbum": {
+        "name": "Secret Calculator Photo Album",
+        "description": "Obtains photos/videos stored in the Secret Calculator Photo Album and their corresponding album",
+        "author": "John Hyla",
+        "version": "1.0.0",
+        "date": "",
+        "requirements": "none",
+        "category": "Secret Calculator Photo Album",
+        "notes": "",
+        "paths": ('**mobile/Containers/Data/Application/*/.com.apple.mobile_container_manager.metadata.plist',),
+        "extra_paths": ('*/Containers/Data/Application/*/Library/data.sqlite', '*/Containers/Data/Application/*/Library/Data/*.mov'),
+        "function": "get_secretCalculator"
+    }
+}
+
 # Secret Calculator Photo Album (xyz.hypertornado.calculator)
 # Author:  John Hyla
 # Version: 1.0.0
@@ -89,10 +105,3 @@ def get_secretCalculator(files_found, report_folder, seeker, wrap_text, timezone
 
     db.close()
     return
-    
-__artifacts__ = {
-    "secretCalculatorPhotoAlbum": (
-        "Secret Calculator Photo Album",
-        ('**mobile/Containers/Data/Application/*/.com.apple.mobile_container_manager.metadata.plist'),
-        get_secretCalculator)
-}
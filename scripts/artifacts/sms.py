@@ -1,3 +1,19 @@
+__artifacts_v2__ = {
+    "sms": {
+        "name": "SMS & iMessage",
+        "description": "Parses SMS and iMessage messages and attachments from sms.db",
+        "author": "",
+        "version": "",
+        "date": "",
+        "requirements": "none",
+        "category": "SMS & iMessage",
+        "notes": "",
+        "paths": ('**/sms.db*',),
+        "extra_paths": ('*/Library/SMS/Attachments/*',),
+        "function": "get_sms"
+    }
+}
+
 import os
 import pandas as pd
 import shutil
@@ -139,10 +155,3 @@ def get_sms(files_found, report_folder, seeker, wrap_text, timezone_offset):
 
     db.close()
     return
-    
-__artifacts__ = {
-    "sms": (
-        "SMS & iMessage",
-        ('**/sms.db*'),
-        get_sms)
-}
@@ -1,3 +1,20 @@
+__artifacts_v2__ = {
+    "teamsSegment": {
+        "name": "Microsoft Teams - Logs",
+        "description": "Parses location, motion, power and state change events from Microsoft Teams DriveIQ segment logs",
+        "author": "",
+        "version": "",
+        "date": "",
+        "requirements": "none",
+        "category": "Microsoft Teams - Logs",
+        "notes": "",
+        "paths": ('*/mobile/Containers/Data/Application/*/Library/DriveIQ/segments/current/*.*',),
+        "virtual_files": True,
+        "function": "get_teamsSegment"
+    }
+}
+
+import io
 import json
 import scripts.artifacts.artGlobals #use to get iOS version -> iOSversion = scripts.artifacts.artGlobals.versionf
 
@@ -12,7 +29,7 @@ def get_teamsSegment(files_found, report_folder, seeker, wrap_text, timezone_off
     data_list_statechange = []
     
     for file_found in files_found:
-        with open(file_found) as file:
+        with io.TextIOWrapper(seeker.open(file_found)) as file:
             for line in file:
                 serial = json.loads(line)
                 timestamp = serial[0].replace('T',' ')
@@ -137,10 +154,3 @@ def get_teamsSegment(files_found, report_folder, seeker, wrap_text, timezone_off
         
     else:
         logfunc('No Microsoft Teams Power State Change')
-
-__artifacts__ = {
-    "teamsSegment": (
-        "Microsoft Teams - Logs",
-        ('*/mobile/Containers/Data/Application/*/Library/DriveIQ/segments/current/*.*'),
-        get_teamsSegment)
-}
\ No newline at end of file
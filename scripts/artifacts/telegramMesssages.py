@@ -13,6 +13,7 @@ __artifacts_v2__ = {
             '*/telegram-data/account-*/postbox/db/db_sqlite*',
             '*/telegram-data/account-*/postbox/media/**'
         ),
+        "writable_copies": True,
         "function": "get_telegramMessages"
     }
 }
@@ -25,6 +25,7 @@ __artifacts_v2__ = {
             '**/Containers/Data/Application/*/Documents/Attachments/*.*',
             '**/com.viber/ViberIcons/*.*'
         ),
+        "requires": ("ios_version",),
         "function": "get_viber"
     }
 }
@@ -0,0 +1,178 @@
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+from scripts.ilapfuncs import logfunc
+
+INDEX_FILE_NAME = 'index.db'
+FLUSH_EVERY = 1000  # files stored or fetched between two writes of the index
+
+
+class ExtractionStore:
+    '''Folder of files extracted from archives and backups, shared by runs and by the plugins of a run.
+
+       Each file is stored once under a key made from the identity of the archive and of the
+       member (see make_key), and is hardlinked to where a seeker wants it, or copied when the
+       folder is on another file system. An index db keeps the size and last use time of each
+       file, and the least recently used files are removed once the store grows past max_size.
+
+       Files stored and fetched are written to the index FLUSH_EVERY at a time, in one transaction,
+       with the size of the store kept in memory in between, so that eviction is only looked into
+       when the store may have grown past max_size. close() writes what is left at the end of a run.
+    '''
+    def __init__(self, root, max_size):
+        self.root = root
+        self.max_size = max_size
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        self.db_path = os.path.join(root, INDEX_FILE_NAME)
+        db = self._connect()
+        db.execute("CREATE TABLE IF NOT EXISTS objects(key TEXT PRIMARY KEY, size INTEGER, last_used REAL)")
+        db.execute("CREATE INDEX IF NOT EXISTS objects_last_used ON objects(last_used)")
+        db.commit()
+        self._total = db.execute("SELECT coalesce(sum(size), 0) FROM objects").fetchone()[0]
+        db.close()
+        self._start_pending()
+
+    def _start_pending(self):
+        self._lock = threading.Lock()  # extraction threads store and fetch files at the same time
+        self._stored = {}  # key -> (size, last use time), not yet in the index
+        self._used = {}  # key -> last use time, not yet in the index
+
+    def __getstate__(self):
+        # worker processes keep their own pending files, flushed after each plugin
+        state = self.__dict__.copy()
+        for name in ('_lock', '_stored', '_used'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._start_pending()
+
+    def _connect(self):
+        # several worker processes and extraction threads may use the store at once
+        return sqlite3.connect(self.db_path, timeout=60)
+
+    @staticmethod
+    def archive_identity(archive_path):
+        '''Returns what identifies an archive for make_key: its path, size and modification time'''
+        stat = os.stat(archive_path)
+        return f'{os.path.realpath(archive_path)}\0{stat.st_size}\0{stat.st_mtime_ns}'
+
+    @staticmethod
+    def make_key(archive_identity, *member_identity):
+        '''Returns the key of a member of the archive with archive_identity, member_identity being
+           whatever tells members apart (name, CRC, size...)'''
+        parts = (archive_identity,) + member_identity
+        return hashlib.sha1('\0'.join(str(part) for part in parts).encode('utf8', 'surrogateescape')).hexdigest()
+
+    def _object_path(self, key):
+        return os.path.join(self.root, 'objects', key[:2], key)
+
+    @staticmethod
+    def _link_or_copy(source, destination):
+        # write to a temporary name first, so nobody sees a partly copied file
+        temp_path = f'{destination}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            os.link(source, temp_path)
+        except OSError:
+            shutil.copy2(source, temp_path)
+        os.replace(temp_path, destination)
+
+    def fetch(self, key, destination, copy=False):
+        '''Puts the stored file of key at destination, as a hardlink unless copy is set (the caller
+           will write to it). Returns False if the store doesn't have it.'''
+        object_path = self._object_path(key)
+        if not os.path.exists(object_path):
+            return False
+        try:
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            if copy:
+                temp_path = f'{destination}.{os.getpid()}.{threading.get_ident()}.tmp'
+                shutil.copy2(object_path, temp_path)
+                os.replace(temp_path, destination)
+            else:
+                ExtractionStore._link_or_copy(object_path, destination)
+        except OSError as ex:
+            logfunc(f'Could not get {destination} from extraction cache {self.root} ' + str(ex))
+            return False
+        with self._lock:
+            self._used[key] = time.time()
+            full = len(self._stored) + len(self._used) >= FLUSH_EVERY
+        if full:
+            self.flush()
+        return True
+
+    def put(self, key, source):
+        '''Adds the file at source to the store under key'''
+        object_path = self._object_path(key)
+        try:
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            ExtractionStore._link_or_copy(source, object_path)
+            size = os.path.getsize(object_path)
+        except OSError as ex:
+            logfunc(f'Could not add {source} to extraction cache {self.root} ' + str(ex))
+            return
+        with self._lock:
+            self._stored[key] = (size, time.time())
+            self._total += size
+            full = len(self._stored) + len(self._used) >= FLUSH_EVERY
+        if full:
+            self.flush()
+
+    def flush(self):
+        '''Writes the files stored and fetched so far to the index, then evicts files if the store
+           may have grown past max_size'''
+        with self._lock:
+            stored, self._stored = self._stored, {}
+            used, self._used = self._used, {}
+            over_size = self._total > self.max_size
+        if stored or used:
+            try:
+                db = self._connect()
+                with db:
+                    db.executemany("INSERT OR REPLACE INTO objects VALUES(?,?,?)",
+                                   ((key, size, last_used) for key, (size, last_used) in stored.items()))
+                    db.executemany("UPDATE objects SET last_used=? WHERE key=?",
+                                   ((last_used, key) for key, last_used in used.items()))
+                db.close()
+            except sqlite3.Error as ex:
+                logfunc(f'Could not update extraction cache {self.root} ' + str(ex))
+                return
+        if over_size:
+            self.evict()
+
+    def close(self):
+        '''Writes what is left to the index and evicts files if the store, as other processes may
+           have added to it too, is past max_size'''
+        self.flush()
+        self.evict()
+
+    def evict(self):
+        '''Removes the least recently used files until the store is back under max_size'''
+        evicted = []
+        try:
+            db = self._connect()
+            with db:
+                total = db.execute("SELECT coalesce(sum(size), 0) FROM objects").fetchone()[0]
+                if total > self.max_size:
+                    for key, size in db.execute("SELECT key, size FROM objects ORDER BY last_used").fetchall():
+                        if total <= self.max_size:
+                            break
+                        evicted.append(key)
+                        total -= size
+                    db.executemany("DELETE FROM objects WHERE key=?", ((key,) for key in evicted))
+            db.close()
+        except sqlite3.Error as ex:
+            logfunc(f'Could not clean up extraction cache {self.root} ' + str(ex))
+            return
+        with self._lock:
+            self._total = total + sum(size for size, _ in self._stored.values())
+        for key in evicted:
+            try:
+                os.remove(self._object_path(key))
+            except OSError:
+                pass  # already gone
@@ -0,0 +1,132 @@
+import bisect
+import io
+import zlib
+
+try:
+    import indexed_gzip
+except ImportError:
+    indexed_gzip = None
+
+CHECKPOINT_SPACING = 32 * 1024 * 1024  # uncompressed bytes between two checkpoints
+READ_SIZE = 256 * 1024  # compressed bytes read at a time
+
+
+class GzipCheckpointReader(io.RawIOBase):
+    '''Seekable reader of the uncompressed content of a gzip file.
+
+       While reading, a copy of the decompressor state is kept every CHECKPOINT_SPACING bytes.
+       Seeking to an earlier offset (or far ahead, past a known checkpoint) restarts from the
+       nearest checkpoint before it instead of decompressing again from the start of the file.
+       Decompressor states can't be saved, so the checkpoints only last as long as the reader.
+    '''
+    def __init__(self, path, spacing=CHECKPOINT_SPACING):
+        self.name = path
+        self.spacing = spacing
+        self._file = open(path, 'rb')
+        self._offsets = [0]  # uncompressed offset of each checkpoint
+        self._checkpoints = [(0, None)]  # (compressed offset, decompressor copy) of each checkpoint
+        self._restore(0)
+
+    @staticmethod
+    def _new_decompressor():
+        return zlib.decompressobj(zlib.MAX_WBITS | 16)  # gzip header and trailer
+
+    def _restore(self, index):
+        compressed_offset, decompressor = self._checkpoints[index]
+        self._file.seek(compressed_offset)
+        self._decompressor = decompressor.copy() if decompressor else self._new_decompressor()
+        self._pos = self._offsets[index]
+        self._buffer = bytearray()  # decompressed data from _pos on
+        self._eof = False
+
+    def _fill(self):
+        chunk = self._file.read(READ_SIZE)
+        if not chunk:
+            self._eof = True
+            return
+        data = self._decompressor.decompress(chunk)
+        # files made by pigz, bgzip etc are several gzip members one after the other
+        while self._decompressor.eof and self._decompressor.unused_data:
+            rest = self._decompressor.unused_data
+            self._decompressor = self._new_decompressor()
+            data += self._decompressor.decompress(rest)
+        self._buffer += data
+        end = self._pos + len(self._buffer)
+        if end >= self._offsets[-1] + self.spacing and not self._decompressor.unused_data:
+            # all the input read so far is consumed, so decompression can restart from here
+            self._offsets.append(end)
+            self._checkpoints.append((self._file.tell(), self._decompressor.copy()))
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            while not self._eof:
+                self._pos += len(self._buffer)
+                self._buffer.clear()
+                self._fill()
+            offset += self._pos + len(self._buffer)
+        index = bisect.bisect_right(self._offsets, offset) - 1
+        if offset < self._pos or self._offsets[index] > self._pos + len(self._buffer):
+            self._restore(index)
+        while offset > self._pos + len(self._buffer) and not self._eof:
+            self._pos += len(self._buffer)
+            self._buffer.clear()
+            self._fill()
+        skip = min(offset - self._pos, len(self._buffer))
+        del self._buffer[:skip]
+        self._pos += skip
+        return self._pos
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            while not self._eof:
+                self._fill()
+            size = len(self._buffer)
+        while len(self._buffer) < size and not self._eof:
+            self._fill()
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        self._pos += len(data)
+        return data
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self._file.close()
+        self._checkpoints = []
+        super().close()
+
+
+def open_indexed_gzip(path, index_data=None):
+    '''Returns a seekable file object of the uncompressed content of a gzip file.
+       With the indexed_gzip module installed, its zran index is used, and index_data from
+       export_index() can be given to skip rebuilding it. Otherwise a GzipCheckpointReader.'''
+    if indexed_gzip is None:
+        return GzipCheckpointReader(path)
+    fileobj = indexed_gzip.IndexedGzipFile(path, spacing=CHECKPOINT_SPACING)
+    if index_data:
+        fileobj.import_index(fileobj=io.BytesIO(index_data))
+    return fileobj
+
+
+def export_index(fileobj):
+    '''Returns the index built so far by a file object from open_indexed_gzip as bytes,
+       or None if it can't be saved'''
+    if indexed_gzip is None or not isinstance(fileobj, indexed_gzip.IndexedGzipFile):
+        return None
+    data = io.BytesIO()
+    fileobj.export_index(fileobj=data)
+    return data.getvalue()
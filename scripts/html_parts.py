@@ -189,12 +189,16 @@ tabs_code = \
         <li class="nav-item">
             <a class="nav-link" id="files-list-tab" data-toggle="tab" href="#files" role="tab" aria-controls="files" aria-selected="false">Processed files list</a>
         </li>
+        <li class="nav-item">
+            <a class="nav-link" id="performance-tab" data-toggle="tab" href="#performance" role="tab" aria-controls="performance" aria-selected="false">Performance</a>
+        </li>
     </ul>
     <div class="tab-content" id="myTabContent">
         <div class="tab-pane fade show active" id="case" role="tabpanel" aria-labelledby="case-tab"><br />{}</div>
         <div class="tab-pane fade" id="device" role="tabpanel" aria-labelledby="device-tab"><br />{}</div>
         <div class="tab-pane fade text-monospace" id="run" role="tabpanel" aria-labelledby="script-run-tab"><br />{}</div>
         <div class="tab-pane fade" id="files" role="tabpanel" aria-labelledby="profile-tab"><br />{}</div>
+        <div class="tab-pane fade" id="performance" role="tabpanel" aria-labelledby="performance-tab"><br />{}</div>
     </div>
 """
 # thank you note , at bottom of index.html
@@ -309,6 +313,39 @@ nav_bar_script_footer = \
         });
     </script>
 """
+# sorts the Performance tab of index.html, slowest plugins first
+performance_table_script = \
+"""
+    <script>
+        $(document).ready(function() {
+            $('#performanceTable').DataTable({
+                "order": [[ 3, "desc" ]],
+                "aLengthMenu": [[ 15, 50, 100, -1 ], [ 15, 50, 100, "All" ]],
+            });
+            $('.dataTables_length').addClass('bs-select');
+        });
+    </script>
+"""
+# {} is the name of the processed files script in Script Logs, see report.generate_processed_files_table_code
+processed_files_table_script = \
+"""
+    <script src="Script%20Logs/{}"></script>
+    <script>
+        $(document).ready(function() {{
+            if (typeof processedFiles === 'undefined') {{
+                return;
+            }}
+            $('#processedFilesTable').DataTable({{
+                "data": processedFiles,
+                "deferRender": true,
+                // paths come from the evidence, they are shown as text rather than read as HTML
+                "columnDefs": [{{ "targets": "_all", "defaultContent": "", "render": $.fn.dataTable.render.text() }}],
+                "aLengthMenu": [[ 15, 50, 100, 500 ], [ 15, 50, 100, 500 ]],
+            }});
+            $('.dataTables_length').addClass('bs-select');
+        }});
+    </script>
+"""
 default_responsive_table_script = \
 """
     <script>
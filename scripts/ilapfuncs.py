@@ -1,13 +1,19 @@
 # common standard imports
+import atexit
 import codecs
+import collections
 import csv
 from datetime import *
+import json
 import os
+import queue
 import pathlib
 import re
 import shutil
 import sqlite3
 import sys
+import threading
+import time as timex
 from functools import lru_cache
 from pathlib import Path
 
@@ -239,17 +245,329 @@ class GuiWindow:
         if GuiWindow.progress_bar_handle:
             GuiWindow.progress_bar_handle.UpdateBar(n)
 
-def logfunc(message=""):
-    with open(OutputParameters.screen_output_file_path, 'a', encoding='utf8') as a:
-        print(message)
-        a.write(message + '<br>' + OutputParameters.nl)
+LogRecord = collections.namedtuple('LogRecord', 'kind level plugin time message')
+LogRecord.__doc__ = '''A message of logfunc (kind 'log') or logdevinfo (kind 'devinfo'), with its level ('info',
+   'error'...), the plugin running when it was logged (or None) and its time (seconds since the epoch)'''
+
+class LogCapture:
+    '''Holds log records while a plugin runs in a worker process, so that the
+       parent process can replay them in a deterministic order'''
+    records = None  # list of LogRecord while capturing, else None
+
+    @staticmethod
+    def start():
+        LogCapture.records = []
+
+    @staticmethod
+    def stop():
+        records = LogCapture.records or []
+        LogCapture.records = None
+        return records
+
+class LogWriter:
+    '''Writes log records to the Script Logs of the report from a single thread, so that logging
+       doesn't open and close Screen Output.html for each message.
+
+       Records are queued by logfunc and logdevinfo, and the thread writes them in batches to the
+       files it keeps open: the html logs, and log.jsonl with the fields of each LogRecord.
+       The files are flushed after each batch. flush() waits until everything logged is written,
+       which must be done before reading the logs.
+    '''
+    BATCH_SIZE = 1000  # records written before the files are flushed, at most
+    REFRESH_INTERVAL = 0.1  # seconds between refreshes of the GUI window
+    JSONL_FILE_NAME = 'log.jsonl'
+    plugin = None  # name of the plugin running in this process, set by plugin_runner.run_plugin
+    _queue = None
+    _thread = None
+    _lock = threading.Lock()
+    _last_refresh = 0.0
+
+    @staticmethod
+    def put(record):
+        path = OutputParameters.screen_output_file_path_devinfo if record.kind == 'devinfo' \
+            else OutputParameters.screen_output_file_path
+        if LogWriter._thread is None:
+            with LogWriter._lock:
+                if LogWriter._thread is None:
+                    LogWriter._queue = queue.SimpleQueue()
+                    thread = threading.Thread(target=LogWriter._write_records, args=(LogWriter._queue,),
+                                              name='LogWriter', daemon=True)
+                    thread.start()
+                    LogWriter._thread = thread
+        LogWriter._queue.put((path, record))
+
+    @staticmethod
+    def flush(close=False):
+        '''Returns once the records logged so far are written. With close, the files are also closed
+           (they are opened again by the next record)'''
+        if LogWriter._thread is None:
+            return
+        done = threading.Event()
+        LogWriter._queue.put((None, (done, close)))
+        done.wait()
+
+    @staticmethod
+    def refresh_window():
+        '''Refreshes the GUI window, at most every REFRESH_INTERVAL seconds'''
+        now = timex.monotonic()
+        if now - LogWriter._last_refresh >= LogWriter.REFRESH_INTERVAL:
+            LogWriter._last_refresh = now
+            GuiWindow.window_handle.refresh()
+
+    @staticmethod
+    def _after_fork():
+        # the thread doesn't exist in a forked child, which starts its own if it logs
+        LogWriter._queue = None
+        LogWriter._thread = None
+        LogWriter._lock = threading.Lock()
+
+    @staticmethod
+    def _open(files, path):
+        if path not in files:
+            try:
+                files[path] = open(path, 'a', encoding='utf8')
+            except OSError as ex:
+                print(f'Could not write log to {path} ' + str(ex), file=sys.stderr)
+                files[path] = None
+        return files[path]
+
+    @staticmethod
+    def _write_records(records_queue):
+        encode_json = json.JSONEncoder().encode
+        # path -> open file, or None if it can't be written to. The html logs of a report share
+        # its log.jsonl, which has a single handle so that their records don't interleave
+        files = {}
+        while True:
+            batch = [records_queue.get()]
+            try:
+                while len(batch) < LogWriter.BATCH_SIZE:
+                    batch.append(records_queue.get_nowait())
+            except queue.Empty:
+                pass
+            flushes = []
+            for path, record in batch:
+                if path is None:
+                    flushes.append(record)
+                    continue
+                log_file = LogWriter._open(files, path)
+                if log_file is None:
+                    continue
+                log_file.write(record.message + '<br>' + OutputParameters.nl)
+                jsonl_file = LogWriter._open(files, os.path.join(os.path.dirname(path), LogWriter.JSONL_FILE_NAME))
+                if jsonl_file is not None:
+                    jsonl_file.write(encode_json(record._asdict()) + '\n')
+            for log_file in files.values():
+                if log_file is not None:
+                    log_file.flush()
+            for done, close in flushes:
+                if close:
+                    for log_file in files.values():
+                        if log_file is not None:
+                            log_file.close()
+                    files.clear()
+                done.set()
+
+class TimelineWriter:
+    '''Writes the rows of timeline() to _Timeline/tl.db from a single thread, with one connection kept
+       open for the whole run instead of one per call.
+
+       Rows are queued and inserted in large transactions, with synchronous off and no automatic
+       checkpoints while the run goes on. finish() writes everything queued, checkpoints the db once
+       and closes it. In worker processes, flush() commits the rows of each plugin so that other
+       processes writing to the same db can go on.
+
+       Each row is an event of the events table: its time in microseconds since 1970-01-01 UTC (NULL
+       if the first column of the row isn't a date, and taken in the time_zone of the run, recorded in
+       the settings table, if it has no timezone), the plugin and activity that reported it, the
+       first column as written, and the whole row as a JSON object of header -> value (see
+       _timeline_keys). The indexes on time and activity are built by finish(), once all the rows
+       are in. The data view keeps the key, activity, datalist columns of the first version of tl.db.
+
+       The rows of each transaction are inserted in time order, so that the events table is made of
+       runs of consecutive rowids sorted by time, listed in the runs table. Merging the runs gives the
+       whole timeline in time order, reading each run in table order (see ileapp_timeline.py).
+    '''
+    BATCH_ROWS = 50000  # rows inserted before a commit, at most
+    SCHEMA_VERSION = 2  # PRAGMA user_version of tl.db
+    NO_TIME = -1 << 63  # sort key of rows without a time
+    INDEXES = ("CREATE INDEX IF NOT EXISTS events_time ON events(time_us)",
+               "CREATE INDEX IF NOT EXISTS events_activity ON events(activity, time_us)")
+    time_zone = 'UTC'  # timezone of the run, in which plugins report times without one (set by run_plugin)
+    _queue = None
+    _thread = None
+    _lock = threading.Lock()
+    _errors = collections.deque()  # messages of the writer thread, logged by the thread putting or flushing rows
+
+    @staticmethod
+    def put(db_path, rows):
+        TimelineWriter._log_errors()
+        if TimelineWriter._thread is None:
+            with TimelineWriter._lock:
+                if TimelineWriter._thread is None:
+                    TimelineWriter._queue = queue.SimpleQueue()
+                    thread = threading.Thread(target=TimelineWriter._write_rows, args=(TimelineWriter._queue,),
+                                              name='TimelineWriter', daemon=True)
+                    thread.start()
+                    TimelineWriter._thread = thread
+        TimelineWriter._queue.put((db_path, rows))
+
+    @staticmethod
+    def flush(close=False):
+        '''Returns once the rows queued so far are committed. With close, the dbs are also checkpointed
+           and closed (they are opened again by the next rows)'''
+        if TimelineWriter._thread is None:
+            return
+        done = threading.Event()
+        TimelineWriter._queue.put((None, (done, close)))
+        done.wait()
+        TimelineWriter._log_errors()
+
+    @staticmethod
+    def _log_errors():
+        # logfunc refreshes the GUI window, which can only be done from the thread that runs it
+        while TimelineWriter._errors:
+            logfunc(TimelineWriter._errors.popleft(), 'error')
+
+    @staticmethod
+    def finish(report_folder_base):
+        '''Writes the rows queued so far, indexes and checkpoints the timeline db of report_folder_base,
+           at the end of a run'''
+        TimelineWriter.flush(close=True)
+        tldb = os.path.join(report_folder_base, '_Timeline', 'tl.db')
+        if os.path.exists(tldb):
+            db = sqlite3.connect(tldb, timeout=60)
+            with db:
+                for index in TimelineWriter.INDEXES:
+                    db.execute(index)
+            # rows written by worker processes can still be in the write-ahead log
+            db.execute('''PRAGMA wal_checkpoint(TRUNCATE)''')
+            db.close()
+
+    @staticmethod
+    def _after_fork():
+        # the thread doesn't exist in a forked child, which starts its own if it writes rows
+        TimelineWriter._queue = None
+        TimelineWriter._thread = None
+        TimelineWriter._lock = threading.Lock()
+        TimelineWriter._errors = collections.deque()
+
+    @staticmethod
+    def _connect(db_path):
+        db = sqlite3.connect(db_path, timeout=60)
+        db.execute('''PRAGMA journal_mode = WAL''')
+        db.execute('''PRAGMA synchronous = OFF''')
+        db.execute('''PRAGMA wal_autocheckpoint = 0''')
+        db.execute("""CREATE TABLE IF NOT EXISTS events(time_us INTEGER, plugin TEXT, activity TEXT, key TEXT,
+                      payload TEXT)""")
+        db.execute("""CREATE TABLE IF NOT EXISTS runs(first_rowid INTEGER, last_rowid INTEGER)""")
+        db.execute("""CREATE VIEW IF NOT EXISTS data AS SELECT key, activity, payload AS datalist FROM events""")
+        db.execute("""CREATE TABLE IF NOT EXISTS settings(name TEXT PRIMARY KEY, value TEXT)""")
+        db.execute("""INSERT OR IGNORE INTO settings VALUES('time_zone', ?)""", (TimelineWriter.time_zone,))
+        db.execute(f"""PRAGMA user_version = {TimelineWriter.SCHEMA_VERSION}""")
+        db.commit()
+        return db
+
+    @staticmethod
+    def _write_rows(rows_queue):
+        dbs = {}  # path -> connection
+        while True:
+            batch = [rows_queue.get()]
+            row_count = 0
+            try:
+                while row_count < TimelineWriter.BATCH_ROWS:
+                    item = rows_queue.get_nowait()
+                    batch.append(item)
+                    if item[0] is not None:
+                        row_count += len(item[1])
+            except queue.Empty:
+                pass
+            flushes = []
+            batch_rows = {}  # path -> rows
+            for db_path, rows in batch:
+                if db_path is None:
+                    flushes.append(rows)
+                elif rows:
+                    batch_rows.setdefault(db_path, []).extend(rows)
+            for db_path, rows in batch_rows.items():
+                # rows without a time first, as in ORDER BY time_us
+                rows.sort(key=lambda row: TimelineWriter.NO_TIME if row[0] is None else row[0])
+                try:
+                    if db_path not in dbs:
+                        dbs[db_path] = TimelineWriter._connect(db_path)
+                    db = dbs[db_path]
+                    db.executemany("INSERT INTO events VALUES(?,?,?,?,?)", rows)
+                    # the transaction holds the write lock, its rows get consecutive rowids
+                    db.execute("INSERT INTO runs SELECT last_insert_rowid() - ? + 1, last_insert_rowid()", (len(rows),))
+                except sqlite3.Error as ex:
+                    if db_path in dbs:
+                        dbs[db_path].rollback()  # no rows outside of the runs
+                    TimelineWriter._errors.append(f'Could not write {len(rows)} timeline rows to {db_path} ' + str(ex))
+            for db_path, db in list(dbs.items()):
+                try:
+                    db.commit()
+                except sqlite3.Error as ex:
+                    TimelineWriter._errors.append(f'Could not write timeline rows to {db_path} ' + str(ex))
+            for done, close in flushes:
+                if close:
+                    for db_path, db in dbs.items():
+                        try:
+                            db.execute('''PRAGMA wal_checkpoint(TRUNCATE)''')
+                            db.close()
+                        except sqlite3.Error as ex:
+                            TimelineWriter._errors.append(f'Could not close timeline db {db_path} ' + str(ex))
+                    dbs.clear()
+                done.set()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=LogWriter._after_fork)
+    os.register_at_fork(after_in_child=TimelineWriter._after_fork)
+# the timeline writer may still log
+atexit.register(LogWriter.flush)
+atexit.register(TimelineWriter.flush, close=True)
+
+class PluginStats:
+    '''Counts the rows the running plugin writes to the reports, for the run metrics'''
+    html_rows = 0
+    tsv_rows = 0
+    timeline_rows = 0
+
+    @staticmethod
+    def reset():
+        PluginStats.html_rows = PluginStats.tsv_rows = PluginStats.timeline_rows = 0
+
+    @staticmethod
+    def get():
+        return {'html_rows': PluginStats.html_rows, 'tsv_rows': PluginStats.tsv_rows,
+                'timeline_rows': PluginStats.timeline_rows}
+
+def replay_log(records):
+    '''Writes out log records captured by LogCapture'''
+    for record in records:
+        if record.kind == 'log':
+            print(record.message)
+        LogWriter.put(record)
+    if GuiWindow.window_handle:
+        LogWriter.refresh_window()
+
+def logfunc(message="", level='info'):
+    record = LogRecord('log', level, LogWriter.plugin, timex.time(), message)
+    if LogCapture.records is not None:
+        LogCapture.records.append(record)
+        return
+
+    print(message)
+    LogWriter.put(record)
 
     if GuiWindow.window_handle:
-        GuiWindow.window_handle.refresh()
+        LogWriter.refresh_window()
 
 def logdevinfo(message=""):
-    with open(OutputParameters.screen_output_file_path_devinfo, 'a', encoding='utf8') as b:
-        b.write(message + '<br>' + OutputParameters.nl)
+    record = LogRecord('devinfo', 'info', LogWriter.plugin, timex.time(), message)
+    if LogCapture.records is not None:
+        LogCapture.records.append(record)
+        return
+
+    LogWriter.put(record)
 
 def tsv(report_folder, data_headers, data_list, tsvname):
     report_folder = report_folder.rstrip('/')
@@ -257,10 +575,7 @@ def tsv(report_folder, data_headers, data_list, tsvname):
     report_folder_base, tail = os.path.split(report_folder)
     tsv_report_folder = os.path.join(report_folder_base, '_TSV Exports')
 
-    if os.path.isdir(tsv_report_folder):
-        pass
-    else:
-        os.makedirs(tsv_report_folder)
+    os.makedirs(tsv_report_folder, exist_ok=True)
     
     
     with codecs.open(os.path.join(tsv_report_folder, tsvname +'.tsv'), 'a', 'utf-8-sig') as tsvfile:
@@ -268,65 +583,91 @@ def tsv(report_folder, data_headers, data_list, tsvname):
         tsv_writer.writerow(data_headers)
         for i in data_list:
             tsv_writer.writerow(i)
+            PluginStats.tsv_rows += 1
             
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_NAIVE_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_timeline_json = json.JSONEncoder(default=str, ensure_ascii=False).encode
+
+@lru_cache(maxsize=None)
+def _timeline_zone(time_zone):
+    return None if time_zone == 'UTC' else pytz.timezone(time_zone)
+
+def timeline_time_us(value, time_zone=None):
+    '''Returns a date, datetime or ISO 8601 string as microseconds since 1970-01-01 UTC, or None if it
+       isn't one. Times without a timezone are taken in time_zone (a pytz timezone), UTC if None'''
+    if isinstance(value, str):
+        value = value.strip()
+        in_utc = value.endswith(' UTC') or value.endswith('Z')
+        if in_utc:
+            value = value[:-4] if value.endswith(' UTC') else value[:-1]
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+        if in_utc and value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+    elif isinstance(value, date) and not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is None:
+        if time_zone is None:
+            return (value - _NAIVE_EPOCH) // _MICROSECOND
+        value = time_zone.localize(value)
+    return (value - _EPOCH) // _MICROSECOND
+
+def _timeline_keys(data_headers):
+    '''Returns the keys of the JSON object of a timeline row: its headers, numbered from the second
+       time a header is repeated ('Info', 'Info (2)'...) so that no column is lost'''
+    keys = []
+    used = set()
+    for header in data_headers:
+        key = str(header)
+        number = 1
+        while key in used:
+            number += 1
+            key = f'{header} ({number})'
+        used.add(key)
+        keys.append(key)
+    return keys
+
 def timeline(report_folder, tlactivity, data_list, data_headers):
     report_folder = report_folder.rstrip('/')
     report_folder = report_folder.rstrip('\\')
     report_folder_base, tail = os.path.split(report_folder)
     tl_report_folder = os.path.join(report_folder_base, '_Timeline')
 
-    if os.path.isdir(tl_report_folder):
-        tldb = os.path.join(tl_report_folder, 'tl.db')
-        db = sqlite3.connect(tldb)
-        cursor = db.cursor()
-        cursor.execute('''PRAGMA synchronous = EXTRA''')
-        cursor.execute('''PRAGMA journal_mode = WAL''')
-        db.commit()
-    else:
-        os.makedirs(tl_report_folder)
-        # create database
-        tldb = os.path.join(tl_report_folder, 'tl.db')
-        db = sqlite3.connect(tldb, isolation_level = 'exclusive')
-        cursor = db.cursor()
-        cursor.execute(
-            """
-            CREATE TABLE data(key TEXT, activity TEXT, datalist TEXT)
-            """
-        )
-        db.commit()
-    
-    a = 0
-    length = (len(data_list))
-    while a < length: 
-        modifiedList = list(map(lambda x, y: x.upper() + ': ' +  str(y), data_headers, data_list[a]))
-        cursor.executemany("INSERT INTO data VALUES(?,?,?)", [(str(data_list[a][0]), tlactivity.upper(), str(modifiedList))])
-        a += 1
-    db.commit()
-    db.close()
+    # plugins running in parallel workers may create the folder at the same time
+    os.makedirs(tl_report_folder, exist_ok=True)
+    tldb = os.path.join(tl_report_folder, 'tl.db')
+    activity = tlactivity.upper()
+    keys = _timeline_keys(data_headers)
+    # plugins write times without a timezone in the timezone of the run, once converted from UTC
+    time_zone = _timeline_zone(TimelineWriter.time_zone)
+    TimelineWriter.put(tldb, [(timeline_time_us(row[0], time_zone), LogWriter.plugin, activity, str(row[0]),
+                               _timeline_json(dict(zip(keys, row))))
+                              for row in data_list])
+    PluginStats.timeline_rows += len(data_list)
 
 def kmlgen(report_folder, kmlactivity, data_list, data_headers):
     report_folder = report_folder.rstrip('/')
     report_folder = report_folder.rstrip('\\')
     report_folder_base, tail = os.path.split(report_folder)
     kml_report_folder = os.path.join(report_folder_base, '_KML Exports')
-    if os.path.isdir(kml_report_folder):
-        latlongdb = os.path.join(kml_report_folder, '_latlong.db')
-        db = sqlite3.connect(latlongdb)
-        cursor = db.cursor()
-        cursor.execute('''PRAGMA synchronous = EXTRA''')
-        cursor.execute('''PRAGMA journal_mode = WAL''')
-        db.commit()
-    else:
-        os.makedirs(kml_report_folder)
-        latlongdb = os.path.join(kml_report_folder, '_latlong.db')
-        db = sqlite3.connect(latlongdb)
-        cursor = db.cursor()
-        cursor.execute(
+    os.makedirs(kml_report_folder, exist_ok=True)
+    latlongdb = os.path.join(kml_report_folder, '_latlong.db')
+    db = sqlite3.connect(latlongdb, timeout=60)
+    cursor = db.cursor()
+    cursor.execute('''PRAGMA synchronous = EXTRA''')
+    cursor.execute('''PRAGMA journal_mode = WAL''')
+    cursor.execute(
         """
-        CREATE TABLE data(key TEXT, latitude TEXT, longitude TEXT, activity TEXT)
+        CREATE TABLE IF NOT EXISTS data(key TEXT, latitude TEXT, longitude TEXT, activity TEXT)
         """
-            )
-        db.commit()
+    )
+    db.commit()
     
     kml = simplekml.Kml(open=1)
     
@@ -0,0 +1,142 @@
+import os
+import sqlite3
+
+from scripts.ilapfuncs import logfunc
+
+LISTING_CACHE_FILE_NAME = 'iLEAPP_listing_cache.db'
+
+
+class ListingCache:
+    '''Keeps the files listing of extraction folders in an SQLite db, so that repeated runs over the
+       same extraction don't have to walk it again.
+
+       A saved listing is used only if the root folder still has the same inode, modification time
+       and number of top level entries as when it was saved.
+
+       The members of tar archives are kept too, along with the gzip index of a tar.gz when one
+       could be exported, and are used only if the archive still has the same size and
+       modification time.
+    '''
+    def __init__(self, db_path):
+        self.db_path = db_path
+        db = sqlite3.connect(db_path)
+        db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS listings(id INTEGER PRIMARY KEY, root TEXT UNIQUE, inode INTEGER,
+                mtime_ns INTEGER, top_level_count INTEGER, file_count INTEGER);
+            CREATE TABLE IF NOT EXISTS dirs(listing_id INTEGER, dir_id INTEGER, path TEXT,
+                PRIMARY KEY(listing_id, dir_id));
+            CREATE TABLE IF NOT EXISTS files(listing_id INTEGER, dir_id INTEGER, name TEXT);
+            CREATE INDEX IF NOT EXISTS files_listing ON files(listing_id);
+            CREATE TABLE IF NOT EXISTS archives(id INTEGER PRIMARY KEY, path TEXT UNIQUE, size INTEGER,
+                mtime_ns INTEGER, member_count INTEGER, gzip_index BLOB);
+            CREATE TABLE IF NOT EXISTS members(archive_id INTEGER, name TEXT, type BLOB, offset INTEGER,
+                offset_data INTEGER, size INTEGER, mtime INTEGER, mode INTEGER, linkname TEXT);
+            CREATE INDEX IF NOT EXISTS members_archive ON members(archive_id);
+            """
+        )
+        db.close()
+
+    @staticmethod
+    def _get_key(directory):
+        '''Returns (inode, mtime_ns, top_level_count) of the root folder'''
+        stat = os.stat(directory)
+        return stat.st_ino, stat.st_mtime_ns, len(os.listdir(directory))
+
+    def load(self, directory):
+        '''Returns the saved listing as a list of (folder path, name) tuples in the original
+           walk order, or None if there isn't a valid one'''
+        try:
+            key = ListingCache._get_key(directory)
+            db = sqlite3.connect(self.db_path)
+            row = db.execute(
+                "SELECT id, inode, mtime_ns, top_level_count, file_count FROM listings WHERE root=?",
+                (directory,)).fetchone()
+            if row is None or tuple(row[1:4]) != key:
+                db.close()
+                return None
+            listing_id, file_count = row[0], row[4]
+            dirs = dict(db.execute("SELECT dir_id, path FROM dirs WHERE listing_id=?", (listing_id,)))
+            entries = [(dirs[dir_id], name) for dir_id, name in
+                       db.execute("SELECT dir_id, name FROM files WHERE listing_id=? ORDER BY rowid", (listing_id,))]
+            db.close()
+        except (OSError, sqlite3.Error, KeyError) as ex:
+            logfunc(f'Could not read files listing cache {self.db_path} ' + str(ex))
+            return None
+        if len(entries) != file_count:  # incomplete save
+            return None
+        return entries
+
+    def save(self, directory, entries):
+        '''Saves the listing of directory, entries being (folder path, name) tuples in walk order'''
+        try:
+            key = ListingCache._get_key(directory)
+            dir_ids = {}
+            files = []
+            for folder, name in entries:
+                dir_id = dir_ids.setdefault(folder, len(dir_ids))
+                files.append((dir_id, name))
+
+            db = sqlite3.connect(self.db_path)
+            with db:
+                old = db.execute("SELECT id FROM listings WHERE root=?", (directory,)).fetchone()
+                if old:
+                    db.execute("DELETE FROM files WHERE listing_id=?", old)
+                    db.execute("DELETE FROM dirs WHERE listing_id=?", old)
+                    db.execute("DELETE FROM listings WHERE id=?", old)
+                listing_id = db.execute(
+                    "INSERT INTO listings(root, inode, mtime_ns, top_level_count, file_count) VALUES(?,?,?,?,?)",
+                    (directory, *key, len(files))).lastrowid
+                db.executemany("INSERT INTO dirs VALUES(?,?,?)",
+                               ((listing_id, dir_id, folder) for folder, dir_id in dir_ids.items()))
+                db.executemany("INSERT INTO files VALUES(?,?,?)",
+                               ((listing_id, dir_id, name) for dir_id, name in files))
+            db.close()
+        except (OSError, sqlite3.Error) as ex:
+            logfunc(f'Could not save files listing cache {self.db_path} ' + str(ex))
+
+    def load_archive(self, archive_path):
+        '''Returns (members, gzip index or None) saved for archive_path, members being
+           (name, type, offset, offset_data, size, mtime, mode, linkname) tuples in archive order,
+           or None if there isn't a valid one'''
+        try:
+            stat = os.stat(archive_path)
+            db = sqlite3.connect(self.db_path)
+            row = db.execute(
+                "SELECT id, size, mtime_ns, member_count, gzip_index FROM archives WHERE path=?",
+                (archive_path,)).fetchone()
+            if row is None or (row[1], row[2]) != (stat.st_size, stat.st_mtime_ns):
+                db.close()
+                return None
+            archive_id, member_count, gzip_index = row[0], row[3], row[4]
+            members = db.execute(
+                "SELECT name, type, offset, offset_data, size, mtime, mode, linkname FROM members "
+                "WHERE archive_id=? ORDER BY rowid", (archive_id,)).fetchall()
+            db.close()
+        except (OSError, sqlite3.Error) as ex:
+            logfunc(f'Could not read files listing cache {self.db_path} ' + str(ex))
+            return None
+        if len(members) != member_count:  # incomplete save
+            return None
+        return members, gzip_index
+
+    def save_archive(self, archive_path, members, gzip_index=None):
+        '''Saves the members of archive_path, as (name, type, offset, offset_data, size, mtime, mode,
+           linkname) tuples in archive order, and its gzip index if there is one'''
+        try:
+            stat = os.stat(archive_path)
+            members = list(members)
+            db = sqlite3.connect(self.db_path)
+            with db:
+                old = db.execute("SELECT id FROM archives WHERE path=?", (archive_path,)).fetchone()
+                if old:
+                    db.execute("DELETE FROM members WHERE archive_id=?", old)
+                    db.execute("DELETE FROM archives WHERE id=?", old)
+                archive_id = db.execute(
+                    "INSERT INTO archives(path, size, mtime_ns, member_count, gzip_index) VALUES(?,?,?,?,?)",
+                    (archive_path, stat.st_size, stat.st_mtime_ns, len(members), gzip_index)).lastrowid
+                db.executemany("INSERT INTO members VALUES(?,?,?,?,?,?,?,?,?)",
+                               ((archive_id, *member) for member in members))
+            db.close()
+        except (OSError, sqlite3.Error) as ex:
+            logfunc(f'Could not save files listing cache {self.db_path} ' + str(ex))
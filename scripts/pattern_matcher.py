@@ -0,0 +1,170 @@
+import os
+
+from fnmatch import _compile_pattern
+from functools import lru_cache
+
+normcase = lru_cache(maxsize=None)(os.path.normcase)
+
+KEY_LENGTH = 3  # number of characters used to bucket patterns by suffix or path segment
+
+
+def split_pattern(pattern):
+    '''Splits a fnmatch pattern on its wildcards.
+       Returns (list of literal runs before the last wildcard, literal tail after the last wildcard)
+    '''
+    runs = []
+    current = ''
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        i += 1
+        if c in '*?':
+            runs.append(current)
+            current = ''
+        elif c == '[':
+            # same bracket parsing as fnmatch.translate
+            j = i
+            if j < n and pattern[j] == '!':
+                j += 1
+            if j < n and pattern[j] == ']':
+                j += 1
+            while j < n and pattern[j] != ']':
+                j += 1
+            if j >= n:
+                current += c  # no closing bracket, so it is a literal '['
+            else:
+                runs.append(current)
+                current = ''
+                i = j + 1
+        else:
+            current += c
+    return runs, current
+
+
+def fnmatch_to_glob(pattern):
+    '''Translates a fnmatch pattern to an SQLite GLOB pattern matching the same paths'''
+    result = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        i += 1
+        if c == '[':
+            # same bracket parsing as fnmatch.translate
+            j = i
+            if j < n and pattern[j] == '!':
+                j += 1
+            if j < n and pattern[j] == ']':
+                j += 1
+            while j < n and pattern[j] != ']':
+                j += 1
+            if j >= n:
+                result.append('[[]')  # no closing bracket, so it is a literal '['
+            else:
+                chars = pattern[i:j]
+                if chars.startswith('!'):
+                    chars = '^' + chars[1:]
+                elif chars.startswith('^') and len(chars) > 1:
+                    chars = chars[1:] + '^'  # a literal '^' for fnmatch, but negation for GLOB
+                result.append('[' + chars + ']')
+                i = j + 1
+        else:
+            result.append(c)
+    return ''.join(result)
+
+
+class PatternMatcher:
+    '''Matches paths against many fnmatch patterns in a single pass.
+
+       Each pattern is compiled once and filed under the cheapest literal check that any path it
+       matches must pass:
+         - the basename, if the pattern ends in a literal path segment (*/sms.db)
+         - the last few characters, if it ends in another literal (*LastBuildInfo.plist)
+         - the start of a path segment, for a literal segment elsewhere (*/CoreDuet/Knowledge/knowledgeC.db*)
+       The full pattern is only tried on paths that pass the literal check.
+    '''
+    def __init__(self, patterns):
+        self.sep = normcase('/')
+        self.patterns = list(dict.fromkeys(p for p in patterns if p))
+        self._by_basename = {}  # basename -> [(pattern, match, None)]
+        self._by_suffix = {}  # last KEY_LENGTH chars -> [(pattern, match, tail)]
+        self._short_suffixes = []  # (tail, pattern, match) for tails shorter than KEY_LENGTH
+        self._by_segment = {}  # first KEY_LENGTH chars of a segment -> [(pattern, match, literal)]
+        self._unfiltered = []  # (pattern, match, literal or '')
+        for pattern in self.patterns:
+            self._add(pattern)
+
+    def _add(self, pattern):
+        normalized = normcase(pattern)
+        match = _compile_pattern(normalized)
+        runs, tail = split_pattern(normalized)
+        if not runs:  # no wildcards at all
+            runs, tail = [normalized], normalized
+
+        if self.sep in tail:
+            basename = tail.rsplit(self.sep, 1)[1]
+            if basename:
+                self._by_basename.setdefault(basename, []).append((pattern, match, None))
+                return
+
+        # longest literal that starts at the beginning of a path segment
+        segment_literal, segment_length = '', 0
+        for run in runs + [tail]:
+            parts = run.split(self.sep)
+            for index in range(1, len(parts)):
+                if len(parts[index]) > segment_length:
+                    segment_literal = self.sep + self.sep.join(parts[index:])
+                    segment_length = len(parts[index])
+
+        if tail and len(tail) >= segment_length:
+            if len(tail) >= KEY_LENGTH:
+                self._by_suffix.setdefault(tail[-KEY_LENGTH:], []).append((pattern, match, tail))
+            else:
+                self._short_suffixes.append((tail, pattern, match))
+        elif segment_length >= KEY_LENGTH:
+            key = segment_literal[1:1 + KEY_LENGTH]
+            self._by_segment.setdefault(key, []).append((pattern, match, segment_literal))
+        else:
+            self._unfiltered.append((pattern, match, max(runs + [tail], key=len)))
+
+    def match(self, path):
+        '''Returns the patterns that match path, which must already be normcase'd'''
+        found = []
+        sep = self.sep
+        segments = path.split(sep)
+
+        for pattern, match, _ in self._by_basename.get(segments[-1], ()):
+            if match(path) is not None:
+                found.append(pattern)
+        for pattern, match, tail in self._by_suffix.get(path[-KEY_LENGTH:], ()):
+            if path.endswith(tail) and match(path) is not None:
+                found.append(pattern)
+        for tail, pattern, match in self._short_suffixes:
+            if path.endswith(tail) and match(path) is not None:
+                found.append(pattern)
+        if self._by_segment:
+            seen = set()
+            for segment in segments[1:]:
+                key = segment[:KEY_LENGTH]
+                if key in seen:
+                    continue
+                seen.add(key)
+                for pattern, match, literal in self._by_segment.get(key, ()):
+                    if literal in path and match(path) is not None:
+                        found.append(pattern)
+        for pattern, match, literal in self._unfiltered:
+            if literal in path and match(path) is not None:
+                found.append(pattern)
+        return found
+
+    def match_all(self, items, prefix='', key=None):
+        '''Scans items once. Returns dict of pattern -> list of matching items, in the order of items.
+           prefix is prepended to each path before matching, key gets the path from an item.
+        '''
+        results = {pattern: [] for pattern in self.patterns}
+        prefix = normcase(prefix)
+        for item in items:
+            # not the cached normcase, that would keep every path of the listing in memory
+            path = prefix + os.path.normcase(key(item) if key else item)
+            for pattern in self.match(path):
+                results[pattern].append(item)
+        return results
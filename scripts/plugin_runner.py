@@ -0,0 +1,520 @@
+import collections
+import concurrent.futures
+import multiprocessing
+import os
+import sys
+import threading
+import traceback
+import types
+
+from time import monotonic, perf_counter, process_time, time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+import plugin_loader
+import scripts.artifacts.artGlobals
+
+from scripts.ilapfuncs import logfunc, LogCapture, LogRecord, LogWriter, OutputParameters, PluginStats, \
+    TimelineWriter
+
+# per-process state of a worker, set up once by _init_worker
+_worker_state = {}
+
+
+def peak_rss():
+    '''Returns the peak resident set size of this process in bytes, or None where it isn't available'''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # kilobytes on Linux
+
+
+def reset_peak_rss():
+    '''Starts measuring the peak resident set size of this process over again, returns False where
+       it can't be (Linux only), the peak being then that of the whole life of the process'''
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_since_reset():
+    '''Returns the peak resident set size of this process in bytes since reset_peak_rss, or None'''
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def process_rss(pid):
+    '''Returns the resident set size of process pid in bytes, or None if it can't be read
+       (needs /proc, or the psutil module)'''
+    try:
+        with open(f'/proc/{pid}/statm', 'r') as f:
+            return int(f.read().split()[1]) * (resource.getpagesize() if resource else 4096)
+    except (OSError, ValueError, IndexError):
+        pass
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).memory_info().rss
+        except psutil.Error:
+            pass
+    return None
+
+
+def plugin_metrics(plugin, files_found=(), status='no files'):
+    '''Returns the metrics of a plugin that didn't run, to be filled in by run_plugin'''
+    size = 0
+    for path in files_found:
+        try:
+            size += os.path.getsize(path)
+        except OSError:
+            pass  # folder, or file read by the plugin without being extracted
+    return {'name': plugin.name, 'module': plugin.module_name, 'category': plugin.category, 'status': status,
+            'error': None, 'files_matched': len(files_found), 'bytes_matched': size, 'search_time': 0.0,
+            'wall_time': 0.0, 'cpu_time': 0.0, 'peak_rss_delta': None, 'rss_delta': None, 'html_rows': 0, 'tsv_rows': 0,
+            'timeline_rows': 0, 'expected_time': None}
+
+
+def run_plugin(plugin, files_found, category_folder, seeker, wrap_text, time_offset):
+    '''Runs a single plugin on the files found for it. Returns its metrics (see plugin_metrics),
+       the status being 'ok' if it completed without errors, or 'error' if it raised'''
+    metrics = plugin_metrics(plugin, files_found, 'ok')
+    PluginStats.reset()
+    rss_before = process_rss(os.getpid())
+    peak_before = peak_rss()
+    peak_reset = reset_peak_rss()
+    start_cpu = process_time()
+    start_wall = perf_counter()
+    LogWriter.plugin = plugin.name
+    TimelineWriter.time_zone = time_offset
+    logfunc('{} [{}] artifact started'.format(plugin.name, plugin.module_name))
+    try:
+        plugin.method(files_found, category_folder, seeker, wrap_text, time_offset)
+    except Exception as ex:
+        logfunc('Reading {} artifact had errors!'.format(plugin.name), 'error')
+        logfunc('Error was {}'.format(str(ex)), 'error')
+        logfunc('Exception Traceback: {}'.format(traceback.format_exc()), 'error')
+        metrics['status'] = 'error'
+        metrics['error'] = '{}: {}'.format(type(ex).__name__, str(ex))
+    else:
+        logfunc('{} [{}] artifact completed'.format(plugin.name, plugin.module_name))
+        logfunc('')
+    finally:
+        LogWriter.plugin = None
+        metrics['wall_time'] = perf_counter() - start_wall
+        metrics['cpu_time'] = process_time() - start_cpu
+        rss_after = process_rss(os.getpid())
+        if rss_before is not None and rss_after is not None:
+            metrics['rss_delta'] = rss_after - rss_before
+            peak = peak_rss_since_reset() if peak_reset else None
+            if peak is None:
+                # the peak of the process is the peak of the plugin if it grew, otherwise only the
+                # memory it still holds is known
+                peak = peak_rss() if peak_before is not None and peak_rss() > peak_before else rss_after
+            metrics['peak_rss_delta'] = max(peak, rss_before) - rss_before
+        metrics.update(PluginStats.get())
+    return metrics
+
+
+def order_by_dependencies(plugins, log_missing=True):
+    '''Returns the plugins ordered so that each plugin comes after the plugins that provide
+       the facts it requires. Apart from that, the original order is kept.'''
+    plugins = list(plugins)
+    providers = {}  # fact -> indexes of plugins providing it
+    for index, plugin in enumerate(plugins):
+        for fact in plugin.provides:
+            providers.setdefault(fact, []).append(index)
+
+    waits_for = []
+    for index, plugin in enumerate(plugins):
+        deps = set()
+        for fact in plugin.requires:
+            if fact not in providers and log_missing:
+                logfunc(f'{plugin.name} requires {fact}, but none of the selected plugins provide it')
+            deps.update(i for i in providers.get(fact, []) if i != index)
+        waits_for.append(deps)
+
+    ordered = []
+    done = set()
+    while len(ordered) < len(plugins):
+        ready = [i for i in range(len(plugins)) if i not in done and waits_for[i] <= done]
+        if not ready:  # circular dependency, run the rest in the original order
+            remaining = [i for i in range(len(plugins)) if i not in done]
+            logfunc('Circular plugin dependencies between: ' + ', '.join(plugins[i].name for i in remaining))
+            ready = remaining
+        # take the first ready plugin, so plugins only move when they have to
+        done.add(ready[0])
+        ordered.append(plugins[ready[0]])
+    return ordered
+
+
+def longest_first(plugins, expected_times):
+    '''Returns the plugins ordered longest expected run time first (expected_times: plugin name -> seconds),
+       then by dependencies, so a pool of workers doesn't end up waiting on one long plugin started last'''
+    return order_by_dependencies(sorted(plugins, key=lambda plugin: expected_times[plugin.name], reverse=True),
+                                 log_missing=False)
+
+
+def select_within_budget(plugins, expected_times, values, time_budget, workers=1):
+    '''Picks the plugins with the most value per expected second of run time (expected_times and values:
+       plugin name -> seconds, value) that together fit in time_budget seconds of workers running at once.
+       A plugin is picked along with the plugins providing the facts it requires.
+       Returns (plugins picked, most value per second first then by dependencies, plugins left out).'''
+    plugins = list(plugins)
+    providers = {}  # fact -> plugins providing it
+    for plugin in plugins:
+        for fact in plugin.provides:
+            providers.setdefault(fact, []).append(plugin)
+
+    picked = {}  # name -> plugin, in the order picked
+    capacity = time_budget * workers
+    used = 0.0
+    for plugin in sorted(plugins, key=lambda p: values[p.name] / max(expected_times[p.name], 0.001), reverse=True):
+        if plugin.name in picked:
+            continue
+        needed = {}
+        pending = [plugin]
+        while pending:
+            current = pending.pop()
+            if current.name in picked or current.name in needed:
+                continue
+            needed[current.name] = current
+            pending.extend(provider for fact in current.requires for provider in providers.get(fact, ()))
+        cost = sum(expected_times[name] for name in needed)
+        if used + cost <= capacity:
+            picked.update(needed)
+            used += cost
+    return order_by_dependencies(picked.values(), log_missing=False), [p for p in plugins if p.name not in picked]
+
+
+def get_art_globals():
+    '''Returns the values plugins have stored in artGlobals (iOS version etc), so they can be handed to workers'''
+    return {key: value for key, value in vars(scripts.artifacts.artGlobals).items()
+            if not key.startswith('_') and not isinstance(value, types.ModuleType)}
+
+
+def worker_context():
+    '''Returns the multiprocessing context worker processes are started with: a fork server, or spawned
+       processes, rather than processes forked from this one. A forked worker would share the archive
+       handles of the seeker instead of opening its own, and inherit the locks of this process's other
+       threads (log and timeline writers, extraction threads, the monitor) in whatever state they were.'''
+    return multiprocessing.get_context(
+        'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+
+
+def _init_worker(seeker, screen_output_file_path, screen_output_file_path_devinfo):
+    OutputParameters.screen_output_file_path = screen_output_file_path
+    OutputParameters.screen_output_file_path_devinfo = screen_output_file_path_devinfo
+    _worker_state['loader'] = plugin_loader.PluginLoader()
+    _worker_state['seeker'] = seeker
+
+
+def _run_plugin_in_worker(plugin_name, files_found, category_folder, wrap_text, time_offset, virtual_locations,
+                          art_globals):
+    vars(scripts.artifacts.artGlobals).update(art_globals)
+    _worker_state['seeker'].add_virtual_locations(virtual_locations)
+    LogCapture.start()
+    try:
+        plugin = _worker_state['loader'][plugin_name]
+        metrics = run_plugin(plugin, files_found, category_folder, _worker_state['seeker'], wrap_text, time_offset)
+        TimelineWriter.flush()  # workers may be killed, or end without running atexit
+        extraction_store = getattr(_worker_state['seeker'], 'extraction_store', None)
+        if extraction_store:
+            extraction_store.flush()
+    finally:
+        records = LogCapture.stop()
+    return records, metrics, get_art_globals()
+
+
+class PluginLimitExceeded(Exception):
+    '''A plugin ran longer or used more memory than allowed, and its worker process was killed'''
+
+
+def _isolated_worker(connection, initializer, initargs):
+    initializer(*initargs)
+    while True:
+        task = connection.recv()
+        if task is None:
+            return
+        connection.send(None)  # the call starts now, set up and hand-over are not part of its time
+        fn, args = task
+        try:
+            result = (True, fn(*args))
+        except Exception as ex:
+            result = (False, RuntimeError('{}: {}'.format(type(ex).__name__, str(ex))))
+        connection.send(result)
+
+
+class _IsolatedWorker:
+    def __init__(self, context, initializer, initargs):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=_isolated_worker, args=(child_connection, initializer, initargs),
+                                       daemon=True)
+        self.process.start()
+        child_connection.close()
+        self.future = None  # future of the running task
+        self.started = None  # when the worker acknowledged the task, None until then
+        self.sending = False  # the task is being sent, by _send
+        self.send_error = None
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+
+class IsolatedExecutor:
+    '''Pool of worker processes with the submit() and shutdown() of the concurrent.futures executors,
+       which kills a worker if the call it runs takes longer than timeout seconds or if the worker
+       uses more than memory_limit bytes of memory, failing the call's future with PluginLimitExceeded.
+       A new worker takes the place of a killed one, and of one left holding more than half of
+       memory_limit after a call, so the next call doesn't start out near the limit.
+
+       Limits apply from when the worker takes the call, the setup of a new worker (initializer)
+       and the sending of the call not counting. Workers are started by a fork server, or spawned,
+       rather than forked from this process and its threads.
+    '''
+    POLL_INTERVAL = 0.1  # seconds between two checks of the running calls
+
+    def __init__(self, max_workers, initializer, initargs, timeout=None, memory_limit=None):
+        self._context = worker_context()
+        self._max_workers = max_workers
+        self._initializer = initializer
+        self._initargs = initargs
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        if memory_limit and process_rss(os.getpid()) is None:
+            logfunc('Memory use of plugins can not be checked on this platform without the psutil module, '
+                    'the memory limit is ignored')
+            self.memory_limit = None
+        self._workers = []
+        self._pending = collections.deque()  # (future, fn, args) of calls waiting for a worker
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._shutdown = False
+        self._monitor_thread = threading.Thread(target=self._monitor, daemon=True)
+        self._monitor_thread.start()
+
+    def submit(self, fn, *args):
+        future = concurrent.futures.Future()
+        with self._lock:
+            self._pending.append((future, fn, args))
+        self._wakeup.set()
+        return future
+
+    def shutdown(self):
+        with self._lock:
+            self._shutdown = True
+        self._wakeup.set()
+        self._monitor_thread.join()
+
+    def _finish(self, worker):
+        '''Collects the result of the call worker ran. Returns False if the worker is gone.'''
+        future, worker.future = worker.future, None
+        try:
+            succeeded, value = worker.connection.recv()
+        except (EOFError, OSError):
+            worker.process.join()
+            future.set_exception(RuntimeError(f'Worker process died (exit code {worker.process.exitcode})'))
+            worker.connection.close()
+            return False
+        if succeeded:
+            future.set_result(value)
+        else:
+            future.set_exception(value)
+        if self.memory_limit and (process_rss(worker.process.pid) or 0) > self.memory_limit / 2:
+            worker.connection.send(None)
+            worker.process.join()
+            worker.connection.close()
+            return False
+        return True
+
+    def _send(self, worker, fn, args):
+        '''Sends a call to worker, out of the monitor thread as a large call blocks until the worker,
+           which may still be setting up, reads it'''
+        try:
+            worker.connection.send((fn, args))
+        except Exception as ex:  # arguments that can't be pickled, or worker gone
+            worker.send_error = ex
+        worker.sending = False
+        self._wakeup.set()
+
+    def _poll(self, worker, now):
+        '''Handles the call worker runs. Returns False if the worker is gone.'''
+        if worker.sending:
+            return True
+        if worker.send_error is not None:
+            future, worker.future = worker.future, None
+            worker.kill()
+            future.set_exception(worker.send_error)
+            return False
+        if worker.started is None:
+            if not worker.connection.poll():
+                return True  # still setting up, or reading the call
+            try:
+                worker.connection.recv()
+            except (EOFError, OSError):
+                return self._finish(worker)  # died, the next recv fails the same way
+            worker.started = monotonic()
+        if worker.connection.poll():
+            return self._finish(worker)
+        return self._check(worker, now)
+
+    def _check(self, worker, now):
+        '''Kills worker if its call went over a limit. Returns False if it did.'''
+        error = None
+        if self.timeout and now - worker.started > self.timeout:
+            error = f'Killed after running for more than {self.timeout:g} seconds'
+        elif self.memory_limit:
+            rss = process_rss(worker.process.pid)
+            if rss is not None and rss > self.memory_limit:
+                error = (f'Killed after using {rss / 1048576:.0f} MB of memory, more than the limit of '
+                         f'{self.memory_limit / 1048576:.0f} MB')
+        if error is None:
+            return True
+        worker.kill()
+        worker.future.set_exception(PluginLimitExceeded(error))
+        return False
+
+    def _monitor(self):
+        while True:
+            now = monotonic()
+            workers = []
+            for worker in self._workers:
+                if worker.future is None or self._poll(worker, now):
+                    workers.append(worker)
+            self._workers = workers
+
+            with self._lock:
+                while self._pending:
+                    idle = [worker for worker in self._workers if worker.future is None]
+                    if idle:
+                        worker = idle[0]
+                    elif len(self._workers) < self._max_workers:
+                        worker = _IsolatedWorker(self._context, self._initializer, self._initargs)
+                        self._workers.append(worker)
+                    else:
+                        break
+                    future, fn, args = self._pending.popleft()
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    worker.future, worker.started, worker.sending = future, None, True
+                    threading.Thread(target=self._send, args=(worker, fn, args), daemon=True).start()
+                if self._shutdown and not self._pending and all(w.future is None for w in self._workers):
+                    break
+            self._wakeup.wait(self.POLL_INTERVAL)
+            self._wakeup.clear()
+
+        for worker in self._workers:
+            worker.connection.send(None)
+            worker.process.join()
+            worker.connection.close()
+
+
+class _Task:
+    def __init__(self, plugin, args, waits_for):
+        self.plugin = plugin
+        self.args = args
+        self.waits_for = waits_for  # names of plugins that must finish before this one starts
+        self.future = None
+        self.records = None  # log records, set once finished
+        self.metrics = None  # see run_plugin, set once finished
+
+
+class PluginPool:
+    '''Runs plugins in a pool of worker processes.
+
+       Plugins must be submitted in dependency order (see order_by_dependencies). A plugin is
+       only handed to a worker once the plugins providing the facts it requires have finished,
+       and the artGlobals values those plugins computed are passed on to it. Independent
+       plugins run concurrently.
+
+       Log output of each plugin is captured in the worker and handed back, so that
+       results() can replay it in the order the plugins were submitted, or in the order of a serial
+       run when they were submitted longest first, whatever order they finish in.
+
+       With a timeout (seconds) or a memory_limit (bytes), the workers are those of an
+       IsolatedExecutor: a plugin going over a limit has its worker killed and is recorded as
+       failed, and the other plugins go on.
+    '''
+    def __init__(self, workers, seeker, timeout=None, memory_limit=None):
+        initargs = (seeker, OutputParameters.screen_output_file_path,
+                    OutputParameters.screen_output_file_path_devinfo)
+        if timeout or memory_limit:
+            self._executor = IsolatedExecutor(workers, _init_worker, initargs, timeout, memory_limit)
+        else:
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers, mp_context=worker_context(), initializer=_init_worker, initargs=initargs)
+        self._seeker = seeker
+        self._tasks = []
+        self._providers = {}  # fact -> names of submitted plugins providing it
+        self._finished = set()  # names of finished plugins
+
+    def submit(self, plugin, files_found, category_folder, wrap_text, time_offset):
+        waits_for = set()
+        for fact in plugin.requires:
+            waits_for.update(self._providers.get(fact, ()))
+        for fact in plugin.provides:
+            self._providers.setdefault(fact, set()).add(plugin.name)
+        # files found by virtual searches are only known to the seeker of this process
+        virtual_locations = self._seeker.virtual_locations(files_found)
+        self._tasks.append(
+            _Task(plugin, (files_found, category_folder, wrap_text, time_offset, virtual_locations), waits_for))
+        self._collect_finished()
+        self._start_ready()
+
+    def _start_ready(self):
+        for task in self._tasks:
+            if task.future is None and task.waits_for <= self._finished:
+                task.future = self._executor.submit(
+                    _run_plugin_in_worker, task.plugin.name, *task.args, get_art_globals())
+
+    def _collect_finished(self):
+        for task in self._tasks:
+            if task.records is None and task.future is not None and task.future.done():
+                try:
+                    task.records, task.metrics, art_globals = task.future.result()
+                    if task.plugin.provides:
+                        vars(scripts.artifacts.artGlobals).update(art_globals)
+                except Exception as ex:  # worker died, result could not be pickled, etc.
+                    task.records = [
+                        LogRecord('log', 'error', task.plugin.name, time(), message) for message in (
+                            'Reading {} artifact had errors!'.format(task.plugin.name), 'Error was {}'.format(str(ex)))]
+                    task.metrics = plugin_metrics(
+                        task.plugin, task.args[0], 'killed' if isinstance(ex, PluginLimitExceeded) else 'error')
+                    task.metrics['error'] = '{}: {}'.format(type(ex).__name__, str(ex))
+                self._finished.add(task.plugin.name)
+
+    def results(self, order=None):
+        '''Yields (plugin, log records, metrics) as the plugins finish, in the order of the plugins
+           of order, submission order by default'''
+        tasks = self._tasks
+        if order is not None:
+            tasks_by_name = {task.plugin.name: task for task in self._tasks}
+            tasks = [tasks_by_name[plugin.name] for plugin in order]
+        for task in tasks:
+            while task.records is None:
+                self._start_ready()
+                running = [t.future for t in self._tasks if t.future is not None and t.records is None]
+                concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                self._collect_finished()
+            yield task.plugin, task.records, task.metrics
+        self._tasks = []
+
+    def shutdown(self):
+        self._executor.shutdown()
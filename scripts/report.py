@@ -1,4 +1,5 @@
 import html
+import json
 import os
 import pathlib
 import shutil
@@ -7,9 +8,12 @@ import sys
 
 from collections import OrderedDict
 from scripts.html_parts import *
-from scripts.ilapfuncs import logfunc
+from scripts.ilapfuncs import logfunc, LogWriter
 from scripts.version_info import aleapp_version, aleapp_contributors
 
+PROCESSED_FILES_NAME = 'ProcessedFiles.jsonl'  # in Script Logs, written by crunch_artifacts
+PROCESSED_FILES_SCRIPT_NAME = 'ProcessedFiles.js'  # the same as data for the index page
+
 # Icon Mappings Dictionary
 # The icon_mappings dictionary is organized by category and is used to map categories and artifacts to icons.
 # Please maintain the list in alphabetical order by category for ease of navigation and updating.
@@ -1045,6 +1049,7 @@ def create_index_html(reportfolderbase, time_in_secs, time_HMS, extraction_type,
             </p>
         """
 
+    LogWriter.flush()  # the logs are read below
     # Get script run log (this will be tab2)
     devinfo_files_path = os.path.join(reportfolderbase, 'Script Logs', 'DeviceInfo.html')
     tab2_content = get_file_content(devinfo_files_path)
@@ -1053,11 +1058,15 @@ def create_index_html(reportfolderbase, time_in_secs, time_HMS, extraction_type,
     script_log_path = os.path.join(reportfolderbase, 'Script Logs', 'Screen Output.html')
     tab3_content = get_file_content(script_log_path)
 
-    # Get processed files list (this will be tab3)
+    # Get processed files list (this will be tab4)
     processed_files_path = os.path.join(reportfolderbase, 'Script Logs', 'ProcessedFilesLog.html')
-    tab4_content = get_file_content(processed_files_path)
+    tab4_content = generate_processed_files_table_code(reportfolderbase) + get_file_content(processed_files_path)
+
+    # Get plugin performance metrics (this will be tab5)
+    run_metrics_path = os.path.join(reportfolderbase, 'Script Logs', 'run_metrics.json')
+    tab5_content = generate_performance_table_code(run_metrics_path)
 
-    content += tabs_code.format(tab1_content, tab2_content, tab3_content, tab4_content)
+    content += tabs_code.format(tab1_content, tab2_content, tab3_content, tab4_content, tab5_content)
 
     content += '</div>'  # CARD end
 
@@ -1079,9 +1088,70 @@ def create_index_html(reportfolderbase, time_in_secs, time_HMS, extraction_type,
     f.write(content)
     f.write(thank_you_note)
     f.write(credits_code)
-    f.write(body_main_trailer + body_end + nav_bar_script_footer + page_footer)
+    f.write(body_main_trailer + body_end + nav_bar_script_footer + performance_table_script +
+            processed_files_table_script.format(PROCESSED_FILES_SCRIPT_NAME) + page_footer)
     f.close()
 
+def generate_processed_files_table_code(reportfolderbase):
+    '''Returns the table of the files found for the plugins, which is filled in by the browser a page at a
+       time from Script Logs/ProcessedFiles.js, written here from the lines of ProcessedFiles.jsonl.
+       Even with many thousand files found, index.html stays small.'''
+    processed_files_path = os.path.join(reportfolderbase, 'Script Logs', PROCESSED_FILES_NAME)
+    count = 0
+    try:
+        with open(processed_files_path, 'r', encoding='utf8') as processed_files, \
+                open(os.path.join(reportfolderbase, 'Script Logs', PROCESSED_FILES_SCRIPT_NAME), 'w',
+                     encoding='utf8') as script:
+            script.write('var processedFiles = [\n')
+            for line in processed_files:
+                record = json.loads(line)
+                script.write(json.dumps([record['plugin'], record['pattern'], record['path'], record['size']]) + ',\n')
+                count += 1
+            script.write('];\n')
+    except (OSError, ValueError, KeyError) as ex:
+        logfunc(f'Could not read {processed_files_path} ' + str(ex))
+        return ''
+
+    headers = ['Plugin', 'Pattern', 'Path', 'Size (bytes)']
+    return f'<p>{count} files found, all of them are in Script Logs/{PROCESSED_FILES_NAME}</p>' \
+        '<div class="table-responsive"><table id="processedFilesTable" class="table table-striped table-bordered ' \
+        'table-xsm" cellspacing="0" width="100%"><thead><tr>' + \
+        ''.join(f'<th class="th-sm">{header}</th>' for header in headers) + '</tr></thead></table></div><br />'
+
+def generate_performance_table_code(run_metrics_path):
+    '''Returns the table of the plugins that ran, from the run metrics written by crunch_artifacts'''
+    try:
+        with open(run_metrics_path, 'r', encoding='utf8') as f:
+            run_metrics = json.load(f)
+    except (OSError, ValueError) as ex:
+        return f'<p>No performance metrics available ({html.escape(str(ex))})</p>'
+
+    headers = ['Plugin', 'Category', 'Status', 'Wall time (s)', 'Expected time (s)', 'CPU time (s)',
+               'Search time (s)', 'Peak RSS increase (MB)', 'RSS kept (MB)', 'Files', 'Size of files (MB)', 'HTML rows', 'TSV rows', 'Timeline rows']
+    rows = ''
+    for metrics in run_metrics.get('plugins', []):
+        if metrics['status'] == 'no files':
+            continue
+        peak_rss_delta = metrics['peak_rss_delta']
+        rss_delta = metrics.get('rss_delta')
+        status = metrics['status'] if not metrics['error'] else f"{metrics['status']}: {metrics['error']}"
+        expected_time = metrics.get('expected_time')
+        values = [metrics['name'], metrics['category'], status, f"{metrics['wall_time']:.3f}",
+                  '' if expected_time is None else f'{expected_time:.3f}', f"{metrics['cpu_time']:.3f}",
+                  f"{metrics['search_time']:.3f}",
+                  '' if peak_rss_delta is None else f'{peak_rss_delta / 1048576:.1f}',
+                  '' if rss_delta is None else f'{rss_delta / 1048576:.1f}', metrics['files_matched'],
+                  f"{metrics['bytes_matched'] / 1048576:.1f}", metrics['html_rows'], metrics['tsv_rows'],
+                  metrics['timeline_rows']]
+        rows += '<tr>' + ''.join(f'<td>{html.escape(str(value))}</td>' for value in values) + '</tr>'
+
+    summary = f"Total wall time {run_metrics['wall_time']:.1f} seconds with {run_metrics['workers']} worker(s). " \
+              "All the plugins, with the ones that found no files, are in Script Logs/run_metrics.json"
+    return f'<p>{html.escape(summary)}</p>' \
+        '<div class="table-responsive"><table id="performanceTable" class="table table-striped table-bordered table-xsm" ' \
+        'cellspacing="0"><thead><tr>' + ''.join(f'<th class="th-sm">{header}</th>' for header in headers) + \
+        '</tr></thead><tbody>' + rows + '</tbody></table></div>'
+
 def generate_authors_table_code(aleapp_contributors):
     authors_data = ''
     for author_name, blog, tweet_handle, git in aleapp_contributors:
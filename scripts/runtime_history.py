@@ -0,0 +1,95 @@
+import os
+import sqlite3
+import statistics
+import time
+
+from scripts.ilapfuncs import logfunc
+
+HISTORY_RUNS = 20  # most recent runs of each plugin kept
+SIZE_SMOOTHING = 1024 * 1024  # bytes added to sizes when scaling, so small inputs don't scale to nothing
+# expected time of plugins that never ran before
+DEFAULT_OVERHEAD = 0.5  # seconds
+DEFAULT_RATE = 20 * 1024 * 1024  # bytes per second
+
+
+def default_history_path():
+    '''Returns where the runtime history is kept unless told otherwise'''
+    return os.path.join(os.path.expanduser('~'), '.ileapp', 'runtime_history.db')
+
+
+class RuntimeHistory:
+    '''Run time, size of matched files and rows written of the last runs of each plugin, kept in an
+       SQLite db across runs and extractions, to estimate how long a plugin will take and how much
+       it will report.
+
+       The estimate for a plugin is the median of the times of its past runs, each scaled by the
+       size of the files matched now compared to the size matched then.
+
+       Without a db_path nothing is read or saved, and estimates come from sizes only.
+    '''
+    def __init__(self, db_path=None):
+        self.db_path = db_path
+        self._runs = {}  # plugin name -> [(wall time, bytes matched, rows), ...]
+        if not db_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+            db = sqlite3.connect(db_path)
+            with db:
+                db.execute("CREATE TABLE IF NOT EXISTS runs(plugin TEXT, finished REAL, wall_time REAL, "
+                           "bytes_matched INTEGER, files_matched INTEGER, rows INTEGER)")
+                db.execute("CREATE INDEX IF NOT EXISTS runs_plugin ON runs(plugin, finished)")
+            for plugin, wall_time, bytes_matched, rows in db.execute(
+                    "SELECT plugin, wall_time, bytes_matched, rows FROM runs ORDER BY finished"):
+                self._runs.setdefault(plugin, []).append((wall_time, bytes_matched, rows))
+            db.close()
+        except (OSError, sqlite3.Error) as ex:
+            logfunc(f'Could not read runtime history {db_path} ' + str(ex))
+
+    def __contains__(self, plugin_name):
+        return plugin_name in self._runs
+
+    def estimate(self, plugin_name, bytes_matched):
+        '''Returns the expected run time in seconds of a plugin given files totalling bytes_matched'''
+        runs = self._runs.get(plugin_name)
+        if not runs:
+            return DEFAULT_OVERHEAD + bytes_matched / DEFAULT_RATE
+        return statistics.median(
+            wall_time * (bytes_matched + SIZE_SMOOTHING) / (past_bytes + SIZE_SMOOTHING)
+            for wall_time, past_bytes, _ in runs)
+
+    def median_time(self, plugin_name):
+        '''Returns the median run time in seconds of a plugin, or None if it never ran'''
+        runs = self._runs.get(plugin_name)
+        return statistics.median(wall_time for wall_time, _, _ in runs) if runs else None
+
+    def value(self, plugin_name):
+        '''Returns how much a plugin usually reports: the median number of rows it wrote, plus one so
+           that plugins that never ran, or reported nothing, still count for something'''
+        runs = self._runs.get(plugin_name)
+        return 1 + (statistics.median(rows for _, _, rows in runs) if runs else 0)
+
+    def record(self, plugin_metrics_list):
+        '''Adds the runs of the plugins that completed, from the metrics of run_plugin'''
+        finished = time.time()
+        completed = [metrics for metrics in plugin_metrics_list if metrics['status'] == 'ok']
+        if self.db_path:
+            try:
+                db = sqlite3.connect(self.db_path, timeout=60)
+                with db:
+                    db.executemany("INSERT INTO runs VALUES(?,?,?,?,?,?)", (
+                        (metrics['name'], finished, metrics['wall_time'], metrics['bytes_matched'],
+                         metrics['files_matched'], max(metrics['html_rows'], metrics['tsv_rows']))
+                        for metrics in completed))
+                    db.executemany(
+                        "DELETE FROM runs WHERE plugin=? AND rowid NOT IN "
+                        "(SELECT rowid FROM runs WHERE plugin=? ORDER BY finished DESC LIMIT ?)",
+                        ((metrics['name'], metrics['name'], HISTORY_RUNS) for metrics in completed))
+                db.close()
+            except sqlite3.Error as ex:
+                logfunc(f'Could not save runtime history {self.db_path} ' + str(ex))
+        for metrics in completed:
+            runs = self._runs.setdefault(metrics['name'], [])
+            runs.append((metrics['wall_time'], metrics['bytes_matched'],
+                         max(metrics['html_rows'], metrics['tsv_rows'])))
+            del runs[:-HISTORY_RUNS]
@@ -1,182 +1,862 @@
 import time as timex
-import fnmatch
+import concurrent.futures
+import ctypes
+import errno
+import io
 import os
+import sys
 import tarfile
+import threading
 
+from array import array
 from pathlib import Path
 from scripts.ilapfuncs import *
-from shutil import copyfile
+from shutil import copyfile, copyfileobj
 from zipfile import ZipFile
 
 from fnmatch import _compile_pattern
-from functools import lru_cache
 
 from scripts.builds_ids import get_root_path_from_domain
-normcase = lru_cache(maxsize=None)(os.path.normcase)
+from scripts.extraction_store import ExtractionStore
+from scripts.gzip_index import export_index, open_indexed_gzip
+from scripts.pattern_matcher import PatternMatcher, fnmatch_to_glob, normcase, split_pattern
+
+FICLONE = 0x40049409  # ioctl from linux/fs.h
+
+def reflink(source, destination):
+    '''Makes destination a copy-on-write clone of source, on file systems that support it
+       (btrfs, xfs, APFS...). Raises OSError where they don't.'''
+    if sys.platform == 'darwin':
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.clonefile(os.fsencode(source), os.fsencode(destination), 0) != 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), destination)
+    elif sys.platform.startswith('linux'):
+        import fcntl
+        with open(source, 'rb') as src, open(destination, 'xb') as dst:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            except OSError:
+                os.remove(destination)  # the empty file this call created
+                raise
+    else:
+        raise OSError(errno.EOPNOTSUPP, 'Reflinks are not supported on this platform', destination)
+
+SMALL_FILE_SIZE = 1024 * 1024  # files read with open() up to this size are read into memory at once
 
 class FileSeekerBase:
     # This is an abstract base class
-    def search(self, filepattern_to_search, return_on_first_hit=False):
-        '''Returns a list of paths for files/folders that matched'''
+    def __init__(self):
+        self._virtual = {}  # path returned by a virtual search -> where to read it from
+
+    def search(self, filepattern_to_search, return_on_first_hit=False, writable=False, virtual=False):
+        '''Returns a list of paths for files/folders that matched.
+           writable is set when the caller will write to the files, so they must be copies.
+           virtual is set when the caller reads the files with open(), so seekers of archives and
+           backups don't need to put them on disk.'''
+        pass
+
+    def build_search_cache(self, filepatterns, extra_patterns=(), virtual_patterns=()):
+        '''Matches all the patterns against the files listing in a single pass, so that
+           later searches for any of them are just lookups.
+           extra_patterns cover the files plugins look up themselves, see FileSeekerTar.
+           virtual_patterns are the ones only searched with virtual set.'''
         pass
 
+    def open(self, path):
+        '''Returns a binary file object to read a file found by search'''
+        return open(path, 'rb')
+
+    def materialize(self, path):
+        '''Returns path once the file found by a virtual search is on disk, for readers that need
+           a real file (SQLite, libmagic...)'''
+        return path
+
+    def virtual_locations(self, paths):
+        '''Returns where to read those of paths that came from virtual searches, to hand them
+           to a copy of this seeker in a worker process with add_virtual_locations'''
+        return {path: self._virtual[path] for path in paths if path in self._virtual}
+
+    def add_virtual_locations(self, locations):
+        self._virtual.update(locations)
+
     def cleanup(self):
         '''close any open handles'''
         pass
 
+class PathList:
+    '''Sequence of paths, kept as (folder, name) pairs with each folder string stored once and
+       names interned, instead of one full path string per entry'''
+    def __init__(self):
+        self._folders = []  # folder paths as given
+        self._prefixes = []  # folder paths with a trailing separator
+        self._folder_ids = {}
+        self._parents = array('L')  # folder id of each entry
+        self._names = []
+
+    def append(self, folder, name):
+        folder_id = self._folder_ids.get(folder)
+        if folder_id is None:
+            folder_id = self._folder_ids[folder] = len(self._folders)
+            self._folders.append(folder)
+            self._prefixes.append(os.path.join(folder, ''))
+        self._parents.append(folder_id)
+        self._names.append(sys.intern(name))
+
+    def __getstate__(self):
+        # the rest is derived from the folders, no need to send it to worker processes
+        return self._folders, self._parents, self._names
+
+    def __setstate__(self, state):
+        self._folders, self._parents, self._names = state
+        self._prefixes = [os.path.join(folder, '') for folder in self._folders]
+        self._folder_ids = {folder: folder_id for folder_id, folder in enumerate(self._folders)}
+
+    def entries(self):
+        '''Yields (folder, name) of each path'''
+        folders = self._folders
+        for folder_id, name in zip(self._parents, self._names):
+            yield folders[folder_id], name
+
+    def __len__(self):
+        return len(self._names)
+
+    def __getitem__(self, index):
+        return self._prefixes[self._parents[index]] + self._names[index]
+
+    def __iter__(self):
+        prefixes = self._prefixes
+        for folder_id, name in zip(self._parents, self._names):
+            yield prefixes[folder_id] + name
+
 class FileSeekerDir(FileSeekerBase):
-    def __init__(self, directory):
+    def __init__(self, directory, listing_cache=None, rebuild_listing=False, walk_threads=1, only_patterns=()):
+        '''listing_cache is an optional ListingCache to load the files listing from (unless
+           rebuild_listing is set) and save it to after walking the directory.
+           walk_threads is the number of folders read at the same time while walking.
+           With only_patterns, only the files and folders matching one of them are kept in the
+           listing (targeted triage), which is then not saved to listing_cache.'''
         FileSeekerBase.__init__(self)
         self.directory = directory
-        self._all_files = []
-        logfunc('Building files listing...')
-        self.build_files_list(directory)
+        self._only = PatternMatcher(only_patterns) if only_patterns else None
+        self._all_files = PathList()
+        # indexes of _all_files entries, keyed by normcase'd basename, extension and parent folder name
+        self._by_basename = {}
+        self._by_extension = {}
+        self._by_parent = {}
+        self._search_cache = {}
+        cached_listing = None
+        if listing_cache and not rebuild_listing:
+            cached_listing = listing_cache.load(directory)
+        if cached_listing is not None:
+            logfunc(f'Loading files listing from {listing_cache.db_path}...')
+            for folder, name in cached_listing:
+                self._add_file(folder, name)
+        else:
+            logfunc('Building files listing...')
+            self.build_files_list(directory, walk_threads)
+            if listing_cache and not self._only:
+                listing_cache.save(directory, self._all_files.entries())
         logfunc(f'File listing complete - {len(self._all_files)} files')
 
-    def build_files_list(self, directory):
-        '''Populates all paths in directory into _all_files'''
+    @staticmethod
+    def _scan_dir(directory):
+        '''Returns the sorted (name, is_dir) tuples of the entries of a folder'''
         try:
-            files_list = os.scandir(directory)
-            for item in files_list:
-                self._all_files.append(item.path)
-                if item.is_dir(follow_symlinks=False):
-                    self.build_files_list(item.path)
+            with os.scandir(directory) as files_list:
+                entries = [(item.name, item.is_dir(follow_symlinks=False)) for item in files_list]
         except Exception as ex:
             logfunc(f'Error reading {directory} ' + str(ex))
+            return []
+        entries.sort()
+        return entries
 
-    def search(self, filepattern, return_on_first_hit=False):
+    def build_files_list(self, directory, walk_threads=1):
+        '''Populates all paths in directory into _all_files.
+           Each folder's entries are sorted by name and followed by the contents of its subfolders,
+           so the listing is the same however many threads read the folders.'''
+        listings = {}  # folder -> entries read ahead by the threads
+        if walk_threads > 1:
+            # network file systems are slow to answer for each folder, so read many at once
+            with concurrent.futures.ThreadPoolExecutor(max_workers=walk_threads) as executor:
+                pending = {executor.submit(FileSeekerDir._scan_dir, directory): directory}
+                while pending:
+                    done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        folder = pending.pop(future)
+                        listings[folder] = future.result()
+                        for name, is_dir in listings[folder]:
+                            if is_dir:
+                                subfolder = os.path.join(folder, name)
+                                pending[executor.submit(FileSeekerDir._scan_dir, subfolder)] = subfolder
+
+        stack = [(directory, iter(listings.pop(directory, None) or FileSeekerDir._scan_dir(directory)))]
+        while stack:
+            folder, entries = stack[-1]
+            for name, is_dir in entries:
+                self._add_file(folder, name)
+                if is_dir:
+                    subfolder = os.path.join(folder, name)
+                    subfolder_entries = listings.pop(subfolder, None)
+                    if subfolder_entries is None:
+                        subfolder_entries = FileSeekerDir._scan_dir(subfolder)
+                    stack.append((subfolder, iter(subfolder_entries)))
+                    break
+            else:
+                stack.pop()
+
+    def _add_file(self, folder, name):
+        if self._only and not self._only.match(normcase('root/') + os.path.normcase(os.path.join(folder, name))):
+            return
+        index = len(self._all_files)
+        self._all_files.append(folder, name)
+        name = os.path.normcase(name)
+        self._by_basename.setdefault(name, array('L')).append(index)
+        if '.' in name:
+            self._by_extension.setdefault(name.rsplit('.', 1)[1], array('L')).append(index)
+        parent_name = os.path.normcase(os.path.basename(folder.rstrip('/\\')))
+        self._by_parent.setdefault(parent_name, array('L')).append(index)
+
+    def _candidates(self, filepattern):
+        '''Returns the indexes of the entries that can match filepattern, taken from the most
+           selective index that applies to it, or None if the whole listing has to be scanned'''
+        sep = normcase('/')
+        runs, tail = split_pattern(normcase(filepattern))
+        if not runs:  # no wildcards
+            tail = sep + tail
+        candidates = []
+        segments = tail.split(sep)
+        if len(segments) > 1 and segments[-1]:  # pattern ends in a literal basename
+            candidates.append(self._by_basename.get(segments[-1], ()))
+            if len(segments) > 2:  # .. and the name of its folder is literal too
+                candidates.append(self._by_parent.get(segments[-2], ()))
+        if '.' in segments[-1]:
+            # tail is the end of the basename, so its extension is the extension of the basename
+            candidates.append(self._by_extension.get(segments[-1].rsplit('.', 1)[1], ()))
+        if not candidates:
+            return None
+        return min(candidates, key=len)
+
+    def build_search_cache(self, filepatterns, extra_patterns=(), virtual_patterns=()):
+        self._search_cache = PatternMatcher(filepatterns).match_all(self._all_files, "root/")
+
+    def search(self, filepattern, return_on_first_hit=False, writable=False, virtual=False):
+        if filepattern in self._search_cache:
+            found = self._search_cache[filepattern]
+            return found[:1] if return_on_first_hit else list(found)
         pat = _compile_pattern( normcase(filepattern) )
         root = normcase("root/")
+        candidates = self._candidates(filepattern)
+        if candidates is None:
+            items = self._all_files
+        else:
+            items = (self._all_files[index] for index in candidates)
+        # listing paths go through os.path.normcase directly, caching them would keep every full path in memory
         if return_on_first_hit:
-            for item in self._all_files:
-                if pat( root + normcase(item) ) is not None:
+            for item in items:
+                if pat( root + os.path.normcase(item) ) is not None:
                     return [item]
             return []
         pathlist = []
-        for item in self._all_files:
-            if pat( root + normcase(item) ) is not None:
+        for item in items:
+            if pat( root + os.path.normcase(item) ) is not None:
                 pathlist.append(item)
         return pathlist
 
 class FileSeekerItunes(FileSeekerBase):
-    def __init__(self, directory, temp_folder):
+    LINK_MODES = ('copy', 'auto', 'reflink', 'hardlink', 'symlink')
+
+    def __init__(self, directory, temp_folder, link_mode='copy', extraction_store=None):
+        '''link_mode is how matched backup files are put in the temp folder under their iOS path:
+           'copy', a 'reflink' (copy-on-write clone), a 'hardlink', a 'symlink', or 'auto' for the
+           first of these links the file system allows. A file is copied if it can't be linked,
+           and whenever the search is for writable files, so the backup itself is never written to.
+           extraction_store is an optional ExtractionStore to take copies from, for backups on
+           slow storage.'''
         FileSeekerBase.__init__(self)
         self.directory = directory
-        self._all_files = {}
+        self.extraction_store = extraction_store
+        if extraction_store:
+            self._archive_identity = ExtractionStore.archive_identity(os.path.join(directory, "Manifest.db"))
         self.temp_folder = temp_folder
+        self.link_mode = link_mode
+        self._placed = {}  # temp location -> 'copy', 'link' or 'writable' (a copy handed out for writing)
+        self._link_failed = False
+        self._db = None
         logfunc('Building files listing...')
         self.build_files_list(directory)
-        logfunc(f'File listing complete - {len(self._all_files)} files')
-    
+        logfunc(f'File listing complete - {self._file_count} files')
+
+    def __getstate__(self):
+        # the paths table lives in the connection, worker processes build their own
+        state = self.__dict__.copy()
+        del state['_db']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.build_files_list(self.directory)
+
+    # what paths are matched on, as os.path.normcase would make them
+    if os.path.normcase('A/') == 'A/':
+        _MATCH_PATH = "path"
+    else:
+        _MATCH_PATH = "lower(replace(path, '/', '\\'))"
+
     def build_files_list(self, directory):
-        '''Populates paths from Manifest.db files into _all_files'''
+        '''Populates paths from Manifest.db files into the paths table, a temporary table of the
+           Manifest.db connection with the path (as os.path.join(root path of the domain,
+           relativePath) would make it) and hashed name of each file, indexed on the path and the
+           basename. Domains are resolved once each rather than once per file.'''
         try: 
             db = open_sqlite_db_readonly(os.path.join(directory, "Manifest.db"))
-            cursor = db.cursor()
-            cursor.execute(
+            db.execute("PRAGMA temp_store = MEMORY")
+            db.execute("CREATE TEMP TABLE domains(domain TEXT PRIMARY KEY, root TEXT)")
+            domains = [row[0] for row in db.execute("SELECT DISTINCT domain FROM Files WHERE flags=1")]
+            db.executemany("INSERT INTO temp.domains VALUES(?,?)",
+                           ((domain, os.path.join(get_root_path_from_domain(domain), '')) for domain in domains))
+
+            match_path = FileSeekerItunes._MATCH_PATH
+            db.execute("CREATE TEMP TABLE paths(path TEXT UNIQUE, file_id TEXT, name TEXT)")
+            # same as the dict this used to be, a path listed twice keeps its first place and last file
+            db.execute(
                 """
+                INSERT INTO temp.paths(path, file_id)
                 SELECT
-                fileID,
-                domain,
-                relativePath
+                domains.root || Files.relativePath,
+                Files.fileID
                 FROM
-                Files
+                main.Files JOIN temp.domains ON Files.domain = domains.domain
                 WHERE
-                flags=1
+                Files.flags=1
+                ORDER BY Files.rowid
+                ON CONFLICT(path) DO UPDATE SET file_id=excluded.file_id
                 """
             )
-            all_rows = cursor.fetchall()
-            for row in all_rows:
-                hash_filename = row[0]
-                domain = row[1]
-                root_path = get_root_path_from_domain(domain)
-                relative_path = row[2]
-                full_path = os.path.join(root_path, relative_path)
-                self._all_files[full_path] = hash_filename
-            db.close()
+            # basename: rtrim strips everything after the last separator, leaving the folder part
+            sep = normcase('/')
+            db.execute(f"UPDATE temp.paths SET name = substr({match_path}, "
+                       f"length(rtrim({match_path}, replace({match_path}, ?, ''))) + 1)", (sep,))
+            db.execute("CREATE INDEX temp.paths_name ON paths(name)")
+            if match_path != "path":
+                db.execute(f"CREATE INDEX temp.paths_match ON paths({match_path})")
+            self._file_count = db.execute("SELECT count(*) FROM temp.paths").fetchone()[0]
+            self._db = db
         except Exception as ex:
             logfunc(f'Error opening Manifest.db from {directory}, ' + str(ex))
             raise ex
 
-    def search(self, filepattern, return_on_first_hit=False):
+    def _find(self, filepattern, return_on_first_hit=False):
+        '''Returns (path, hashed name) of the files matching filepattern, in Manifest.db order'''
+        pattern = normcase(filepattern)
+        match_path = FileSeekerItunes._MATCH_PATH
+        conditions = [f"{match_path} GLOB ?"]
+        params = [fnmatch_to_glob(pattern)]
+        runs, tail = split_pattern(pattern)
+        if not runs:  # no wildcards
+            conditions, params = [f"{match_path} = ?"], [pattern]
+        elif runs[0]:  # literal prefix, a range scan of the path index
+            conditions.append(f"{match_path} >= ? AND {match_path} < ?")
+            params += [runs[0], runs[0] + chr(0x10FFFF)]
+        sep = normcase('/')
+        if runs and sep in tail and tail.rsplit(sep, 1)[1]:  # literal basename
+            conditions.append("name = ?")
+            params.append(tail.rsplit(sep, 1)[1])
+        sql = "SELECT path, file_id FROM temp.paths WHERE " + " AND ".join(conditions) + " ORDER BY rowid"
+        if return_on_first_hit:
+            sql += " LIMIT 1"
+        return self._db.execute(sql, params).fetchall()
+
+    def _link(self, original_location, temp_location):
+        '''Links temp_location to original_location as per link_mode, returns False if it could not.
+           A file already at temp_location was placed by another process and is left as it is.'''
+        modes = ('reflink', 'hardlink', 'symlink') if self.link_mode == 'auto' else (self.link_mode,)
+        for mode in modes:
+            try:
+                if mode == 'reflink':
+                    reflink(original_location, temp_location)
+                elif mode == 'hardlink':
+                    os.link(original_location, temp_location)
+                else:
+                    os.symlink(original_location, temp_location)
+                return True
+            except FileExistsError:
+                return True
+            except OSError as ex:
+                error = ex
+        if not self._link_failed:
+            logfunc(f'Could not link backup files ({self.link_mode}), copying them instead. ' + str(error))
+            self._link_failed = True
+        return False
+
+    @staticmethod
+    def _copy_in_place(original_location, temp_location):
+        # copied under a temporary name then moved in place, so that a link to the backup file is
+        # replaced rather than written through, and a file another process is reading isn't written over
+        copy_location = f'{temp_location}.{os.getpid()}.{threading.get_ident()}.tmp'
+        copyfile(original_location, copy_location)
+        os.replace(copy_location, temp_location)
+
+    def _copy(self, hash_filename, original_location, temp_location):
+        if not self.extraction_store:
+            FileSeekerItunes._copy_in_place(original_location, temp_location)
+            return
+        stat = os.stat(original_location)
+        key = ExtractionStore.make_key(self._archive_identity, hash_filename, stat.st_size, stat.st_mtime_ns)
+        if not self.extraction_store.fetch(key, temp_location):
+            FileSeekerItunes._copy_in_place(original_location, temp_location)
+            self.extraction_store.put(key, temp_location)
+
+    def _place(self, hash_filename, original_location, temp_location, writable=False):
+        '''Puts the backup file at temp_location, returns False if it could not'''
+        placed = self._placed.get(temp_location)
+        if not placed and not writable and os.path.lexists(temp_location):
+            placed = self._placed[temp_location] = 'link'  # by the main process, before this worker process started
+        if placed in ('copy', 'link') and not writable:
+            return True  # already there, untouched
+        try:
+            if placed and not writable:  # a copy a plugin may have changed
+                os.remove(temp_location)
+            os.makedirs(os.path.dirname(temp_location), exist_ok=True)
+            if writable:
+                FileSeekerItunes._copy_in_place(original_location, temp_location)
+                self._placed[temp_location] = 'writable'
+            elif self.link_mode != 'copy' and self._link(original_location, temp_location):
+                self._placed[temp_location] = 'link'
+            else:
+                self._copy(hash_filename, original_location, temp_location)
+                self._placed[temp_location] = 'copy'
+            return True
+        except Exception as ex:
+            logfunc(f'Could not copy {original_location} to {temp_location} ' + str(ex))
+            return False
+
+    def search(self, filepattern, return_on_first_hit=False, writable=False, virtual=False):
         pathlist = []
-        matching_keys = fnmatch.filter(self._all_files, filepattern)
-        for relative_path in matching_keys:
-            hash_filename = self._all_files[relative_path]
+        for relative_path, hash_filename in self._find(filepattern, return_on_first_hit):
             original_location = os.path.join(self.directory, hash_filename[:2], hash_filename)
             temp_location = os.path.join(self.temp_folder, sanitize_file_path(relative_path))
             if is_platform_windows():
                 temp_location = temp_location.replace('/', '\\')
-            try:
-                os.makedirs(os.path.dirname(temp_location), exist_ok=True)
-                copyfile(original_location, temp_location)
+            if virtual and not writable and temp_location not in self._placed:
+                self._virtual[temp_location] = (hash_filename, original_location)
+                pathlist.append(temp_location)
+            elif self._place(hash_filename, original_location, temp_location, writable):
                 pathlist.append(temp_location)
-            except Exception as ex:
-                logfunc(f'Could not copy {original_location} to {temp_location} ' + str(ex))
         return pathlist
 
+    def open(self, path):
+        if path in self._virtual:
+            return open(self._virtual[path][1], 'rb')  # the backup file itself, no copy needed
+        return open(path, 'rb')
+
+    def materialize(self, path):
+        if path in self._virtual:
+            hash_filename, original_location = self._virtual.pop(path)
+            self._place(hash_filename, original_location, path)
+        return path
+
+    def cleanup(self):
+        self._db.close()
+
 class FileSeekerTar(FileSeekerBase):
-    def __init__(self, tar_file_path, temp_folder):
+    def __init__(self, tar_file_path, temp_folder, single_pass=False, listing_cache=None, rebuild_listing=False,
+                 extraction_store=None, only_patterns=()):
+        '''With single_pass, build_search_cache reads through the archive once and extracts every
+           member matching the patterns it is given, and searches are then served from those
+           extracted files. Nothing seeks back in the archive, so a tar.gz is decompressed only once.
+           Otherwise a tar.gz is read through a checkpoint index of the gzip stream (see gzip_index).
+           listing_cache is an optional ListingCache to load the archive members and gzip index
+           from (unless rebuild_listing is set) and save them to after reading the archive.
+           extraction_store is an optional ExtractionStore to take members from instead of
+           extracting them again.
+           With only_patterns, only the members matching one of them are kept as the archive is
+           read (targeted triage), and they are not saved to listing_cache.'''
         FileSeekerBase.__init__(self)
+        self.only_patterns = list(only_patterns)
         self.is_gzip = tar_file_path.lower().endswith('gz')
-        mode ='r:gz' if self.is_gzip else 'r'
-        self.tar_file = tarfile.open(tar_file_path, mode)
+        self.tar_file_path = tar_file_path
+        self.extraction_store = extraction_store
+        if extraction_store:
+            self._archive_identity = ExtractionStore.archive_identity(tar_file_path)
+        self.single_pass = single_pass
+        self.listing_cache = listing_cache
+        self._listing_loaded = False
+        self.tar_file = None if single_pass else self._open_tar(load_saved=not rebuild_listing)
         self.temp_folder = temp_folder
         self.directory = temp_folder
+        self._search_cache = {}
+        self._extracted = []  # (member name, extracted path) of the single pass, in archive order
 
-    def search(self, filepattern, return_on_first_hit=False):
-        pathlist = []
+    def _open_tar(self, load_saved=True):
+        saved = None
+        if self.listing_cache and load_saved:
+            saved = self.listing_cache.load_archive(self.tar_file_path)
+        tar_file = self._open_archive(saved[1] if saved else None)
+        if saved:
+            logfunc(f'Loading archive members from {self.listing_cache.db_path}...')
+            tar_file.members = [FileSeekerTar._member_from_row(row) for row in saved[0]]
+            tar_file._loaded = True  # no need to read all the headers again
+            self._listing_loaded = True
+        return tar_file
+
+    def _open_archive(self, gzip_index=None):
+        if self.is_gzip:
+            # so that reaching a member doesn't mean decompressing again from the start of the file
+            fileobj = open_indexed_gzip(self.tar_file_path, gzip_index)
+            return tarfile.open(fileobj=fileobj, mode='r:')
+        return tarfile.open(self.tar_file_path, 'r')
+
+    @staticmethod
+    def _member_from_row(row):
+        member = tarfile.TarInfo(row[0])
+        member.type, member.offset, member.offset_data, member.size, member.mtime, member.mode, member.linkname = row[1:]
+        return member
+
+    def _save_listing(self, members):
+        if any(member.sparse is not None for member in members):
+            return  # sparse members can't be rebuilt from the saved fields
+        rows = ((member.name, member.type, member.offset, member.offset_data, member.size, int(member.mtime),
+                 member.mode, member.linkname) for member in members)
+        gzip_index = export_index(self.tar_file.fileobj) if self.is_gzip else None
+        self.listing_cache.save_archive(self.tar_file_path, rows, gzip_index)
+
+    def __getstate__(self):
+        # open archive handles can't be pickled, so worker processes reopen the archive, each with its
+        # own handle. The members read so far go along, so that workers don't read the headers again
+        state = self.__dict__.copy()
+        del state['tar_file']
+        if self.tar_file is not None and self.tar_file._loaded:
+            state['_members'] = self.tar_file.members
+            state['_gzip_index'] = export_index(self.tar_file.fileobj) if self.is_gzip else None
+        return state
+
+    def __setstate__(self, state):
+        members = state.pop('_members', None)
+        gzip_index = state.pop('_gzip_index', None)
+        self.__dict__.update(state)
+        if self.single_pass:
+            self.tar_file = None
+        elif members is not None:
+            self.tar_file = self._open_archive(gzip_index)
+            self.tar_file.members = members
+            self.tar_file._loaded = True
+        else:
+            self.tar_file = self._open_tar()  # saved by now if there's a listing cache
+
+    def build_search_cache(self, filepatterns, extra_patterns=(), virtual_patterns=()):
+        if self.single_pass:
+            self._extract_single_pass(list(filepatterns) + list(extra_patterns))
+            return
+        if self.only_patterns and not self._listing_loaded:
+            members = self._read_matching_members()
+        else:
+            members = self.tar_file.getmembers()
+            if self.listing_cache and not self._listing_loaded:
+                self._save_listing(members)
+        self._search_cache = PatternMatcher(filepatterns).match_all(members, "root/", key=lambda member: member.name)
+
+    def _read_matching_members(self):
+        '''Reads all the member headers, keeping only the members matching only_patterns'''
+        matcher = PatternMatcher(self.only_patterns)
+        root = normcase("root/")
+        members = []
+        for member in self.tar_file:
+            if matcher.match(root + os.path.normcase(member.name)):
+                members.append(member)
+            self.tar_file.members = []  # don't keep every member in memory
+        self.tar_file.members = members
+        self.tar_file._loaded = True
+        logfunc(f'Kept {len(members)} archive members matching the selected plugins')
+        return members
+
+    def _extract_single_pass(self, filepatterns):
+        matcher = PatternMatcher(filepatterns)
+        self._search_cache = {pattern: [] for pattern in matcher.patterns}
+        root = normcase("root/")
+        logfunc('Extracting matching files in a single pass over the archive...')
+        mode = 'r|gz' if self.is_gzip else 'r|'
+        with tarfile.open(self.tar_file_path, mode) as tar:
+            for member in tar:
+                matching_patterns = matcher.match(root + os.path.normcase(member.name))
+                if matching_patterns:
+                    full_path = self._extract_member(tar, member)
+                    if full_path is not None:
+                        self._extracted.append((member.name, full_path))
+                        for pattern in matching_patterns:
+                            self._search_cache[pattern].append(full_path)
+                tar.members = []  # the stream can't be rewound anyway, don't keep every member in memory
+        logfunc(f'Single pass extraction complete - {len(self._extracted)} files')
+
+    def _extract_member(self, tar, member, writable=False):
+        '''Writes member to the temp folder, returns its path or None if it could not be written'''
+        try:
+            full_path = self._member_path(member)
+            if member.isdir():
+                os.makedirs(full_path, exist_ok=True)
+            else:
+                key = None
+                if self.extraction_store:
+                    key = ExtractionStore.make_key(self._archive_identity, member.name, member.offset, member.size)
+                    if self.extraction_store.fetch(key, full_path, copy=writable):
+                        return full_path
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)  # workers may be making it too
+                # written under a temporary name then moved in place, so that a file another worker is
+                # reading, or a link to a stored file, is replaced rather than written over
+                temp_path = f'{full_path}.{os.getpid()}.tmp'
+                with open(temp_path, "wb") as fout:
+                    fout.write(tarfile.ExFileObject(tar, member).read())
+                os.utime(temp_path, (member.mtime, member.mtime))
+                os.replace(temp_path, full_path)
+                if key:
+                    self.extraction_store.put(key, full_path)
+                    if writable:  # the stored file must not change
+                        self.extraction_store.fetch(key, full_path, copy=True)
+            return full_path
+        except Exception as ex:
+            logfunc(f'Could not write file to filesystem, path was {member.name} ' + str(ex))
+            return None
+
+    def _member_path(self, member):
+        clean_name = sanitize_file_path(member.name)
+        return os.path.join(self.temp_folder, Path(clean_name))
+
+    def _matching_members(self, filepattern):
+        if filepattern in self._search_cache:
+            return self._search_cache[filepattern]
         pat = _compile_pattern( normcase(filepattern) )
         root = normcase("root/")
-        for member in self.tar_file.getmembers():
-            if pat( root + normcase(member.name) ) is not None:
-                try:
-                    clean_name = sanitize_file_path(member.name)
-                    full_path = os.path.join(self.temp_folder, Path(clean_name))
-                    if member.isdir():
-                        os.makedirs(full_path, exist_ok=True)
-                    else:
-                        parent_dir = os.path.dirname(full_path)
-                        if not os.path.exists(parent_dir):
-                            os.makedirs(parent_dir)
-                        with open(full_path, "wb") as fout:
-                            fout.write(tarfile.ExFileObject(self.tar_file, member).read())
-                            fout.close()
-                        os.utime(full_path, (member.mtime, member.mtime))
-                    pathlist.append(full_path)
-                except Exception as ex:
-                    logfunc(f'Could not write file to filesystem, path was {member.name} ' + str(ex))
+        return [member for member in self.tar_file.getmembers() if pat( root + normcase(member.name) ) is not None]
+
+    def search(self, filepattern, return_on_first_hit=False, writable=False, virtual=False):
+        if self.single_pass:
+            if filepattern in self._search_cache:
+                return list(self._search_cache[filepattern])
+            # not one of the patterns given to the single pass, only the files it extracted can be found
+            pat = _compile_pattern( normcase(filepattern) )
+            root = normcase("root/")
+            return [full_path for name, full_path in self._extracted if pat( root + os.path.normcase(name) ) is not None]
+        pathlist = []
+        for member in self._matching_members(filepattern):
+            if virtual and not writable and member.isfile():
+                full_path = self._member_path(member)
+                self._virtual[full_path] = member
+            else:
+                full_path = self._extract_member(self.tar_file, member, writable)
+            if full_path is not None:
+                pathlist.append(full_path)
         return pathlist
 
+    def open(self, path):
+        member = self._virtual.get(path)
+        if member is None:
+            return open(path, 'rb')
+        if member.size <= SMALL_FILE_SIZE:
+            return io.BytesIO(self.tar_file.extractfile(member).read())
+        return self.tar_file.extractfile(member)
+
+    def materialize(self, path):
+        member = self._virtual.pop(path, None)
+        if member is not None:
+            self._extract_member(self.tar_file, member)
+        return path
+
     def cleanup(self):
-        self.tar_file.close()
+        if self.tar_file:
+            self.tar_file.close()
+            if self.is_gzip:
+                self.tar_file.fileobj.close()  # tarfile leaves file objects it was given open
 
 class FileSeekerZip(FileSeekerBase):
-    def __init__(self, zip_file_path, temp_folder):
+    EXTRACT_THREADS = min(8, os.cpu_count() or 1)
+
+    def __init__(self, zip_file_path, temp_folder, extraction_store=None):
+        '''Members are extracted by a pool of threads, each reading through its own ZipFile handle,
+           and each member is extracted only once however many patterns it matches.
+           extraction_store is an optional ExtractionStore to take members from instead of
+           extracting them again.'''
         FileSeekerBase.__init__(self)
+        self.zip_file_path = zip_file_path
+        self.extraction_store = extraction_store
+        if extraction_store:
+            self._archive_identity = ExtractionStore.archive_identity(zip_file_path)
         self.zip_file = ZipFile(zip_file_path)
         self.name_list = self.zip_file.namelist()
         self.temp_folder = temp_folder
         self.directory = temp_folder
+        self._search_cache = {}
+        self._start_extraction_pool()
 
-    def search(self, filepattern, return_on_first_hit=False):
-        pathlist = []
+    def _start_extraction_pool(self):
+        self._pid = os.getpid()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=FileSeekerZip.EXTRACT_THREADS)
+        self._thread_handles = threading.local()
+        self._handles = []  # ZipFile handles of all the threads, to close them in cleanup
+        self._extractions = {}  # member -> future of (extracted path or None, error message or None)
+
+    def __getstate__(self):
+        # open archive handles and threads can't be pickled, so worker processes start their own
+        state = self.__dict__.copy()
+        for name in ('zip_file', '_executor', '_thread_handles', '_handles', '_extractions'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.zip_file = ZipFile(self.zip_file_path)
+        self._start_extraction_pool()
+
+    def _check_process(self):
+        '''Starts handles and threads of this process if it was forked from the one that made them. A
+           forked process has none of the extraction threads, and would share the archive handles'''
+        if self._pid == os.getpid():
+            return
+        for zip_file in self._handles + [self.zip_file]:
+            zip_file.close()  # only this process's copy of the handle
+        extractions = {member: future for member, future in self._extractions.items() if future.done()}
+        self.zip_file = ZipFile(self.zip_file_path)
+        self._start_extraction_pool()
+        self._extractions = extractions  # the others would never finish
+
+    def build_search_cache(self, filepatterns, extra_patterns=(), virtual_patterns=()):
+        self._search_cache = PatternMatcher(filepatterns).match_all(self.name_list, "root/")
+        # start extracting everything the plugins will ask for, so that large members
+        # (Photos.sqlite, healthdb_secure.sqlite...) are inflated at the same time
+        for pattern, members in self._search_cache.items():
+            if pattern not in virtual_patterns:
+                for member in members:
+                    self._start_extraction(member)
+
+    def _matching_members(self, filepattern):
+        if filepattern in self._search_cache:
+            return self._search_cache[filepattern]
         pat = _compile_pattern( normcase(filepattern) )
         root = normcase("root/")
-        for member in self.name_list:
-            if pat( root + normcase(member) ) is not None:
-                try:
-                    extracted_path = self.zip_file.extract(member, path=self.temp_folder) # already replaces illegal chars with _ when exporting
-                    f = self.zip_file.getinfo(member)
-                    date_time = f.date_time
-                    date_time = timex.mktime(date_time + (0, 0, -1))
-                    os.utime(extracted_path, (date_time, date_time))
-                    pathlist.append(extracted_path)
-                except Exception as ex:
-                    member = member.lstrip("/")
-                    logfunc(f'Could not write file to filesystem, path was {member} ' + str(ex))
+        return [member for member in self.name_list if pat( root + normcase(member) ) is not None]
+
+    def _start_extraction(self, member, writable=False):
+        '''Returns the future of the extraction of member, started if needed. A writable extraction is
+           always a new one, of a file the plugin can change without changing the stored file, and
+           is the one later searches get.'''
+        self._check_process()
+        if writable:
+            if member in self._extractions:
+                self._extractions[member].result()  # so that it doesn't link over the writable file
+            self._extractions[member] = self._executor.submit(self._extract, member, True)
+        elif member not in self._extractions:
+            self._extractions[member] = self._executor.submit(self._extract, member)
+        return self._extractions[member]
+
+    def _zip_handle(self):
+        '''ZipFile handle of the current thread, a ZipFile can't be read by several threads at once'''
+        zip_file = getattr(self._thread_handles, 'zip_file', None)
+        if zip_file is None:
+            zip_file = self._thread_handles.zip_file = ZipFile(self.zip_file_path)
+            self._handles.append(zip_file)
+        return zip_file
+
+    def _extract(self, member, writable=False):
+        '''Runs in the extraction threads. Errors are returned rather than logged, so that they
+           are logged by the search asking for the member, in the order of the searches'''
+        zip_file = self._zip_handle()
+        try:
+            f = zip_file.getinfo(member)
+            extracted_path = self._target_path(member)
+            date_time = timex.mktime(f.date_time + (0, 0, -1))
+            if f.is_dir():
+                os.makedirs(extracted_path, exist_ok=True)
+                os.utime(extracted_path, (date_time, date_time))
+                return extracted_path, None
+            if not writable and FileSeekerZip._is_extracted(extracted_path, f.file_size, date_time):
+                return extracted_path, None  # by the main process, before this worker process started
+            key = None
+            if self.extraction_store:
+                key = ExtractionStore.make_key(self._archive_identity, member, f.CRC, f.file_size, f.header_offset)
+                if self.extraction_store.fetch(key, extracted_path, copy=writable):
+                    return extracted_path, None
+            os.makedirs(os.path.dirname(extracted_path), exist_ok=True)
+            # written under a temporary name then moved in place, so that a file another process is
+            # reading, or a link to a stored file, is replaced rather than written over
+            temp_path = f'{extracted_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with zip_file.open(f) as source, open(temp_path, 'wb') as destination:
+                copyfileobj(source, destination, 1024 * 1024)
+            os.utime(temp_path, (date_time, date_time))
+            os.replace(temp_path, extracted_path)
+            if key:
+                self.extraction_store.put(key, extracted_path)
+                if writable:  # the stored file must not change
+                    self.extraction_store.fetch(key, extracted_path, copy=True)
+            return extracted_path, None
+        except Exception as ex:
+            member = member.lstrip("/")
+            return None, f'Could not write file to filesystem, path was {member} ' + str(ex)
+
+    @staticmethod
+    def _is_extracted(path, size, date_time):
+        '''Returns True if path is a complete extraction of a member of size and date_time, its date
+           being set once it is written'''
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        return stat.st_size == size and int(stat.st_mtime) == int(date_time)
+
+    def _target_path(self, member):
+        '''Returns where ZipFile.extract puts member, following ZipFile._extract_member'''
+        arcname = member.replace('/', os.path.sep)
+        if os.path.altsep:
+            arcname = arcname.replace(os.path.altsep, os.path.sep)
+        arcname = os.path.splitdrive(arcname)[1]
+        invalid_path_parts = ('', os.path.curdir, os.path.pardir)
+        arcname = os.path.sep.join(x for x in arcname.split(os.path.sep) if x not in invalid_path_parts)
+        if os.path.sep == '\\':
+            arcname = ZipFile._sanitize_windows_name(arcname, os.path.sep)
+        return os.path.join(self.temp_folder, arcname)
+
+    def search(self, filepattern, return_on_first_hit=False, writable=False, virtual=False):
+        members = self._matching_members(filepattern)
+        if virtual and not writable:
+            pathlist = []
+            for member in members:
+                if member in self._extractions or member.endswith('/'):
+                    pathlist.extend(self._extracted_paths([member]))
+                else:
+                    path = self._target_path(member)
+                    self._virtual[path] = member
+                    pathlist.append(path)
+            return pathlist
+        for member in members:
+            self._start_extraction(member, writable)
+        return self._extracted_paths(members)
+
+    def _extracted_paths(self, members):
+        pathlist = []
+        for member in members:
+            extracted_path, error = self._start_extraction(member).result()
+            if error:
+                logfunc(error)
+            else:
+                pathlist.append(extracted_path)
         return pathlist
 
+    def open(self, path):
+        member = self._virtual.get(path)
+        if member is None:
+            return open(path, 'rb')
+        self._check_process()
+        if self.zip_file.getinfo(member).file_size <= SMALL_FILE_SIZE:
+            return io.BytesIO(self.zip_file.read(member))
+        return self.zip_file.open(member)
+
+    def materialize(self, path):
+        member = self._virtual.pop(path, None)
+        if member is not None:
+            self._extracted_paths([member])
+        return path
+
     def cleanup(self):
+        self._executor.shutdown(cancel_futures=True)
+        for zip_file in self._handles:
+            zip_file.close()
         self.zip_file.close()
         
\ No newline at end of file
@@ -0,0 +1,49 @@
+import itertools
+import os
+
+from scripts import extraction_store
+from scripts.extraction_store import ExtractionStore
+
+
+def _file(tmp_path, name, size=100):
+    path = tmp_path / 'extracted' / name
+    path.parent.mkdir(exist_ok=True)
+    path.write_bytes(name.encode() * (size // len(name)))
+    return str(path)
+
+
+def test_fetch_hit_and_miss(tmp_path):
+    store = ExtractionStore(str(tmp_path / 'store'), 10 ** 6)
+    key = ExtractionStore.make_key('archive\0100\01', 'private/var/a.db', 3)
+    assert key != ExtractionStore.make_key('archive\0100\02', 'private/var/a.db', 3)
+    destination = str(tmp_path / 'temp' / 'private' / 'var' / 'a.db')
+    assert not store.fetch(key, destination)
+    assert not os.path.exists(destination)
+
+    source = _file(tmp_path, 'a.db')
+    store.put(key, source)
+    assert store.fetch(key, destination)
+    assert open(destination, 'rb').read() == open(source, 'rb').read()
+    copy_destination = destination + '.copy'
+    assert store.fetch(key, copy_destination, copy=True)
+    assert not os.path.samefile(copy_destination, store._object_path(key))  # written to by the caller
+    store.close()
+    assert ExtractionStore(store.root, 10 ** 6).fetch(key, destination)  # kept for the next runs
+
+
+def test_least_recently_used_files_are_evicted(tmp_path, monkeypatch):
+    clock = itertools.count(1000)
+    monkeypatch.setattr(extraction_store.time, 'time', lambda: next(clock))
+    monkeypatch.setattr(extraction_store, 'FLUSH_EVERY', 2)
+    store = ExtractionStore(str(tmp_path / 'store'), 250)
+    for name in 'abc':
+        store.put(name * 40, _file(tmp_path, name))
+    assert os.path.exists(store._object_path('a' * 40))  # over max_size, but not flushed yet
+    assert store.fetch('b' * 40, str(tmp_path / 'temp' / 'b'))  # b now used after c, flushed evicting a
+    assert not os.path.exists(store._object_path('a' * 40))
+    store.put('d' * 40, _file(tmp_path, 'd'))
+    store.close()  # evicting c
+
+    assert [name for name in 'abcd' if store.fetch(name * 40, str(tmp_path / 'temp' / name))] == ['b', 'd']
+    assert not os.path.exists(store._object_path('c' * 40))
+    assert ExtractionStore(store.root, 250)._total == 200
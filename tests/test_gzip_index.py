@@ -0,0 +1,50 @@
+import gzip
+import io
+import os
+import random
+
+import pytest
+
+from scripts import gzip_index
+from scripts.gzip_index import GzipCheckpointReader
+
+SPACING = 64 * 1024
+
+
+@pytest.fixture
+def content():
+    rng = random.Random(1)
+    # compressible and incompressible stretches, so that checkpoints fall at varied compressed offsets
+    return b''.join(os.urandom(rng.randrange(1, 50000)) if index % 2 else bytes(rng.randrange(1, 20000))
+                    for index in range(100))
+
+
+@pytest.mark.parametrize('members', [1, 3])
+def test_seek_and_read_return_the_uncompressed_content(tmp_path, monkeypatch, content, members):
+    monkeypatch.setattr(gzip_index, 'READ_SIZE', 4096)  # checkpoints close to every SPACING bytes
+    path = str(tmp_path / 'extraction.tar.gz')
+    with open(path, 'wb') as f:
+        # pigz, bgzip etc write several gzip members one after the other
+        step = len(content) // members + 1
+        for start in range(0, len(content), step):
+            f.write(gzip.compress(content[start:start + step]))
+
+    rng = random.Random(2)
+    with GzipCheckpointReader(path, spacing=SPACING) as reader:
+        assert reader.read(1000) == content[:1000]
+        assert reader.seek(0, io.SEEK_END) == len(content)
+        assert reader.read(10) == b''
+        assert len(reader._offsets) > len(content) // SPACING // 2  # checkpoints were kept
+        for _ in range(200):
+            offset = rng.randrange(len(content) + 10)
+            size = rng.choice((1, 512, 100000))
+            if rng.random() < 0.3:
+                assert reader.seek(offset - reader.tell(), io.SEEK_CUR) == offset
+            else:
+                assert reader.seek(offset) == min(offset, len(content))
+            assert reader.read(size) == content[offset:offset + size]
+            assert reader.tell() == min(offset + size, len(content))
+        reader.seek(-100, io.SEEK_END)
+        assert reader.read() == content[-100:]
+        reader.seek(5)
+        assert reader.read() == content[5:]
@@ -0,0 +1,17 @@
+from datetime import datetime, timezone
+
+import pytz
+
+from scripts.ilapfuncs import timeline_time_us
+
+
+def test_timeline_time_us_takes_naive_times_in_the_run_time_zone():
+    utc_us = timeline_time_us('2022-11-13 08:01:18+00:00')
+    assert utc_us == datetime(2022, 11, 13, 8, 1, 18, tzinfo=timezone.utc).timestamp() * 10 ** 6
+    assert timeline_time_us('2022-11-13 08:01:18') == utc_us
+    assert timeline_time_us('2022-11-13 08:01:18 UTC', pytz.timezone('America/New_York')) == utc_us
+    assert timeline_time_us('2022-11-13 03:01:18', pytz.timezone('America/New_York')) == utc_us
+    # daylight saving time of the day itself
+    assert timeline_time_us('2022-07-13 04:01:18', pytz.timezone('America/New_York')) == \
+        timeline_time_us('2022-07-13T08:01:18Z')
+    assert timeline_time_us('not a time', pytz.timezone('America/New_York')) is None
@@ -0,0 +1,71 @@
+import collections
+import csv
+import io
+import json
+import random
+import sys
+
+import ileapp_timeline
+
+from scripts.ilapfuncs import LogWriter, TimelineWriter, timeline
+
+
+def _write_timeline(tmp_path, monkeypatch):
+    '''Writes two runs of events, of two plugins with times that interleave, and returns the report folder
+       and the (time_us, plugin, first column) of the events'''
+    monkeypatch.setattr(TimelineWriter, 'time_zone', 'UTC')
+    rng = random.Random(1)
+    events = []
+    for plugin in ('plugin1', 'plugin2'):
+        rows = [(f'2022-11-{rng.randrange(1, 29):02} {rng.randrange(24):02}:{rng.randrange(60):02}:00', index)
+                for index in range(300)] + [('not a time', 300), ('', 301)]
+        rng.shuffle(rows)
+        monkeypatch.setattr(LogWriter, 'plugin', plugin)
+        timeline(str(tmp_path / 'Category'), f'{plugin} activity', rows, ('Timestamp', 'Index'))
+        TimelineWriter.flush()  # each plugin's rows in a run of their own
+        events += [(ileapp_timeline.timeline_time_us(row[0]), plugin, row[0]) for row in rows]
+    TimelineWriter.finish(str(tmp_path))
+    return str(tmp_path), events
+
+
+def test_runs_are_merged_in_time_order(tmp_path, monkeypatch):
+    report_folder, events = _write_timeline(tmp_path, monkeypatch)
+    db = ileapp_timeline.open_timeline(report_folder)
+    assert db.execute("SELECT count(*) FROM runs").fetchone()[0] == 2
+
+    merged = list(ileapp_timeline.query_events(db))
+    assert collections.Counter((time_us, plugin, key) for time_us, plugin, _, key, _ in merged) == \
+        collections.Counter(events)
+    assert [event[0] for event in merged] == sorted((event[0] for event in merged), key=lambda time_us: (
+        TimelineWriter.NO_TIME if time_us is None else time_us))  # events without a time first
+
+    # the same order as the time index, which leaves out events without a time
+    timed = [event for event in merged if event[0] is not None]
+    indexed = list(ileapp_timeline.query_events(db, start=0))
+    assert [event[0] for event in indexed] == [event[0] for event in timed]
+    assert sorted(indexed) == sorted(timed)
+    assert list(ileapp_timeline.query_events(db, plugins=['plugin2'])) == \
+        [event for event in merged if event[1] == 'plugin2']
+    db.close()
+
+
+def test_export_keeps_the_merged_order(tmp_path, monkeypatch, capsys):
+    report_folder, events = _write_timeline(tmp_path, monkeypatch)
+    db = ileapp_timeline.open_timeline(report_folder)
+    merged = list(ileapp_timeline.query_events(db))
+    db.close()
+
+    output_path = str(tmp_path / 'timeline.jsonl')
+    monkeypatch.setattr(sys, 'argv', ['ileapp_timeline.py', report_folder, '--format', 'jsonl', '-o', output_path])
+    assert ileapp_timeline.main() == 0
+    with open(output_path, encoding='utf8') as f:
+        exported = [json.loads(line) for line in f]
+    assert [(event['time_us'], event['plugin'], event['key']) for event in exported] == \
+        [(time_us, plugin, key) for time_us, plugin, _, key, _ in merged]
+    assert exported[-1]['data'] == json.loads(merged[-1][4])
+
+    monkeypatch.setattr(sys, 'argv', ['ileapp_timeline.py', report_folder, '--limit', '10'])
+    assert ileapp_timeline.main() == 0
+    rows = list(csv.reader(io.StringIO(capsys.readouterr().out), delimiter='\t'))
+    assert rows[0] == list(ileapp_timeline.COLUMNS)
+    assert [row[3] for row in rows[1:]] == [key for _, _, _, key, _ in merged[:10]]
@@ -0,0 +1,54 @@
+import os
+
+from scripts.listing_cache import ListingCache
+
+ENTRIES = [('root', 'a.txt'), ('root/sub', 'b.db'), ('root/sub', 'c.db-wal')]
+MEMBERS = [('private/var/a.db', b'0', 0, 512, 3, 1668326478, 0o644, ''),
+           ('private/var/b', b'2', 1024, 1536, 5, 1668326479, 0o755, 'a.db')]
+
+
+def _listed_folder(tmp_path):
+    root = tmp_path / 'extraction'
+    (root / 'sub').mkdir(parents=True)
+    (root / 'a.txt').write_text('a')
+    return str(root)
+
+
+def test_listing_is_loaded_until_the_root_folder_changes(tmp_path):
+    root = _listed_folder(tmp_path)
+    cache = ListingCache(str(tmp_path / 'cache.db'))
+    assert cache.load(root) is None
+    cache.save(root, ENTRIES)
+    assert cache.load(root) == ENTRIES
+    assert ListingCache(cache.db_path).load(root) == ENTRIES  # kept in the db
+
+    stat = os.stat(root)
+    os.utime(root, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert cache.load(root) is None
+
+    cache.save(root, ENTRIES)
+    stat = os.stat(root)
+    (tmp_path / 'extraction' / 'new.txt').write_text('new')
+    os.utime(root, ns=(stat.st_atime_ns, stat.st_mtime_ns))  # same time, another top level entry
+    assert cache.load(root) is None
+
+
+def test_archive_members_are_loaded_until_the_archive_changes(tmp_path):
+    archive = tmp_path / 'extraction.tar'
+    archive.write_bytes(b'x' * 2048)
+    path = str(archive)
+    cache = ListingCache(str(tmp_path / 'cache.db'))
+    assert cache.load_archive(path) is None
+    cache.save_archive(path, MEMBERS, b'index')
+    assert cache.load_archive(path) == (MEMBERS, b'index')
+
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))  # same size, modified
+    assert cache.load_archive(path) is None
+
+    cache.save_archive(path, MEMBERS)
+    assert cache.load_archive(path) == (MEMBERS, None)
+    stat = os.stat(path)
+    archive.write_bytes(b'x' * 4096)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))  # same time, another size
+    assert cache.load_archive(path) is None
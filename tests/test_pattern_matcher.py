@@ -0,0 +1,43 @@
+import fnmatch
+import random
+import re
+
+import plugin_loader
+
+from scripts.pattern_matcher import PatternMatcher
+
+EXTRA_PATTERNS = ['*', '*/sms.db', '*/a?c', '*[ab]/x.db', '*[!a]/x.db', '*.db-wal', '*/Library/*/x', '*[/x',
+                  'root/private/var/*', '**/mobile/**/Cache.db*', '*x', '*/x*/', '*?']
+FILLS = ('', 'a', 'b', 'x', 'mobile/Library', 'private/var/root/x')
+
+
+def _paths_for(pattern, rng):
+    '''Paths built from the pattern, most of them matching it, and variations of them that may not'''
+    paths = []
+    for fill in FILLS:
+        path = re.sub(r'\[!?\]?[^\]]*\]', lambda m: rng.choice('abx/'), pattern)
+        path = ''.join(fill if c == '*' else rng.choice('ax/') if c == '?' else c for c in path)
+        path = path.replace('//', '/')
+        paths += [path, path + 'x', path[:-1], path.upper(), 'private/var/' + path]
+    return paths
+
+
+def test_match_all_is_fnmatch_filter():
+    rng = random.Random(1)
+    patterns = [pattern for plugin in plugin_loader.PluginLoader().plugins for pattern in plugin.search_patterns]
+    patterns += EXTRA_PATTERNS
+    paths = list(dict.fromkeys(path for pattern in patterns for path in _paths_for(pattern, rng)))
+    rng.shuffle(paths)
+
+    found = PatternMatcher(patterns).match_all(paths, 'root/')
+
+    for pattern in found:
+        assert found[pattern] == [path for path in paths if fnmatch.fnmatch('root/' + path, pattern)], pattern
+    assert found.keys() == set(filter(None, patterns))
+    assert sum(map(len, found.values())) > len(patterns)  # the paths do match
+
+
+def test_match_all_key_and_empty_patterns():
+    items = [('a', 'private/var/mobile/Library/SMS/sms.db'), ('b', 'private/var/mobile/Library/SMS/sms.db-wal')]
+    found = PatternMatcher(['*/sms.db*', '', '*/sms.db', '*/sms.db']).match_all(items, 'root/', key=lambda item: item[1])
+    assert found == {'*/sms.db*': items, '*/sms.db': items[:1]}
@@ -0,0 +1,67 @@
+import hashlib
+import os
+import tarfile
+import zipfile
+
+import pytest
+
+from scripts import plugin_runner
+from scripts.ilapfuncs import OutputParameters
+from scripts.search_files import FileSeekerTar, FileSeekerZip
+
+MEMBERS = 64
+
+
+def _read_members(pattern):
+    seeker = plugin_runner._worker_state['seeker']
+    found = {}
+    for path in seeker.search(pattern):
+        with open(path, 'rb') as f:
+            found[path.replace(os.sep, '/').rsplit('/', 1)[-1]] = hashlib.sha256(f.read()).hexdigest()
+    return found
+
+
+@pytest.fixture
+def contents():
+    return {f'file{i:03}.bin': os.urandom(1000 + 997 * i) for i in range(MEMBERS)}
+
+
+def _write_tar(path, contents):
+    with tarfile.open(path, 'w:gz' if path.endswith('gz') else 'w') as tar:
+        for name, data in contents.items():
+            source = path + '.' + name
+            with open(source, 'wb') as f:
+                f.write(data)
+            tar.add(source, f'private/var/mobile/{name}')
+
+
+def _write_zip(path, contents):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in contents.items():
+            archive.writestr(f'private/var/mobile/{name}', data)
+
+
+@pytest.mark.parametrize('archive', ['extraction.tar', 'extraction.tar.gz', 'extraction.zip'])
+def test_workers_extract_members_intact(tmp_path, contents, archive):
+    path = str(tmp_path / archive)
+    temp_folder = OutputParameters(str(tmp_path)).temp_folder
+    if archive.endswith('zip'):
+        _write_zip(path, contents)
+        seeker = FileSeekerZip(path, temp_folder)
+    else:
+        _write_tar(path, contents)
+        seeker = FileSeekerTar(path, temp_folder)
+        seeker.build_search_cache(['*/mobile/*'])
+
+    pool = plugin_runner.PluginPool(4, seeker)
+    try:
+        # each worker extracts members of its own, concurrently with the others
+        futures = [pool._executor.submit(_read_members, f'*/mobile/file{i:02}?.bin') for i in range(MEMBERS // 10 + 1)]
+        found = {}
+        for future in futures:
+            found.update(future.result(timeout=60))
+    finally:
+        pool._executor.shutdown()
+        seeker.cleanup()
+
+    assert found == {name: hashlib.sha256(data).hexdigest() for name, data in contents.items()}
@@ -0,0 +1,41 @@
+import multiprocessing
+import os
+import zipfile
+
+import pytest
+
+from scripts.ilapfuncs import OutputParameters
+from scripts.search_files import FileSeekerZip
+
+
+def _read_members(seeker, names, results):
+    found = {}
+    for name in names:
+        with open(seeker.search('*/' + name)[0], 'rb') as f:
+            found[name] = f.read()
+    results.put(found)
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='fork is not available')
+def test_zip_search_in_forked_process(tmp_path):
+    contents = {f'private/var/mobile/file{i}.bin': os.urandom(200000) for i in range(32)}
+    path = str(tmp_path / 'extraction.zip')
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in contents.items():
+            archive.writestr(name, data)
+    seeker = FileSeekerZip(path, OutputParameters(str(tmp_path)).temp_folder)
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    try:
+        # extractions are still running in this process's threads when the worker is forked
+        seeker.build_search_cache(['*/mobile/file1*'])
+        process = context.Process(target=_read_members, args=(seeker, list(contents), results))
+        process.start()
+        try:
+            assert results.get(timeout=60) == contents
+        finally:
+            process.kill()
+            process.join()
+        assert seeker.search('*/mobile/file10.bin')  # and this process's threads still extract
+    finally:
+        seeker.cleanup()